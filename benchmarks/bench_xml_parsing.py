@@ -0,0 +1,90 @@
+"""
+Compare parsing a large GetArrivalAndDepartureTimes response with xmltodict against the
+streaming record parser in bt4u_records.
+
+Usage: python bench_xml_parsing.py [rows]
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import xmltodict
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from bt4u_interface import as_list  # noqa: E402
+from bt4u_records import Departure, iter_records  # noqa: E402
+
+
+def make_departures_xml(rows: int) -> bytes:
+    """
+    Build a synthetic GetArrivalAndDepartureTimes response with the given number of rows.
+
+    :param rows: The number of stop times.
+    :type rows: int
+    :return: The response body.
+    :rtype: bytes
+    """
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<DocumentElement>']
+    for i in range(rows):
+        minute = i % 60
+        hour = 7 + (i // 60) % 12
+        parts.append(
+            "<ArrivalAndDepartureTimes>"
+            "<RouteShortName>HWD</RouteShortName>"
+            f"<TripID>{i // 20}</TripID>"
+            f"<StopCode>{1100 + i % 20}</StopCode>"
+            f"<ArrivalTime>8/26/2024 {hour % 12 or 12}:{minute:02d}:00 "
+            f"{'AM' if hour < 12 else 'PM'}</ArrivalTime>"
+            f"<DepartureTime>8/26/2024 {hour % 12 or 12}:{minute:02d}:30 "
+            f"{'AM' if hour < 12 else 'PM'}</DepartureTime>"
+            "</ArrivalAndDepartureTimes>"
+        )
+    parts.append("</DocumentElement>")
+    return "".join(parts).encode("utf-8")
+
+
+def xmltodict_path(content: bytes) -> list[Departure]:
+    rows = as_list(
+        xmltodict.parse(content)["DocumentElement"].get("ArrivalAndDepartureTimes")
+    )
+    return [Departure.from_fields(row) for row in rows]
+
+
+def streaming_path(content: bytes) -> list[Departure]:
+    return list(iter_records(content, Departure.from_fields))
+
+
+def measure(function, content: bytes, repeat: int = 5) -> tuple[float, int]:
+    """
+    Time a parse path and measure its peak memory.
+
+    :return: The best time in seconds and the peak traced memory in bytes.
+    :rtype: tuple[float, int]
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    content = make_departures_xml(rows)
+    assert xmltodict_path(content) == streaming_path(content)
+    print(f"{rows} rows, {len(content) / 1e6:.1f} MB")
+    for name, function in (("xmltodict", xmltodict_path), ("streaming", streaming_path)):
+        seconds, peak = measure(function, content)
+        print(f"{name:>10}: {seconds * 1000:8.1f} ms  peak {peak / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Synthetic inputs for the benchmark suite: a stand-in for the BT4U web service serving XML in
+the shape of the real responses, a day of stop times, and calendars scaled up from the
+bundled .ics files.
+"""
+
+import random
+import re
+import sys
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from bt4u_records import Departure  # noqa: E402
+from stop_index import haversine  # noqa: E402
+
+# The area the synthetic stops are spread over, roughly the Virginia Tech campus.
+CAMPUS_BOUNDS = (37.215, 37.235, -80.435, -80.405)
+
+
+def _rows(element: str, rows: list[dict[str, object]]) -> str:
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<DocumentElement>']
+    for row in rows:
+        fields = "".join(f"<{k}>{escape(str(v))}</{k}>" for k, v in row.items())
+        parts.append(f"<{element}>{fields}</{element}>")
+    parts.append("</DocumentElement>")
+    return "".join(parts)
+
+
+class FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = 200
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeBT4U:
+    """
+    A deterministic BT4U stand-in with a few routes and stops scattered over campus. It has
+    the post() method BT4U_Interface uses on its session, so it can be swapped in for one.
+    """
+
+    def __init__(self, routes: int = 4, stops: int = 80, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        south, north, west, east = CAMPUS_BOUNDS
+        self.routes = [f"R{i}" for i in range(routes)]
+        self.stops = [
+            {
+                "StopCode": str(1100 + i),
+                "StopName": f"Stop {i}",
+                "Latitude": round(rng.uniform(south, north), 6),
+                "Longitude": round(rng.uniform(west, east), 6),
+            }
+            for i in range(stops)
+        ]
+        self.calls = 0
+
+    def post(self, url: str, data: dict[str, str] | None = None, timeout=None) -> FakeResponse:
+        self.calls += 1
+        endpoint = url.rsplit("/", 1)[-1]
+        data = data or {}
+        if endpoint == "GetCurrentRoutes":
+            return FakeResponse(
+                _rows(
+                    "CurrentRoutes",
+                    [
+                        {"RouteShortName": r, "RouteName": r, "RouteColor": "000000"}
+                        for r in self.routes
+                    ],
+                )
+            )
+        if endpoint == "GetScheduledStopInfo":
+            i = self.routes.index(data.get("routeShortName", self.routes[0]))
+            return FakeResponse(_rows("ScheduledStops", self.stops[i :: len(self.routes)]))
+        if endpoint == "GetNearestStops":
+            latitude, longitude = float(data["latitude"]), float(data["longitude"])
+            count = int(data.get("noOfStops", 1))
+            nearest = sorted(
+                (
+                    {
+                        **stop,
+                        "Distance": haversine(
+                            latitude, longitude, stop["Latitude"], stop["Longitude"]
+                        ),
+                    }
+                    for stop in self.stops
+                ),
+                key=lambda stop: stop["Distance"],
+            )[:count]
+            return FakeResponse(_rows("StopDistances", nearest))
+        raise ValueError(f"No fixture for {endpoint}")
+
+
+def make_departures(
+    service_date: date,
+    routes: int = 12,
+    stops: int = 200,
+    stops_per_route: int = 25,
+    headway: int = 900,
+    seed: int = 0,
+) -> list[Departure]:
+    """
+    Make a day of stop times: each route visits a random sequence of stops, with a trip
+    every headway seconds from 6 AM to 11 PM and 90 seconds between stops. Routes share
+    stops, so journeys can transfer.
+
+    :param service_date: The service date of the stop times.
+    :type service_date: date
+    :param routes: The number of routes.
+    :type routes: int
+    :param stops: The number of stops the routes are drawn from.
+    :type stops: int
+    :param stops_per_route: The number of stops each route visits.
+    :type stops_per_route: int
+    :param headway: The time between trips of a route in seconds.
+    :type headway: int
+    :param seed: The seed of the random stop sequences.
+    :type seed: int
+    :return: The stop times.
+    :rtype: list[Departure]
+    """
+    rng = random.Random(seed)
+    midnight = datetime.combine(service_date, time())
+    departures = []
+    for r in range(routes):
+        sequence = rng.sample(range(stops), stops_per_route)
+        for n, start in enumerate(range(6 * 3600, 23 * 3600, headway)):
+            for i, stop in enumerate(sequence):
+                moment = midnight + timedelta(seconds=start + 90 * i)
+                departures.append(
+                    Departure(f"R{r}", f"R{r}-{n}", str(1100 + stop), moment, moment)
+                )
+    return departures
+
+
+def scale_calendar(calendar: bytes, factor: int, buildings: list[str]) -> bytes:
+    """
+    Make a calendar factor times as large by repeating its events as distinct courses in
+    other buildings.
+
+    :param calendar: The .ics file to scale.
+    :type calendar: bytes
+    :param factor: How many copies of each event to make.
+    :type factor: int
+    :param buildings: The building names to spread the copies over.
+    :type buildings: list[str]
+    :return: The scaled calendar.
+    :rtype: bytes
+    """
+    text = calendar.decode("utf-8")
+    head, _, rest = text.partition("BEGIN:VEVENT")
+    events = re.findall(r"BEGIN:VEVENT.*?END:VEVENT\r?\n", "BEGIN:VEVENT" + rest, re.S)
+    tail = ("BEGIN:VEVENT" + rest).rsplit("END:VEVENT", 1)[1].split("\n", 1)[1]
+    copies = []
+    for n in range(factor):
+        for i, event in enumerate(events):
+            building = buildings[(n * len(events) + i) % len(buildings)]
+            event = re.sub(
+                r"(SUMMARY:.*\s)(\d+)(\s+\S+\s*)$",
+                lambda m: f"{m.group(1)}{int(m.group(2)) + n * 10000}{m.group(3)}",
+                event,
+                count=1,
+                flags=re.M,
+            )
+            event = re.sub(r"Building: .*? Room:", f"Building: {building} Room:", event)
+            event = re.sub(r"^UID:([^\r\n]*)", rf"UID:\1-{n}-{i}", event, flags=re.M)
+            copies.append(event)
+    return (head + "".join(copies) + tail).encode("utf-8")
+
+
+def campus_point(rng: random.Random) -> tuple[float, float]:
+    """
+    Pick a random point on campus.
+    """
+    south, north, west, east = CAMPUS_BOUNDS
+    return rng.uniform(south, north), rng.uniform(west, east)
+
+
+class FakeGeocodio:
+    """
+    A GeocodioClient stand-in that answers forward and reverse lookups with addresses and
+    coordinates on campus, derived from the query so repeated queries agree.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @staticmethod
+    def _point(text: str) -> tuple[float, float]:
+        return campus_point(random.Random(text))
+
+    def geocode(self, query: str, **kwargs) -> dict:
+        self.calls += 1
+        latitude, longitude = self._point(query)
+        return {"results": [{"location": {"lat": latitude, "lng": longitude}}]}
+
+    def batch_geocode(self, queries: list[str], **kwargs) -> list[dict]:
+        self.calls += 1
+        return [
+            {"results": [{"location": dict(zip(("lat", "lng"), self._point(query)))}]}
+            for query in queries
+        ]
+
+    def reverse(self, point: tuple[float, float], **kwargs) -> dict:
+        self.calls += 1
+        number = int(abs(point[0] * 1e4 + point[1] * 1e4)) % 900 + 100
+        return {
+            "results": [
+                {
+                    "address_components": {
+                        "number": str(number),
+                        "formatted_street": "Washington St SW",
+                        "city": "Blacksburg",
+                        "state": "VA",
+                        "zip": "24061",
+                    }
+                }
+            ]
+        }
@@ -0,0 +1,245 @@
+"""
+End-to-end load generator for AnvilHandler.call_me. Each request picks one of the bundled
+calendars and a random point on campus and goes through call_me exactly as an uplink call
+would, pool, load shedding and response cache included, without Anvil in between.
+
+Without --rate the load is closed: --concurrency clients send back to back. With --rate
+requests arrive as a Poisson process at that many per second, and latency counts from when
+a request was due, so time spent waiting for a free client is not hidden.
+
+Upstream services are reached through the configured transport (see transport.Transport),
+so a recording can be replayed with HOKIEBUS_TRANSPORT=replay. --offline instead runs
+against the synthetic BT4U and Geocodio stand-ins in a scratch copy of data/. Upstream
+calls are counted in this process, so they are reported as unavailable with
+--executor process.
+
+Usage: python loadgen.py [--requests N] [--concurrency N] [--rate PER_SECOND] [--offline]
+                         [--executor thread|process] [--workers N] [--max-in-flight N]
+                         [--deadline SECONDS] [--locations N] [--seed N] [--output FILE]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import anvil
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from fixtures import FakeBT4U, FakeGeocodio, campus_point  # noqa: E402
+from suite import make_sandbox  # noqa: E402
+
+from anvil_handler import AnvilHandler, ServerBusyError  # noqa: E402
+from bt4u_interface import BT4U_Interface as bt4u  # noqa: E402
+from cache_handler import TieredCache  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from route_cache import RouteCache  # noqa: E402
+from schedule import Address  # noqa: E402
+
+_GEOCODE_STAGES = ("forward_geocode", "reverse_geocode", "batch_geocode")
+
+
+def upstream_calls() -> dict[str, float]:
+    """
+    Count the calls made to upstream services so far in this process.
+
+    :return: The number of BT4U requests and Geocodio requests.
+    :rtype: dict[str, float]
+    """
+    snapshot = Metrics.shared().snapshot()
+    bt4u_calls = sum(
+        count
+        for (name, labels), count in snapshot["counters"].items()
+        if name == "hokiebus_bt4u_fetch_total" and ("source", "upstream") in labels
+    )
+    geocodio_calls = sum(
+        histogram["count"]
+        for (name, labels), histogram in snapshot["histograms"].items()
+        if name == "hokiebus_stage_seconds" and dict(labels).get("stage") in _GEOCODE_STAGES
+    )
+    return {"bt4u": bt4u_calls, "geocodio": geocodio_calls}
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(args: argparse.Namespace) -> dict[str, object]:
+    """
+    Drive call_me and gather the results.
+
+    :return: The report.
+    :rtype: dict[str, object]
+    """
+    rng = random.Random(args.seed)
+    calendars = [
+        anvil.BlobMedia("text/calendar", path.read_bytes(), name=path.name)
+        for path in sorted(Path("../data/schedules").glob("*.ics"))
+    ]
+    points = [campus_point(rng) for _ in range(args.locations)]
+    requests = [
+        (*(rng.choice(points) if points else campus_point(rng)), rng.choice(calendars))
+        for _ in range(args.requests)
+    ]
+
+    latencies: list[float] = []
+    outcomes: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def call(latitude: float, longitude: float, calendar, due: float) -> None:
+        try:
+            AnvilHandler.call_me(latitude, longitude, calendar)
+            outcome = "ok"
+        except ServerBusyError:
+            outcome = "shed"
+        except TimeoutError:
+            outcome = "timeout"
+        except Exception as e:
+            outcome = f"error: {type(e).__name__}"
+        elapsed = time.perf_counter() - due
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == "ok":
+                latencies.append(elapsed)
+
+    # One untimed call loads the building tables and stop data every later call shares.
+    with contextlib.redirect_stdout(io.StringIO()):
+        AnvilHandler.call_me(*campus_point(random.Random(-1)), calendars[0])
+
+    before = upstream_calls()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(args.concurrency) as clients:
+            if args.rate:
+                due = start
+                for request in requests:
+                    due += rng.expovariate(args.rate)
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                    clients.submit(call, *request, due)
+            else:
+                pending = iter(requests)
+                pending_lock = threading.Lock()
+
+                def client() -> None:
+                    while True:
+                        with pending_lock:
+                            request = next(pending, None)
+                        if request is None:
+                            return
+                        call(*request, time.perf_counter())
+
+                for _ in range(args.concurrency):
+                    clients.submit(client)
+    elapsed = time.perf_counter() - start
+    after = upstream_calls()
+    # Calls made in process workers are counted there, not here.
+    upstream = (
+        None
+        if args.executor == "process"
+        else {
+            service: (after[service] - before[service]) / args.requests
+            for service in after
+        }
+    )
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "seconds": elapsed,
+        "outcomes": outcomes,
+        "throughput": outcomes.get("ok", 0) / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "mean": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        },
+        "upstream_calls_per_request": upstream,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--rate", type=float, help="mean arrivals per second (open loop)")
+    parser.add_argument("--offline", action="store_true", help="use synthetic upstreams")
+    parser.add_argument("--executor", default="thread", choices=("thread", "process"))
+    parser.add_argument("--workers", type=int, help="call_me workers")
+    parser.add_argument("--max-in-flight", type=int, help="calls accepted at once")
+    parser.add_argument("--deadline", type=float, default=30.0, help="per-call deadline")
+    parser.add_argument(
+        "--locations",
+        type=int,
+        default=0,
+        help="draw start points from this many fixed ones, so repeat visits can hit the "
+        "response cache; 0 picks a new point for every request",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the report here as JSON")
+    args = parser.parse_args()
+    output = args.output.resolve() if args.output else None
+    if args.offline and args.executor == "process":
+        parser.error("--offline stand-ins only reach thread workers")
+
+    cwd = Path.cwd()
+    scratch = tempfile.mkdtemp(prefix="hokiebus-loadgen-")
+    sandbox = None
+    if args.offline:
+        sandbox = make_sandbox()
+        bt4u.configure_transport(session=FakeBT4U())
+        Address.configure_client(FakeGeocodio())
+    else:
+        os.chdir(ROOT / "src")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            AnvilHandler.configure(
+                args.executor, args.workers, args.max_in_flight, args.deadline
+            )
+            # A fresh response cache, so earlier runs do not answer for this one.
+            AnvilHandler._results = RouteCache(
+                TieredCache(str(Path(scratch) / "routes.sqlite"))
+            )
+        report = run(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+        if sandbox is not None:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+    latency = report["latency_ms"]
+    upstream = report["upstream_calls_per_request"]
+    print(
+        f"{report['requests']} requests in {report['seconds']:.2f} s: {report['outcomes']}\n"
+        f"throughput {report['throughput']:.1f} req/s\n"
+        f"latency p50 {latency['p50']:.1f} ms  p95 {latency['p95']:.1f} ms  "
+        f"p99 {latency['p99']:.1f} ms\n"
+        + (
+            f"upstream calls per request: BT4U {upstream['bt4u']:.2f}  "
+            f"Geocodio {upstream['geocodio']:.2f}"
+            if upstream is not None
+            else "upstream calls per request: unavailable with --executor process"
+        )
+    )
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
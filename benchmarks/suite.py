@@ -0,0 +1,237 @@
+"""
+Component benchmarks: Schedule parsing on the bundled and scaled calendars, loading
+addresses.json, RouteFinder.find_route against a synthetic BT4U service, JourneyPlanner
+over a synthetic day of stop times, the CacheHandler refresh path and BT4U XML parsing. Everything runs offline in a scratch copy of data/.
+
+Results are written as JSON. Given a baseline from an earlier run, any benchmark whose
+median is more than the threshold slower than its baseline is reported and the suite exits
+with status 1, so it can gate a build.
+
+Usage: python suite.py [--repeat N] [--filter TEXT] [--output FILE] [--baseline FILE]
+                       [--threshold FRACTION]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from bench_xml_parsing import make_departures_xml, streaming_path, xmltodict_path  # noqa: E402
+from fixtures import FakeBT4U, make_departures, scale_calendar  # noqa: E402
+
+from bt4u_interface import BT4U_Interface as bt4u  # noqa: E402
+from cache_handler import CacheHandler  # noqa: E402
+from journey_planner import JourneyPlanner  # noqa: E402
+from routefinder import RouteFinder  # noqa: E402
+from schedule import Address, Schedule  # noqa: E402
+from stop_index import StopIndex  # noqa: E402
+from timetable import Timetable  # noqa: E402
+
+
+def make_sandbox() -> Path:
+    """
+    Copy data/ to a scratch directory and move into a src/ next to it, so the relative
+    "../data" paths used throughout the code resolve to the copy.
+
+    :return: The scratch directory.
+    :rtype: Path
+    """
+    sandbox = Path(tempfile.mkdtemp(prefix="hokiebus-bench-"))
+    shutil.copytree(ROOT / "data", sandbox / "data")
+    (sandbox / "src").mkdir()
+    # A fresh mtime keeps the address cache from trying to rescrape campus.
+    (sandbox / "data" / "addresses.json").touch()
+    os.chdir(sandbox / "src")
+    return sandbox
+
+
+def build_benchmarks() -> dict[str, Callable[[], object]]:
+    """
+    Set up every benchmark.
+
+    :return: The function to time for each benchmark, by name.
+    :rtype: dict[str, Callable[[], object]]
+    """
+    bt4u.configure_transport(session=FakeBT4U())
+    bt4u.configure_cache(enabled=False)
+    start = Address(
+        "800 Washington St SW", "Blacksburg", "VA", "24061", "US", 37.2249, -80.4205
+    )
+    addresses_file = Path("../data/addresses.json")
+    buildings = list(json.loads(addresses_file.read_text()))
+    calendars = {
+        path.stem: path.read_bytes() for path in sorted(Path("../data/schedules").glob("*.ics"))
+    }
+
+    benchmarks: dict[str, Callable[[], object]] = {}
+    for name, calendar in calendars.items():
+        benchmarks[f"schedule_parse/{name}"] = lambda c=calendar: Schedule(start, c)
+    base = calendars.get("Fall2024") or next(iter(calendars.values()))
+    for factor in (10, 50):
+        scaled = scale_calendar(base, factor, buildings)
+        benchmarks[f"schedule_parse/scaled_x{factor}"] = lambda c=scaled: Schedule(start, c)
+
+    benchmarks["addresses_load"] = lambda: json.loads(addresses_file.read_text())
+
+    schedule = Schedule(start, base)
+    RouteFinder.load_tables(wait=True)  # builds data/building_stops.json from the fixtures
+    index = StopIndex.shared()
+    # Without the building stop table, so every building goes through BT4U or the index.
+    benchmarks["find_route/bt4u"] = lambda: RouteFinder(
+        schedule, precomputed=False
+    ).find_route()
+    benchmarks["find_route/stop_index"] = lambda: RouteFinder(
+        schedule, index, precomputed=False
+    ).find_route()
+    benchmarks["find_route/building_stops"] = lambda: RouteFinder(schedule).find_route()
+    scaled_schedule = Schedule(start, scale_calendar(base, 10, buildings))
+    benchmarks["find_route/bt4u_scaled_x10"] = lambda: RouteFinder(
+        scaled_schedule, precomputed=False
+    ).find_route()
+
+    timetable = Timetable(date(2025, 3, 14), make_departures(date(2025, 3, 14)))
+    planner = JourneyPlanner(timetable)
+    rng = random.Random(0)
+    # 100 queries between random stops, due between 8 AM and 8 PM.
+    queries = [
+        (*rng.sample(timetable.stops, 2), rng.randrange(8 * 3600, 20 * 3600))
+        for _ in range(100)
+    ]
+    benchmarks["journey_planner/build"] = lambda: JourneyPlanner(timetable)
+    benchmarks["journey_planner/query_x100"] = lambda: [
+        planner.latest_departure(origin, destination, deadline)
+        for origin, destination, deadline in queries
+    ]
+
+    table = json.loads(addresses_file.read_text())
+    refresh_file = Path("../data/bench_refresh.json")
+    handler = CacheHandler(str(refresh_file), update_function=lambda update=False: table)
+
+    def cache_refresh() -> None:
+        os.utime(refresh_file, (0, 0))  # stale, so every run does a full refresh
+        handler.cache_update()
+
+    benchmarks["cache_refresh"] = cache_refresh
+
+    departures = make_departures_xml(20_000)
+    benchmarks["xml_parsing/xmltodict"] = lambda: xmltodict_path(departures)
+    benchmarks["xml_parsing/streaming"] = lambda: streaming_path(departures)
+    return benchmarks
+
+
+def measure(function: Callable[[], object], repeat: int) -> dict[str, float]:
+    """
+    Time a benchmark after one warm-up run. Output printed by the code under test is
+    discarded.
+
+    :return: The minimum, median and maximum run time in milliseconds, and the run count.
+    :rtype: dict[str, float]
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "max_ms": max(times),
+        "runs": repeat,
+    }
+
+
+def compare(
+    results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float
+) -> list[str]:
+    """
+    Find the benchmarks that slowed down since the baseline.
+
+    :return: A description of each regression.
+    :rtype: list[str]
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {before['median_ms']:.2f} ms -> {result['median_ms']:.2f} ms "
+                f"({ratio - 1:+.0%})"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10, help="runs per benchmark")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this")
+    parser.add_argument("--output", type=Path, help="write the results here as JSON")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fraction a median may grow over the baseline before failing",
+    )
+    args = parser.parse_args()
+    output = args.output.resolve() if args.output else None
+    baseline_file = args.baseline.resolve() if args.baseline else None
+
+    cwd = Path.cwd()
+    sandbox = make_sandbox()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            benchmarks = build_benchmarks()
+        results = {}
+        for name, function in benchmarks.items():
+            if args.filter not in name:
+                continue
+            results[name] = measure(function, args.repeat)
+            print(
+                f"{name:<32} median {results[name]['median_ms']:9.2f} ms  "
+                f"min {results[name]['min_ms']:9.2f} ms"
+            )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+
+    if baseline_file:
+        baseline = json.loads(baseline_file.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Slower than the baseline:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print(f"No benchmark is more than {args.threshold:.0%} slower than the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,14 @@ from anvil.js.window import navigator
 from ._anvil_designer import RoutePlannerTemplate
 
 
+class ServerBusyError(anvil.server.AnvilWrappedError):
+    pass
+
+
+# Registered under the same name as on the uplink, so a busy server can be told apart.
+anvil.server._register_exception_type("hokiebus.ServerBusyError", ServerBusyError)
+
+
 class RoutePlanner(RoutePlannerTemplate):
     def __init__(self, **properties):
         # Set Form properties and Data Bindings.
@@ -20,9 +28,13 @@ class RoutePlanner(RoutePlannerTemplate):
         This method is called when the user uploads their calendar file.
         It retrieves the route and displays the stops on the map.
         """
-        result = anvil.server.call(
-            "call_me", self.start_pos[0], self.start_pos[1], file
-        )
+        try:
+            result = anvil.server.call(
+                "call_me", self.start_pos[0], self.start_pos[1], file
+            )
+        except ServerBusyError as e:
+            Notification(str(e), title="Busy", style="warning").show()
+            return
         self.map.clear()
         for location, bus_stop in result.items():
             print(f"Closest stop to {location} is {bus_stop}")
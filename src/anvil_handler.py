@@ -1,35 +1,191 @@
 import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict
+from multiprocessing import get_context
+from typing import Any, ClassVar
 
 import anvil._serialise
 import anvil.server
 from dotenv import load_dotenv
 
+from bus_tracker import BusTracker
+from metrics import Metrics
+from route_cache import RouteCache
 from routefinder import RouteFinder
 from schedule import Address, Schedule
+from stop_index import StopIndex
+
+
+class ServerBusyError(anvil.server.AnvilWrappedError):
+    """
+    Raised by call_me when the server is already handling as many calls as it accepts. It is
+    registered with Anvil under the name "hokiebus.ServerBusyError", so clients that register
+    the same name can catch it on its own and retry.
+    """
+
+
+anvil.server._register_exception_type("hokiebus.ServerBusyError", ServerBusyError)
+
+
+def plan_route(latitude: float, longitude: float, calendar: bytes) -> dict[str, Any]:
+    """
+    Find the stops nearest the user and each building in their schedule. This is the work
+    behind AnvilHandler.call_me, kept free of Anvil objects so it can run in any worker.
+    Nearest stops come from the shared stop index once it is built, and from BT4U until then.
+
+    :param latitude: The latitude.
+    :type latitude: float
+    :param longitude: The longitude.
+    :type longitude: float
+    :param calendar: The contents of the user's .ics file.
+    :type calendar: bytes
+    :return: A dictionary containing the route information.
+    :rtype: dict[str, Any]
+    """
+    location_string = Address().convert_gps_to_address(latitude, longitude)
+    address_parts = location_string.split(",")
+    # print(address_parts)
+    if len(address_parts) != 5:
+        raise ValueError("Invalid address format.")
+
+    address = Address(
+        address_parts[0],
+        address_parts[1],
+        address_parts[2],
+        address_parts[3],
+        address_parts[4],
+    )
+    with Metrics.shared().span("plan_route"):
+        schedule = Schedule(address, calendar)
+        stop_index = StopIndex.shared(build=False) if StopIndex.version() is not None else None
+        return RouteFinder(schedule, stop_index).find_route()
+
+
+def _start_worker() -> None:
+    """
+    Build and keep fresh the stop index of a worker process in the background, since spawned
+    workers do not share the uplink's.
+
+    :return: None
+    """
+    StopIndex.shared(build=False).start()
 
 
 class AnvilHandler:
     """
     A class to handle the interaction with Anvil.
 
+    Calls are run on a shared pool of worker threads or processes. At most max_in_flight
+    calls are accepted at once; any more are turned away immediately instead of queueing,
+    and a call that takes longer than its deadline is abandoned. All of these are read from
+    the environment (or .env):
+
+    - HOKIEBUS_EXECUTOR: "thread" (default) or "process".
+    - HOKIEBUS_WORKERS: the number of workers. Calls mostly wait on BT4U and Geocodio, so
+      threads default to ThreadPoolExecutor's own default; processes default to the number
+      of CPUs.
+    - HOKIEBUS_MAX_IN_FLIGHT: the number of calls accepted at once. Defaults to twice the
+      number of workers.
+    - HOKIEBUS_CALL_TIMEOUT: the deadline of each call in seconds. Defaults to 30.
+
+    Set HOKIEBUS_METRICS_PORT to serve the metrics of the uplink process over HTTP, or call
+    get_metrics for the same text. With the process executor, the stages inside each call
+    are timed in the workers and do not show up here.
+
+    Responses are cached in a RouteCache, configured by HOKIEBUS_RESULT_PRECISION (decimal
+    places of the location, default 4), HOKIEBUS_RESULT_TTL (seconds, default 3600) and
+    HOKIEBUS_RESULT_CACHE_SIZE (entries, default 1024). Cached calls skip the pool entirely.
+
     :author: Barrett Wise
     :date: 1/25/25
     """
 
+    _executor: ClassVar[Executor | None] = None
+    _slots: ClassVar[threading.BoundedSemaphore | None] = None
+    _deadline: ClassVar[float] = 30.0
+    _results: ClassVar[RouteCache | None] = None
+
     def __init__(self) -> None:
         load_dotenv(".env")
         anvil_key = os.getenv("ANVIL_KEY")
         if not anvil_key:
             raise ValueError("ANVIL_KEY not found in environment variables.")
+        AnvilHandler.configure(
+            os.getenv("HOKIEBUS_EXECUTOR", "thread"),
+            int(os.getenv("HOKIEBUS_WORKERS", "0")) or None,
+            int(os.getenv("HOKIEBUS_MAX_IN_FLIGHT", "0")) or None,
+            float(os.getenv("HOKIEBUS_CALL_TIMEOUT", "30")),
+        )
+        AnvilHandler._results = RouteCache(
+            precision=int(os.getenv("HOKIEBUS_RESULT_PRECISION", "4")),
+            ttl=float(os.getenv("HOKIEBUS_RESULT_TTL", "3600")),
+            max_entries=int(os.getenv("HOKIEBUS_RESULT_CACHE_SIZE", "1024")),
+        )
+        # Load the building tables and the stop index now, so no call waits on them or on
+        # BT4U to build them. The stop index is kept fresh in the background.
+        RouteFinder.load_tables()
+        StopIndex.shared(build=False).start()
+        metrics_port = os.getenv("HOKIEBUS_METRICS_PORT")
+        if metrics_port:
+            Metrics.shared().serve(int(metrics_port))
         anvil.server.connect(anvil_key)
 
+    @classmethod
+    def configure(
+        cls,
+        executor: str = "thread",
+        workers: int | None = None,
+        max_in_flight: int | None = None,
+        deadline: float = 30.0,
+    ) -> None:
+        """
+        Set up the pool call_me runs on, replacing any previous one.
+
+        :param executor: "thread" to run calls on threads, or "process" to run them on
+            separate processes and use every core.
+        :type executor: str
+        :param workers: The number of workers. Defaults to min(32, CPUs + 4) threads, as for
+            ThreadPoolExecutor, since calls are I/O bound, or one process per CPU.
+        :type workers: int | None
+        :param max_in_flight: The number of calls accepted at once, running or waiting for a
+            worker. Defaults to twice the number of workers.
+        :type max_in_flight: int | None
+        :param deadline: How long in seconds a call may take before it is abandoned.
+        :type deadline: float
+        :return: None
+        """
+        if executor == "process":
+            workers = workers or os.cpu_count() or 1
+            # Spawned rather than forked, so workers do not inherit the uplink's threads.
+            pool: Executor = ProcessPoolExecutor(
+                workers, mp_context=get_context("spawn"), initializer=_start_worker
+            )
+        elif executor == "thread":
+            workers = workers or min(32, (os.cpu_count() or 1) + 4)
+            pool = ThreadPoolExecutor(workers, thread_name_prefix="call_me")
+        else:
+            raise ValueError(f"Unknown executor: {executor}")
+        max_in_flight = max_in_flight or 2 * workers
+
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+        cls._executor = pool
+        cls._slots = threading.BoundedSemaphore(max_in_flight)
+        cls._deadline = deadline
+        print(
+            f"Serving calls on {workers} {executor} workers, "
+            f"{max_in_flight} at once, {deadline}s deadline."
+        )
+
     @staticmethod
     @anvil.server.callable
     def call_me(
         latitude: float, longitude: float, calendar: anvil._serialise.StreamingMedia
     ) -> dict[str, str]:
         """
-        A test function to check if the Anvil server is working.
+        Find the stops nearest the user and each building in their schedule.
 
         :param latitude: The latitude.
         :type latitude: float
@@ -39,19 +195,84 @@ class AnvilHandler:
         :type calendar: anvil._serialise.StreamingMedia
         :return: A dictionary containing the route information.
         :rtype: dict[str, str]
+        :raises ServerBusyError: If the server is already handling max_in_flight calls.
+        :raises TimeoutError: If the call does not finish within its deadline.
         """
-        location_string = Address().convert_gps_to_address(latitude, longitude)
-        address_parts = location_string.split(",")
-        # print(address_parts)
-        if len(address_parts) != 5:
-            raise ValueError("Invalid address format.")
-
-        address = Address(
-            address_parts[0],
-            address_parts[1],
-            address_parts[2],
-            address_parts[3],
-            address_parts[4],
-        )
-        schedule = Schedule(address, calendar)
-        return RouteFinder(schedule).find_route()
\ No newline at end of file
+        if AnvilHandler._executor is None:
+            AnvilHandler.configure()
+        results = AnvilHandler._results = AnvilHandler._results or RouteCache.shared()
+        calendar_bytes = calendar.get_bytes()
+        key = results.key(latitude, longitude, calendar_bytes)
+        metrics = Metrics.shared()
+        cached = results.get(key)
+        if cached is not None:
+            metrics.increment("hokiebus_calls_total", outcome="cached")
+            return cached
+
+        if not AnvilHandler._slots.acquire(blocking=False):
+            metrics.increment("hokiebus_calls_total", outcome="shed")
+            raise ServerBusyError("The server is busy. Please try again shortly.")
+
+        slots = AnvilHandler._slots
+        try:
+            future = AnvilHandler._executor.submit(
+                plan_route, latitude, longitude, calendar_bytes
+            )
+        except BaseException:
+            slots.release()
+            raise
+
+        def done(future: Future) -> None:
+            # The slot is held until the work itself ends, even if the caller stops waiting,
+            # and a late result is still cached for the next try.
+            slots.release()
+            if not future.cancelled() and future.exception() is None:
+                results.put(key, future.result())
+
+        future.add_done_callback(done)
+        try:
+            with metrics.span("call_me"):
+                result = future.result(timeout=AnvilHandler._deadline)
+        except FutureTimeoutError:
+            metrics.increment("hokiebus_calls_total", outcome="timeout")
+            future.cancel()
+            raise TimeoutError(
+                f"Finding the route took longer than {AnvilHandler._deadline} seconds."
+            ) from None
+        except Exception:
+            metrics.increment("hokiebus_calls_total", outcome="error")
+            raise
+        metrics.increment("hokiebus_calls_total", outcome="ok")
+        return result
+
+    @staticmethod
+    @anvil.server.callable
+    def get_metrics() -> str:
+        """
+        Get the metrics of this uplink process.
+
+        :return: The metrics in the Prometheus text exposition format.
+        :rtype: str
+        """
+        return Metrics.shared().prometheus()
+
+    @staticmethod
+    @anvil.server.callable
+    def get_bus_positions(cursor: int = 0) -> dict[str, Any]:
+        """
+        Get the live bus positions that changed since the caller's last read, from the shared
+        poller rather than from BT4U.
+
+        :param cursor: The cursor returned by the caller's last read, or 0 on the first read.
+        :type cursor: int
+        :return: The cursor to pass next time, the changed positions, the vehicles that left
+            service, and whether this is a full snapshot instead of a delta.
+        :rtype: dict[str, Any]
+        """
+        delta = BusTracker.shared().changes_since(cursor)
+        return {
+            "cursor": delta.cursor,
+            "positions": [asdict(position) for position in delta.positions],
+            "removed": delta.removed,
+            "reset": delta.reset,
+        }
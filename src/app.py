@@ -1,12 +1,35 @@
+import os
+from multiprocessing import get_context
+
 import anvil.server
+from dotenv import load_dotenv
 
 from anvil_handler import AnvilHandler
 
 
-def main():
+def serve():
     AnvilHandler()
     anvil.server.wait_forever()
 
 
+def main():
+    """
+    Run the uplink. Set HOKIEBUS_UPLINKS to run several uplink processes; Anvil spreads calls
+    across every uplink connected with the same key.
+    """
+    load_dotenv(".env")
+    uplinks = int(os.getenv("HOKIEBUS_UPLINKS", "1"))
+    if uplinks <= 1:
+        serve()
+        return
+
+    context = get_context("spawn")
+    processes = [context.Process(target=serve, name=f"uplink-{i}") for i in range(uplinks)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,267 @@
+import asyncio
+from typing import Any, Callable, Coroutine
+
+from bt4u_interface import BT4U_Interface
+from bt4u_records import BusPosition, Departure, Route, Stop
+
+
+class AsyncBT4U_Interface:
+    """
+    An asyncio version of BT4U_Interface. Every public endpoint of BT4U_Interface has a
+    coroutine here with the same name and arguments; calls run on the shared pooled session
+    and at most max_concurrency of them are in flight at once.
+
+    :author: Barrett Wise
+    :date: 2/3/25
+    """
+
+    def __init__(self, max_concurrency: int | None = None) -> None:
+        """
+        :param max_concurrency: The maximum number of requests in flight at once. Defaults to the
+            connection pool size of BT4U_Interface.
+        :type max_concurrency: int | None
+        """
+        self.max_concurrency = max_concurrency or BT4U_Interface._POOL_SIZE
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def _call(self, method: Callable[..., dict[str, Any]], *args, **kwargs) -> Any:
+        """
+        Run a blocking BT4U_Interface endpoint in a worker thread, bounded by the semaphore.
+
+        :param method: The endpoint to call.
+        :type method: Callable[..., dict[str, Any]]
+        :return: The parsed response.
+        :rtype: Any
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def gather(self, *calls: Coroutine[Any, Any, Any]) -> list[Any]:
+        """
+        Run the given endpoint calls concurrently and return their results in order.
+
+        :return: The results of the calls.
+        :rtype: list[Any]
+        """
+        return list(await asyncio.gather(*calls))
+
+    async def check_for_known_place(self, place_name: str = "") -> dict[str, Any]:
+        """
+        Get information on a known place.
+        """
+        return await self._call(BT4U_Interface.check_for_known_place, place_name)
+
+    async def get_active_alerts(
+        self, alert_types: str = "", alert_causes: str = "", alert_effects: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get active alerts with the given parameters.
+        """
+        return await self._call(
+            BT4U_Interface.get_active_alerts, alert_types, alert_causes, alert_effects
+        )
+
+    async def get_alert_causes(self) -> dict[str, Any]:
+        """
+        Get the causes of all alerts.
+        """
+        return await self._call(BT4U_Interface.get_alert_causes)
+
+    async def get_alert_effects(self) -> dict[str, Any]:
+        """
+        Get the effects of all alerts.
+        """
+        return await self._call(BT4U_Interface.get_alert_effects)
+
+    async def get_alert_types(self) -> dict[str, Any]:
+        """
+        Get the types of all alerts.
+        """
+        return await self._call(BT4U_Interface.get_alert_types)
+
+    async def get_all_alerts(self) -> dict[str, Any]:
+        """
+        Get all alerts.
+        """
+        return await self._call(BT4U_Interface.get_all_alerts)
+
+    async def get_all_places(self) -> dict[str, Any]:
+        """
+        Get information on all known places.
+        """
+        return await self._call(BT4U_Interface.get_all_places)
+
+    async def get_arrival_and_departure_times_route(
+        self, route_short_name: str = "", num_of_trips: int = 0, service_date: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the arrival and departure times for every stop on a given route.
+        """
+        return await self._call(
+            BT4U_Interface.get_arrival_and_departure_times_route,
+            route_short_name,
+            num_of_trips,
+            service_date,
+        )
+
+    async def get_arrival_and_departure_times_trip(
+        self, trip_id: int = 0
+    ) -> dict[str, Any]:
+        """
+        Get the arrival and departure times for a given trip.
+        """
+        return await self._call(
+            BT4U_Interface.get_arrival_and_departure_times_trip, trip_id
+        )
+
+    async def get_current_bus_info(self) -> dict[str, Any]:
+        """
+        Get information on all buses.
+        """
+        return await self._call(BT4U_Interface.get_current_bus_info)
+
+    async def get_current_routes(self) -> dict[str, Any]:
+        """
+        Get information on all routes.
+        """
+        return await self._call(BT4U_Interface.get_current_routes)
+
+    async def get_nearest_stops(
+        self, latitude: float = 0.0, longitude: float = 0.0, noOfStops: int = 0
+    ) -> dict[str, Any]:
+        """
+        Get the nearest stops to a given set of GPS coordinates.
+        """
+        return await self._call(
+            BT4U_Interface.get_nearest_stops, latitude, longitude, noOfStops
+        )
+
+    async def get_next_departures(
+        self, route_short_name: str = "", stop_code: int = 0
+    ) -> dict[str, Any]:
+        """
+        Get the next departures for a given route and stop.
+        """
+        return await self._call(
+            BT4U_Interface.get_next_departures, route_short_name, stop_code
+        )
+
+    async def get_pattern_points_for_pattern_id(
+        self, pattern_id: str = "", service_date: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get information about every stop relative to a given route.
+        """
+        return await self._call(
+            BT4U_Interface.get_pattern_points_for_pattern_id, pattern_id, service_date
+        )
+
+    async def get_place_types(self) -> dict[str, Any]:
+        """
+        Get the types of all known places.
+        """
+        return await self._call(BT4U_Interface.get_place_types)
+
+    async def get_places(self, place_type: str = "") -> dict[str, Any]:
+        """
+        Get information on places of a given type.
+        """
+        return await self._call(BT4U_Interface.get_places, place_type)
+
+    async def get_scheduled_pattern_points(
+        self, pattern_name: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the scheduled pattern points for a given pattern name.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_pattern_points, pattern_name
+        )
+
+    async def get_scheduled_routes(
+        self, stop_code: int = 0, service_date: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the scheduled routes for a given stop.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_routes, stop_code, service_date
+        )
+
+    async def get_scheduled_stop_codes(
+        self, route_short_name: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the scheduled stop codes for a given route.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_stop_codes, route_short_name
+        )
+
+    async def get_scheduled_stop_info(
+        self, route_short_name: str = "", service_date: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the scheduled stop information for a given route.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_stop_info, route_short_name, service_date
+        )
+
+    async def get_scheduled_stop_names(
+        self, route_short_name: str = ""
+    ) -> dict[str, Any]:
+        """
+        Get the scheduled stop names for a given route.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_stop_names, route_short_name
+        )
+
+    async def get_current_route_records(self) -> list[Route]:
+        """
+        Get information on all routes as typed records.
+        """
+        return await self._call(BT4U_Interface.get_current_route_records)
+
+    async def get_current_bus_positions(self) -> list[BusPosition]:
+        """
+        Get the latest position of every bus as typed records.
+        """
+        return await self._call(BT4U_Interface.get_current_bus_positions)
+
+    async def get_nearest_stop_records(
+        self, latitude: float = 0.0, longitude: float = 0.0, noOfStops: int = 0
+    ) -> list[Stop]:
+        """
+        Get the nearest stops to a given set of GPS coordinates as typed records.
+        """
+        return await self._call(
+            BT4U_Interface.get_nearest_stop_records, latitude, longitude, noOfStops
+        )
+
+    async def get_scheduled_stop_records(
+        self, route_short_name: str = "", service_date: str = ""
+    ) -> list[Stop]:
+        """
+        Get the scheduled stops of a given route as typed records.
+        """
+        return await self._call(
+            BT4U_Interface.get_scheduled_stop_records, route_short_name, service_date
+        )
+
+    async def get_departure_records(
+        self, route_short_name: str = "", num_of_trips: int = 0, service_date: str = ""
+    ) -> list[Departure]:
+        """
+        Get the arrival and departure times for every stop on a given route as typed
+        records.
+        """
+        return await self._call(
+            BT4U_Interface.get_departure_records,
+            route_short_name,
+            num_of_trips,
+            service_date,
+        )
@@ -1,11 +1,23 @@
+import threading
+import time
+from concurrent.futures import Future
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from http.client import HTTPException
-from typing import Any
+from typing import Any, Callable, ClassVar, TypeVar
+from urllib.parse import urlencode
 
 import requests
 import xmltodict
 
+from bt4u_records import BusPosition, Departure, Route, Stop, iter_records
+from cache_handler import TieredCache
+from metrics import Metrics
+from transport import Transport
+
+SERVICE_DAY = "service_day"
+T = TypeVar("T")
+
 
 @dataclass
 class BT4U_Interface:
@@ -15,9 +27,265 @@ class BT4U_Interface:
     :author: Barrett Wise
     :date: 1/22/25
     :var _BASE_URL: The URL of the website hosting the API.
+    :var _POOL_SIZE: The maximum number of pooled connections kept open to the API.
+    :var _DEFAULT_TIMEOUT: The (connect, read) timeout in seconds used for every endpoint.
+    :var _TIMEOUTS: Per-endpoint (connect, read) timeouts overriding the default.
+    :var _RETRIES: The number of times a failed connection is retried.
+    :var _FRESHNESS: How long each endpoint's responses stay fresh, in seconds or SERVICE_DAY
+        for responses that hold until the service day rolls over at _SERVICE_DAY_START_HOUR.
+    :var _MEMORY_ONLY: Endpoints whose responses are never written to the disk cache, because
+        they are keyed by users' locations.
     """
 
     _BASE_URL = "http://216.252.195.248/webservices/bt4u_webservice.asmx/"
+    _POOL_SIZE: ClassVar[int] = 10
+    _DEFAULT_TIMEOUT: ClassVar[tuple[float, float]] = (3.05, 10.0)
+    _TIMEOUTS: ClassVar[dict[str, tuple[float, float]]] = {
+        "GetArrivalAndDepartureTimes": (3.05, 30.0),
+        "GetCurrentBusInfo": (3.05, 5.0),
+        "GetNearestStops": (3.05, 5.0),
+    }
+    _RETRIES: ClassVar[int] = 0
+    _session: ClassVar[requests.Session | None] = None
+    _session_lock: ClassVar[threading.Lock] = threading.Lock()
+    _SERVICE_DAY_START_HOUR: ClassVar[int] = 3
+    _FRESHNESS: ClassVar[dict[str, float | str]] = {
+        "GetActiveAlerts": 300,
+        "GetAlertCauses": SERVICE_DAY,
+        "GetAlertEffects": SERVICE_DAY,
+        "GetAlertTypes": SERVICE_DAY,
+        "GetAllAlerts": 300,
+        "GetAllPlaces": SERVICE_DAY,
+        "GetArrivalAndDepartureTimes": 600,
+        "GetArrivalAndDepartureTimesTrip": 60,
+        # GetCurrentBusInfo is not cached: BusTracker is its only reader and polls it at
+        # its own cadence, so a cached body would only make positions older.
+        "GetCurrentRoutes": SERVICE_DAY,
+        "GetKnownPlace": SERVICE_DAY,
+        "GetNearestStops": SERVICE_DAY,
+        "GetNextDepartures": 30,
+        "GetPatternPointsForPatternID": SERVICE_DAY,
+        "GetPlaceTypes": SERVICE_DAY,
+        "GetPlaces": SERVICE_DAY,
+        "GetScheduledPatternPoints": SERVICE_DAY,
+        "GetScheduledRoutes": SERVICE_DAY,
+        "GetScheduledStopCodes": SERVICE_DAY,
+        "GetScheduledStopInfo": SERVICE_DAY,
+        "GetScheduledStopNames": SERVICE_DAY,
+    }
+    _MEMORY_ONLY: ClassVar[frozenset[str]] = frozenset({"GetNearestStops"})
+    _CACHE_ENABLED: ClassVar[bool] = True
+    _cache: ClassVar[TieredCache | None] = None
+    _in_flight: ClassVar[dict[str, Future]] = {}
+    _in_flight_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def configure_transport(
+        cls,
+        pool_size: int | None = None,
+        timeout: tuple[float, float] | None = None,
+        timeouts: dict[str, tuple[float, float]] | None = None,
+        retries: int | None = None,
+        session: requests.Session | None = None,
+    ) -> None:
+        """
+        Configure the HTTP transport shared by every endpoint. Settings that are not given
+        keep their current values. The pooled session is rebuilt on the next request so the
+        new settings take effect immediately.
+
+        :param pool_size: The maximum number of connections kept open to the API.
+        :type pool_size: int | None
+        :param timeout: The default (connect, read) timeout in seconds.
+        :type timeout: tuple[float, float] | None
+        :param timeouts: Per-endpoint (connect, read) timeouts, keyed by endpoint name.
+        :type timeouts: dict[str, tuple[float, float]] | None
+        :param retries: The number of times to retry a failed connection.
+        :type retries: int | None
+        :param session: A session to send every request with instead of the pooled one, such
+            as a stand-in for testing. It only needs a post() method; close() is called on
+            the session it replaces if it has one.
+        :type session: requests.Session | None
+        :return: None
+        """
+        with cls._session_lock:
+            if pool_size is not None:
+                cls._POOL_SIZE = pool_size
+            if timeout is not None:
+                cls._DEFAULT_TIMEOUT = timeout
+            if timeouts is not None:
+                cls._TIMEOUTS = {**cls._TIMEOUTS, **timeouts}
+            if retries is not None:
+                cls._RETRIES = retries
+            if cls._session is not None and cls._session is not session:
+                close = getattr(cls._session, "close", None)
+                if close is not None:
+                    close()
+            cls._session = session
+
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        """
+        Get the pooled keep-alive session, creating it on first use.
+
+        :return: The shared session.
+        :rtype: requests.Session
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                adapter = Transport.adapter(
+                    pool_connections=1,
+                    pool_maxsize=cls._POOL_SIZE,
+                    pool_block=True,
+                    max_retries=cls._RETRIES,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def configure_cache(cls, enabled: bool = True, cache: TieredCache | None = None) -> None:
+        """
+        Configure response caching.
+
+        :param enabled: Whether responses are cached according to their freshness policy.
+        :type enabled: bool
+        :param cache: The cache to store responses in. Defaults to the shared TieredCache.
+        :type cache: TieredCache | None
+        :return: None
+        """
+        cls._CACHE_ENABLED = enabled
+        cls._cache = cache
+
+    @classmethod
+    def _ttl(cls, endpoint: str) -> float | None:
+        """
+        Get how long a response from the given endpoint stays fresh.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :return: The time to live in seconds, or None if the endpoint is not cached.
+        :rtype: float | None
+        """
+        policy = cls._FRESHNESS.get(endpoint)
+        if policy != SERVICE_DAY:
+            return policy
+        now = datetime.now()
+        rollover = now.replace(
+            hour=cls._SERVICE_DAY_START_HOUR, minute=0, second=0, microsecond=0
+        )
+        if rollover <= now:
+            rollover += timedelta(days=1)
+        return (rollover - now).total_seconds()
+
+    @classmethod
+    def _fetch(cls, endpoint: str, data: dict[str, str] | None = None) -> bytes:
+        """
+        Get the raw response body of a request, from the cache while it is fresh. Identical
+        requests made while one is already in flight wait for it instead of going upstream.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :param data: The form data to send with the request.
+        :type data: dict[str, str] | None
+        :return: The response body.
+        :rtype: bytes
+        """
+        ttl = cls._ttl(endpoint) if cls._CACHE_ENABLED else None
+        key = endpoint + "?" + urlencode(sorted((data or {}).items()))
+        if ttl is not None:
+            cache = cls._cache or TieredCache.shared()
+            cached = cache.get("bt4u", key)
+            # Bodies cached as text by earlier versions are fetched again.
+            if isinstance(cached, bytes):
+                Metrics.shared().increment(
+                    "hokiebus_bt4u_fetch_total", endpoint=endpoint, source="cache"
+                )
+                return cached
+
+        with cls._in_flight_lock:
+            future = cls._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = cls._in_flight[key] = Future()
+        if not leader:
+            Metrics.shared().increment(
+                "hokiebus_bt4u_fetch_total", endpoint=endpoint, source="coalesced"
+            )
+            return future.result()
+
+        Metrics.shared().increment(
+            "hokiebus_bt4u_fetch_total", endpoint=endpoint, source="upstream"
+        )
+        try:
+            content = cls._send(endpoint, data)
+            if ttl is not None:
+                # Only responses that last the whole service day are worth a disk write.
+                cache.set(
+                    "bt4u",
+                    key,
+                    content,
+                    ttl=ttl,
+                    persist=cls._FRESHNESS[endpoint] == SERVICE_DAY
+                    and endpoint not in cls._MEMORY_ONLY,
+                )
+            future.set_result(content)
+            return content
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with cls._in_flight_lock:
+                del cls._in_flight[key]
+
+    @classmethod
+    def _send(cls, endpoint: str, data: dict[str, str] | None = None) -> bytes:
+        """
+        Send a request to the given endpoint over the shared session.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :param data: The form data to send with the request.
+        :type data: dict[str, str] | None
+        :return: The raw response body.
+        :rtype: bytes
+        """
+        url = cls._BASE_URL + endpoint
+        timeout = cls._TIMEOUTS.get(endpoint, cls._DEFAULT_TIMEOUT)
+
+        metrics = Metrics.shared()
+        start = time.perf_counter()
+        try:
+            response = cls._get_session().post(url, data=data, timeout=timeout)
+            response.raise_for_status()
+        except HTTPException as e:
+            metrics.increment("hokiebus_bt4u_errors_total", endpoint=endpoint)
+            raise HTTPException(e)
+        except Exception:
+            metrics.increment("hokiebus_bt4u_errors_total", endpoint=endpoint)
+            raise
+        finally:
+            metrics.observe(
+                "hokiebus_bt4u_request_seconds",
+                time.perf_counter() - start,
+                endpoint=endpoint,
+            )
+        return response.content
+
+    @classmethod
+    def _request(cls, endpoint: str, data: dict[str, str] | None = None) -> dict[str, Any]:
+        """
+        Send a request to the given endpoint and parse the response.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :param data: The form data to send with the request.
+        :type data: dict[str, str] | None
+        :return: The parsed response.
+        :rtype: dict[str, Any]
+        """
+        return xmltodict.parse(cls._fetch(endpoint, data))
 
     @classmethod
     def check_for_known_place(cls, place_name: str = "") -> dict[str, Any]:
@@ -29,16 +297,9 @@ class BT4U_Interface:
         :return: A dictionary containing information on the place.
         """
 
-        url = cls._BASE_URL + "GetKnownPlace"
         data = {"placeName": place_name}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetKnownPlace", data)
 
     @classmethod
     def get_active_alerts(
@@ -57,20 +318,13 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetActiveAlerts"
         data = {
             "alertTypes": alert_types,
             "alertCauses": alert_causes,
             "alertEffects": alert_effects,
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetActiveAlerts", data)
 
     @classmethod
     def get_alert_causes(cls) -> dict[str, Any]:
@@ -81,15 +335,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetAlertCauses"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetAlertCauses")
 
     @classmethod
     def get_alert_effects(cls) -> dict[str, Any]:
@@ -100,15 +346,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetAlertEffects"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetAlertEffects")
 
     @classmethod
     def get_alert_types(cls) -> dict[str, Any]:
@@ -119,15 +357,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetAlertTypes"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetAlertTypes")
 
     @classmethod
     def get_all_alerts(cls) -> dict[str, Any]:
@@ -138,15 +368,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetAllAlerts"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetAllAlerts")
 
     @classmethod
     def get_all_places(cls) -> dict[str, Any]:
@@ -157,15 +379,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetAllPlaces"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetAllPlaces")
 
     @classmethod
     def get_arrival_and_departure_times_route(
@@ -184,20 +398,13 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetArrivalAndDepartureTimes"
         data = {
             "routeShortName": route_short_name,
             "numOfTrips": str(num_of_trips),
             "serviceDate": service_date,
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetArrivalAndDepartureTimes", data)
 
     @classmethod
     def get_arrival_and_departure_times_trip(cls, trip_id: int = 0) -> dict[str, Any]:
@@ -210,16 +417,9 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetArrivalAndDepartureTimesTrip"
         data = {"tripID": str(trip_id)}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetArrivalAndDepartureTimesTrip", data)
 
     @classmethod
     def get_current_bus_info(cls) -> dict[str, Any]:
@@ -230,15 +430,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetCurrentBusInfo"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetCurrentBusInfo")
 
     @classmethod
     def get_current_routes(cls) -> dict[str, Any]:
@@ -249,15 +441,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetCurrentRoutes"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetCurrentRoutes")
 
     @classmethod
     def get_nearest_stops(
@@ -276,7 +460,6 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetNearestStops"
         data = {
             "latitude": str(latitude),
             "longitude": str(longitude),
@@ -284,13 +467,7 @@ class BT4U_Interface:
             "serviceDate": datetime.now().strftime("%m/%d/%y"),
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetNearestStops", data)
 
     @classmethod
     def get_next_departures(
@@ -305,20 +482,13 @@ class BT4U_Interface:
         :type stop_code: int
         """
 
-        url = cls._BASE_URL + "GetNextDepartures"
         data = {
             "routeShortName": route_short_name,
             "stopCode": str(stop_code),
             "serviceDate": datetime.now().strftime("%m/%d/%y"),
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetNextDepartures", data)
 
     @classmethod
     def get_pattern_points_for_pattern_id(
@@ -335,19 +505,12 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetPatternPointsForPatternID"
         data = {
             "patternID": pattern_id,
             "serviceDate": service_date,
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetPatternPointsForPatternID", data)
 
     @classmethod
     def get_place_types(cls) -> dict[str, Any]:
@@ -358,15 +521,7 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetPlaceTypes"
-
-        try:
-            response = requests.post(url)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetPlaceTypes")
 
     @classmethod
     def get_places(cls, place_type: str = "") -> dict[str, Any]:
@@ -379,16 +534,9 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetPlaces"
         data = {"placeType": place_type}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetPlaces", data)
 
     @classmethod
     def get_scheduled_pattern_points(cls, pattern_name: str = "") -> dict[str, Any]:
@@ -401,16 +549,9 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetScheduledPatternPoints"
         data = {"patternName": pattern_name}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetScheduledPatternPoints", data)
 
     @classmethod
     def get_scheduled_routes(
@@ -427,19 +568,12 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetScheduledRoutes"
         data = {
             "stopCode": str(stop_code),
             "serviceDate": service_date,
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetScheduledRoutes", data)
 
     @classmethod
     def get_scheduled_stop_codes(cls, route_short_name: str = "") -> dict[str, Any]:
@@ -452,16 +586,9 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetScheduledStopCodes"
         data = {"routeShortName": route_short_name}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetScheduledStopCodes", data)
 
     @classmethod
     def get_scheduled_stop_info(
@@ -478,19 +605,12 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetScheduledStopInfo"
         data = {
             "routeShortName": route_short_name,
             "serviceDate": service_date,
         }
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetScheduledStopInfo", data)
 
     @classmethod
     def get_scheduled_stop_names(cls, route_short_name: str = "") -> dict[str, Any]:
@@ -503,13 +623,141 @@ class BT4U_Interface:
         :rtype: dict[str, Any]
         """
 
-        url = cls._BASE_URL + "GetScheduledStopNames"
         data = {"routeShortName": route_short_name}
 
-        try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            response_dict = xmltodict.parse(response.text)
-        except HTTPException as e:
-            raise HTTPException(e)
-        return response_dict
+        return cls._request("GetScheduledStopNames", data)
+
+    @classmethod
+    def _request_records(
+        cls,
+        endpoint: str,
+        factory: Callable[[dict[str, str]], T],
+        data: dict[str, str] | None = None,
+    ) -> list[T]:
+        """
+        Send a request to the given endpoint and stream the response into typed records.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :param factory: The function turning the fields of a row into a record.
+        :type factory: Callable[[dict[str, str]], T]
+        :param data: The form data to send with the request.
+        :type data: dict[str, str] | None
+        :return: The records.
+        :rtype: list[T]
+        """
+        return list(iter_records(cls._fetch(endpoint, data), factory))
+
+    @classmethod
+    def get_current_route_records(cls) -> list[Route]:
+        """
+        Get information on all routes as typed records.
+
+        :return: The current routes.
+        :rtype: list[Route]
+        """
+
+        return cls._request_records("GetCurrentRoutes", Route.from_fields)
+
+    @classmethod
+    def get_current_bus_positions(cls) -> list[BusPosition]:
+        """
+        Get the latest position of every bus as typed records.
+
+        :return: The bus positions.
+        :rtype: list[BusPosition]
+        """
+
+        return cls._request_records("GetCurrentBusInfo", BusPosition.from_fields)
+
+    @classmethod
+    def get_nearest_stop_records(
+        cls, latitude: float = 0.0, longitude: float = 0.0, noOfStops: int = 0
+    ) -> list[Stop]:
+        """
+        Get the nearest stops to a given set of GPS coordinates as typed records.
+
+        :param latitude: The latitude of the GPS coordinates.
+        :type latitude: float
+        :param longitude: The longitude of the GPS coordinates.
+        :type longitude: float
+        :param noOfStops: The number of stops to return.
+        :type noOfStops: int
+        :return: The nearest stops.
+        :rtype: list[Stop]
+        """
+
+        data = {
+            "latitude": str(latitude),
+            "longitude": str(longitude),
+            "noOfStops": str(noOfStops),
+            "serviceDate": datetime.now().strftime("%m/%d/%y"),
+        }
+
+        return cls._request_records("GetNearestStops", Stop.from_fields, data)
+
+    @classmethod
+    def get_scheduled_stop_records(
+        cls, route_short_name: str = "", service_date: str = ""
+    ) -> list[Stop]:
+        """
+        Get the scheduled stops of a given route as typed records.
+
+        :param route_short_name: The short name of the route.
+        :type route_short_name: str
+        :param service_date: The date of the service.
+        :type service_date: str
+        :return: The scheduled stops.
+        :rtype: list[Stop]
+        """
+
+        data = {
+            "routeShortName": route_short_name,
+            "serviceDate": service_date,
+        }
+
+        return cls._request_records("GetScheduledStopInfo", Stop.from_fields, data)
+
+    @classmethod
+    def get_departure_records(
+        cls, route_short_name: str = "", num_of_trips: int = 0, service_date: str = ""
+    ) -> list[Departure]:
+        """
+        Get the arrival and departure times for every stop on a given route as typed records.
+
+        :param route_short_name: The short name of the route.
+        :type route_short_name: str
+        :param num_of_trips: The number of trips to return.
+        :type num_of_trips: int
+        :param service_date: The date of the service.
+        :type service_date: str
+        :return: The stop times.
+        :rtype: list[Departure]
+        """
+
+        data = {
+            "routeShortName": route_short_name,
+            "numOfTrips": str(num_of_trips),
+            "serviceDate": service_date,
+        }
+
+        return cls._request_records(
+            "GetArrivalAndDepartureTimes", Departure.from_fields, data
+        )
+
+
+def as_list(value: Any) -> list[Any]:
+    """
+    Normalize a parsed XML node to a list. xmltodict returns a single dict when an element
+    appears once and a list when it repeats.
+
+    :param value: The parsed node.
+    :type value: Any
+    :return: The node as a list.
+    :rtype: list[Any]
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
@@ -0,0 +1,174 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Iterator, TypeVar
+
+from lxml import etree
+
+_TIME_PATTERN = re.compile(
+    r"(\d{1,2})/(\d{1,2})/(\d{2,4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([AP]M)?",
+    re.IGNORECASE,
+)
+
+
+def parse_bt4u_time(text: str) -> datetime | None:
+    """
+    Parse a timestamp in the "M/D/YYYY h:mm:ss AM" format used by BT4U, or ISO 8601.
+
+    :param text: The timestamp.
+    :type text: str
+    :return: The parsed timestamp, or None if it is empty or malformed.
+    :rtype: datetime | None
+    """
+    if not text:
+        return None
+    match = _TIME_PATTERN.match(text)
+    if match is None:
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    month, day, year, hour, minute, second, meridiem = match.groups()
+    year = int(year) + (2000 if len(year) == 2 else 0)
+    hour = int(hour)
+    if meridiem is not None:
+        hour = hour % 12 + (12 if meridiem.upper() == "PM" else 0)
+    return datetime(year, int(month), int(day), hour, int(minute), int(second or 0))
+
+
+def _float(text: str | None) -> float:
+    return float(text) if text else 0.0
+
+
+@dataclass(slots=True)
+class Stop:
+    """
+    A bus stop, as returned by GetNearestStops and GetScheduledStopInfo.
+    """
+
+    code: str
+    name: str
+    latitude: float
+    longitude: float
+    distance: float | None = None
+
+    @classmethod
+    def from_fields(cls, fields: dict[str, str]) -> "Stop":
+        distance = fields.get("Distance")
+        return cls(
+            fields.get("StopCode", ""),
+            fields.get("StopName", ""),
+            _float(fields.get("Latitude")),
+            _float(fields.get("Longitude")),
+            float(distance) if distance else None,
+        )
+
+
+@dataclass(slots=True)
+class Route:
+    """
+    A bus route, as returned by GetCurrentRoutes.
+    """
+
+    short_name: str
+    name: str
+    color: str
+
+    @classmethod
+    def from_fields(cls, fields: dict[str, str]) -> "Route":
+        return cls(
+            fields.get("RouteShortName", ""),
+            fields.get("RouteName", ""),
+            fields.get("RouteColor", ""),
+        )
+
+
+@dataclass(slots=True)
+class Departure:
+    """
+    A scheduled stop time of a trip, as returned by GetArrivalAndDepartureTimes and
+    GetNextDepartures.
+    """
+
+    route_short_name: str
+    trip_id: str
+    stop_code: str
+    arrival: datetime | None
+    departure: datetime | None
+
+    @classmethod
+    def from_fields(cls, fields: dict[str, str]) -> "Departure":
+        arrival = parse_bt4u_time(
+            fields.get("CalculatedArrivalTime") or fields.get("ArrivalTime", "")
+        )
+        departure = parse_bt4u_time(
+            fields.get("CalculatedDepartureTime") or fields.get("DepartureTime", "")
+        )
+        return cls(
+            fields.get("RouteShortName", ""),
+            fields.get("TripID", ""),
+            fields.get("StopCode", ""),
+            arrival or departure,
+            departure or arrival,
+        )
+
+
+@dataclass(slots=True)
+class BusPosition:
+    """
+    The latest reported position of a bus, as returned by GetCurrentBusInfo.
+    """
+
+    vehicle: str
+    route_short_name: str
+    latitude: float
+    longitude: float
+    direction: float
+    speed: float
+    reported: datetime | None
+
+    @classmethod
+    def from_fields(cls, fields: dict[str, str]) -> "BusPosition":
+        return cls(
+            fields.get("AgencyVehicleName", ""),
+            fields.get("RouteShortName", ""),
+            _float(fields.get("Latitude")),
+            _float(fields.get("Longitude")),
+            _float(fields.get("Direction")),
+            _float(fields.get("Speed")),
+            parse_bt4u_time(fields.get("LastUpdated", "")),
+        )
+
+
+T = TypeVar("T")
+
+
+def iter_records(content: bytes, factory: Callable[[dict[str, str]], T]) -> Iterator[T]:
+    """
+    Incrementally parse a BT4U response and yield one record per row. Every child of the
+    DocumentElement is a row and its children are the fields. Rows are discarded as soon as
+    they are converted, so memory stays flat for large responses.
+
+    :param content: The raw response body.
+    :type content: bytes
+    :param factory: The function turning the fields of a row into a record, such as
+        Stop.from_fields.
+    :type factory: Callable[[dict[str, str]], T]
+    :return: The records, in document order.
+    :rtype: Iterator[T]
+    """
+    for _, element in etree.iterparse(BytesIO(content), events=("end",)):
+        parent = element.getparent()
+        if parent is None or parent.getparent() is not None:
+            continue
+        yield factory(
+            {
+                child.tag.rpartition("}")[2]: child.text or ""
+                for child in element
+                if isinstance(child.tag, str)
+            }
+        )
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, ClassVar
+
+from cache_handler import CacheHandler
+
+
+class BuildingRegistry:
+    """
+    A process-wide, in-memory copy of a cached JSON table such as addresses.json. The file is
+    parsed once; a background thread keeps the cache fresh without blocking readers, watches
+    the file's modification time and swaps in a newly parsed table when it changes, so
+    readers never touch the disk. The thread runs until stop is called.
+
+    :author: Barrett Wise
+    :date: 2/10/25
+    """
+
+    _registries: ClassVar[dict[Path, "BuildingRegistry"]] = {}
+    _registries_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        cache_file: str,
+        update_function: Callable = lambda: None,
+        depends_on: list[str] | None = None,
+        poll_interval: float = 5.0,
+        cache_check_interval: float = 600.0,
+        block_when_empty: bool = True,
+    ) -> None:
+        """
+        :param cache_file: The JSON file holding the table.
+        :type cache_file: str
+        :param update_function: The function to call to update the cache.
+        :type update_function: Callable
+        :param depends_on: Files the table is derived from; see CacheHandler.
+        :type depends_on: list[str] | None
+        :param poll_interval: How often to check the file for changes in seconds.
+        :type poll_interval: float
+        :param cache_check_interval: How often to check whether the cache needs updating in
+            seconds.
+        :type cache_check_interval: float
+        :param block_when_empty: Whether a missing table is built before the registry is
+            returned. When False it is built in the background and the table stays empty
+            until it is ready.
+        :type block_when_empty: bool
+        """
+        self.cache = CacheHandler(
+            cache_file=cache_file,
+            update_function=update_function,
+            depends_on=depends_on,
+            stale_while_revalidate=True,
+            block_when_empty=block_when_empty,
+        )
+        self.poll_interval = poll_interval
+        self.cache_check_interval = cache_check_interval
+        self.table: dict[str, Any] = {}
+        self.version = 0
+        self._load()
+        self._stop_event = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    @classmethod
+    def shared(
+        cls,
+        cache_file: str,
+        update_function: Callable = lambda: None,
+        depends_on: list[str] | None = None,
+        block_when_empty: bool = True,
+    ) -> "BuildingRegistry":
+        """
+        Get the registry for a file, loading it on first use.
+
+        :param cache_file: The JSON file holding the table.
+        :type cache_file: str
+        :param update_function: The function to call to update the cache.
+        :type update_function: Callable
+        :param depends_on: Files the table is derived from; see CacheHandler.
+        :type depends_on: list[str] | None
+        :param block_when_empty: Whether a missing table is built before returning.
+        :type block_when_empty: bool
+        :return: The registry for the file.
+        :rtype: BuildingRegistry
+        """
+        path = Path(cache_file).resolve()
+        with cls._registries_lock:
+            if path not in cls._registries:
+                cls._registries[path] = BuildingRegistry(
+                    cache_file,
+                    update_function,
+                    depends_on,
+                    block_when_empty=block_when_empty,
+                )
+            return cls._registries[path]
+
+    @classmethod
+    def version_of(cls, cache_file: str) -> int:
+        """
+        Get the version of a table without loading it: the modification time of the copy
+        its registry holds, or of the file itself if no registry has loaded it yet.
+
+        :param cache_file: The JSON file holding the table.
+        :type cache_file: str
+        :return: The modification time in nanoseconds, or 0 if the file does not exist.
+        :rtype: int
+        """
+        path = Path(cache_file).resolve()
+        registry = cls._registries.get(path)
+        if registry is not None and registry.version:
+            return registry.version
+        return path.stat().st_mtime_ns if path.exists() else 0
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait for a background update of the table in progress to finish and load it.
+
+        :param timeout: The longest to wait in seconds, or None to wait as long as it takes.
+        :type timeout: float | None
+        :return: Whether the table has any entries.
+        :rtype: bool
+        """
+        self.cache.wait(timeout)
+        self._load()
+        return bool(self.table)
+
+    def _load(self) -> None:
+        """
+        Parse the file if it changed since the last load and swap the new table in.
+
+        :return: None
+        """
+        version = self.cache.cache_file.stat().st_mtime_ns
+        if version == self.version:
+            return
+        text = self.cache.cache_file.read_text()
+        if not text:
+            return
+        table = json.loads(text)
+        # The table is only replaced once fully parsed, so readers never see a partial one.
+        self.table = table
+        self.version = version
+        print(f"Loaded {len(table)} entries from {self.cache.cache_file}.")
+
+    def stop(self) -> None:
+        """
+        Stop watching the file. The last loaded table stays available.
+
+        :return: None
+        """
+        self._stop_event.set()
+        self._watcher.join()
+
+    def _watch(self) -> None:
+        last_cache_check = time.monotonic()
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                if time.monotonic() - last_cache_check >= self.cache_check_interval:
+                    last_cache_check = time.monotonic()
+                    self.cache.cache_update()
+                self._load()
+            except Exception as e:
+                print(f"Failed to reload {self.cache.cache_file}: {e}")
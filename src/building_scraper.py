@@ -0,0 +1,251 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import requests
+from lxml import html
+
+from schedule import Address, GeocodeUnavailableError
+from transport import Transport
+
+
+class BuildingScraper:
+    """
+    A class to scrape the addresses of the buildings on the Virginia Tech campus from the VT
+    website. Building pages are fetched concurrently with conditional requests, and progress is
+    checkpointed so an interrupted run resumes where it stopped. Buildings whose page is gone
+    or whose address cannot be geocoded are skipped for the run; other failures are retried.
+
+    :author: Barrett Wise
+    :date: 2/6/25
+    :var _INDEX_URL: The URL of the page listing every building.
+    """
+
+    _INDEX_URL = "https://www.vt.edu/about/locations/buildings.html"
+
+    def __init__(
+        self,
+        address_file: str = "../data/addresses.json",
+        checkpoint_file: str = "../data/scrape_checkpoint.json",
+        max_workers: int = 8,
+        timeout: float = 10.0,
+    ) -> None:
+        """
+        :param address_file: The address table from the previous run, used to keep the
+            coordinates of unchanged buildings.
+        :type address_file: str
+        :param checkpoint_file: The file to save scraping progress and page validators to.
+        :type checkpoint_file: str
+        :param max_workers: The maximum number of building pages fetched at once.
+        :type max_workers: int
+        :param timeout: The timeout for each page request in seconds.
+        :type timeout: float
+        """
+        self.address_file = Path(address_file)
+        self.checkpoint_file = Path(checkpoint_file)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = Transport.adapter(pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _load_checkpoint(self) -> dict[str, Any]:
+        """
+        Load the checkpoint, starting a new run if the previous one completed.
+
+        :return: The checkpoint.
+        :rtype: dict[str, Any]
+        """
+        checkpoint = {"run_started": "", "completed": True, "buildings": {}}
+        if self.checkpoint_file.exists() and self.checkpoint_file.stat().st_size > 0:
+            checkpoint = json.loads(self.checkpoint_file.read_text())
+        if checkpoint["completed"]:
+            checkpoint["run_started"] = datetime.now().isoformat()
+            checkpoint["completed"] = False
+        else:
+            print(f"Resuming building scrape started {checkpoint['run_started']}.")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+        """
+        Write the checkpoint through a temporary file so an interruption never leaves it
+        half written.
+
+        :param checkpoint: The checkpoint.
+        :type checkpoint: dict[str, Any]
+        :return: None
+        """
+        temp_file = self.checkpoint_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(checkpoint))
+        os.replace(temp_file, self.checkpoint_file)
+
+    def _scrape_building(
+        self, link: str, entry: dict[str, Any], previous: dict[str, Any] | None
+    ) -> dict[str, Any]:
+        """
+        Fetch a building page and resolve its address. Unchanged pages and unchanged street
+        addresses keep their previous coordinates.
+
+        :param link: The URL of the building page.
+        :type link: str
+        :param entry: The checkpoint entry of the building from the previous run.
+        :type entry: dict[str, Any]
+        :param previous: The address of the building from the previous run.
+        :type previous: dict[str, Any] | None
+        :return: The new checkpoint entry of the building.
+        :rtype: dict[str, Any]
+        """
+        headers = {}
+        if previous is not None and entry.get("url") == link:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        page = self.session.get(link, headers=headers, timeout=self.timeout)
+        if page.status_code == 304:
+            return {**entry, "address": previous}
+        page.raise_for_status()
+
+        new_entry = {
+            "url": link,
+            "etag": page.headers.get("ETag", ""),
+            "last_modified": page.headers.get("Last-Modified", ""),
+            "address": None,
+        }
+        street = html.fromstring(page.content).xpath(
+            '//address [@class="vt-building-address"]/text()'
+        )
+        if not street:
+            return new_entry
+        if previous is not None and previous.get("street") == street[0]:
+            new_entry["address"] = previous
+        else:
+            # Coordinates are resolved in bulk once every page has been scraped.
+            new_entry["address"] = Address(
+                street[0],
+                "Blacksburg",
+                "Virginia",
+                "24061",
+                "United States",
+            ).to_dict(resolve=False)
+        return new_entry
+
+    def _geocode_pending(self, entries: dict[str, dict[str, Any]]) -> None:
+        """
+        Geocode every scraped address that has no coordinates yet in batched requests.
+        Buildings whose address cannot be resolved are marked as skipped.
+
+        :param entries: The checkpoint entries of the buildings.
+        :type entries: dict[str, dict[str, Any]]
+        :return: None
+        """
+        pending = [
+            entry
+            for entry in entries.values()
+            if entry.get("address")
+            and entry["address"]["latitude"] is None
+            and not entry.get("skipped")
+        ]
+        if not pending:
+            return
+        print(f"Geocoding {len(pending)} addresses...")
+        addresses = [Address.from_dict(entry["address"]) for entry in pending]
+        results = Address.batch_convert_addresses_to_gps(addresses)
+        for entry, result in zip(pending, results):
+            address = entry["address"]
+            if isinstance(result, GeocodeUnavailableError):
+                print(f"Failed to geocode {address['street']}: {result}")
+            elif isinstance(result, ValueError):
+                print(f"Skipping {address['street']}, it could not be geocoded: {result}")
+                entry["skipped"] = str(result)
+            else:
+                address["latitude"], address["longitude"] = result
+
+    def scrape(self) -> dict[str, dict[str, Any]]:
+        """
+        Scrape the address of every building, resuming an interrupted run if there is one.
+
+        :return: A dictionary containing the addresses of all the buildings on the Virginia
+            Tech campus.
+        :rtype: dict[str, dict[str, Any]]
+        """
+        page = self.session.get(self._INDEX_URL, timeout=self.timeout)
+        page.raise_for_status()
+        tree = html.fromstring(page.content)
+        building_links = {
+            building.text.strip(): building.attrib["href"]
+            for building in tree.xpath('//li [@class="vt-subnav-droplist-item "]/a')
+        }
+
+        previous_addresses = {}
+        if self.address_file.exists() and self.address_file.stat().st_size > 0:
+            previous_addresses = json.loads(self.address_file.read_text())
+        checkpoint = self._load_checkpoint()
+        entries = checkpoint["buildings"]
+        pending = {
+            building: link
+            for building, link in building_links.items()
+            if entries.get(building, {}).get("scraped", "") < checkpoint["run_started"]
+        }
+        print(f"Scraping {len(pending)} of {len(building_links)} buildings...")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._scrape_building,
+                    link,
+                    entries.get(building, {}),
+                    previous_addresses.get(building),
+                ): building
+                for building, link in pending.items()
+            }
+            for future in as_completed(futures):
+                building = futures[future]
+                try:
+                    entry = future.result()
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else 0
+                    if not 400 <= status < 500:
+                        print(f"Failed to scrape {building}: {e}")
+                        continue
+                    # The page is gone or refused; retrying within this run will not help.
+                    print(f"Skipping {building}: {e}")
+                    entry = {"url": pending[building], "address": None, "skipped": str(e)}
+                except Exception as e:
+                    print(f"Failed to scrape {building}: {e}")
+                    continue
+                entry["scraped"] = datetime.now().isoformat()
+                entries[building] = entry
+                self._save_checkpoint(checkpoint)
+
+        self._geocode_pending(entries)
+        self._save_checkpoint(checkpoint)
+
+        failed = [
+            building
+            for building in building_links
+            if entries.get(building, {}).get("scraped", "") < checkpoint["run_started"]
+            or (
+                entries[building]["address"] is not None
+                and entries[building]["address"]["latitude"] is None
+                and not entries[building].get("skipped")
+            )
+        ]
+        if failed:
+            raise RuntimeError(
+                f"Failed to scrape {len(failed)} buildings; rerun to resume."
+            )
+        checkpoint["completed"] = True
+        self._save_checkpoint(checkpoint)
+
+        return {
+            building: entries[building]["address"]
+            for building in building_links
+            if entries[building]["address"] is not None
+            and not entries[building].get("skipped")
+        }
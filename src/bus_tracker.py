@@ -0,0 +1,241 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import ClassVar
+
+import numpy as np
+
+from bt4u_interface import BT4U_Interface as bt4u
+from bt4u_records import BusPosition
+
+
+@dataclass(slots=True)
+class PositionDelta:
+    """
+    The vehicles that changed since a consumer's last read.
+    """
+
+    cursor: int
+    positions: list[BusPosition]
+    removed: list[str]
+    reset: bool = False
+
+
+class BusTracker:
+    """
+    One shared poller of the live vehicle feed. GetCurrentBusInfo is fetched at a fixed
+    cadence no matter how many users are watching, and every change in a vehicle's position
+    is appended to a ring buffer of compact NumPy columns under an increasing sequence
+    number. Readers keep the last sequence number they saw and get back only the latest
+    state of each vehicle that changed since. Cursors are offset by a random base per tracker,
+    so a cursor from another process or from before a restart is recognized and answered
+    with a full snapshot.
+
+    :author: Barrett Wise
+    :date: 3/14/25
+    """
+
+    _shared: ClassVar["BusTracker | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, interval: float = 5.0, capacity: int = 4096) -> None:
+        """
+        :param interval: The time between polls in seconds.
+        :type interval: float
+        :param capacity: The number of position changes kept in the ring buffer.
+        :type capacity: int
+        """
+        self.interval = interval
+        self.capacity = capacity
+        self.sequence = 0
+        self._base = random.randrange(1, 2**31) << 32
+        self.updated: datetime | None = None
+        self.vehicles: list[str] = []
+        self.routes: list[str] = []
+        self._vehicle_index: dict[str, int] = {}
+        self._route_index: dict[str, int] = {}
+        self._latest: dict[str, BusPosition] = {}
+
+        # Row i of the ring holds change number seq[i]; 0 marks an empty row. A NaN
+        # latitude records a vehicle leaving the feed.
+        self._seq = np.zeros(capacity, dtype=np.int64)
+        self._vehicle = np.zeros(capacity, dtype=np.int32)
+        self._route = np.zeros(capacity, dtype=np.int32)
+        self._latitude = np.zeros(capacity, dtype=np.float64)
+        self._longitude = np.zeros(capacity, dtype=np.float64)
+        self._direction = np.zeros(capacity, dtype=np.float64)
+        self._speed = np.zeros(capacity, dtype=np.float64)
+        self._reported = np.zeros(capacity, dtype=np.int64)
+
+        self._lock = threading.Lock()
+        self._poll_thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def shared(cls) -> "BusTracker":
+        """
+        Get the process-wide tracker, starting its poller on first use.
+
+        :return: The shared tracker.
+        :rtype: BusTracker
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = BusTracker()
+                cls._shared.start()
+            return cls._shared
+
+    def _code(self, names: list[str], index: dict[str, int], name: str) -> int:
+        if name not in index:
+            index[name] = len(names)
+            names.append(name)
+        return index[name]
+
+    def _append(self, vehicle: str, position: BusPosition | None) -> None:
+        self.sequence += 1
+        row = self.sequence % self.capacity
+        self._seq[row] = self.sequence
+        self._vehicle[row] = self._code(self.vehicles, self._vehicle_index, vehicle)
+        if position is None:
+            self._latitude[row] = np.nan
+            return
+        self._route[row] = self._code(
+            self.routes, self._route_index, position.route_short_name
+        )
+        self._latitude[row] = position.latitude
+        self._longitude[row] = position.longitude
+        self._direction[row] = position.direction
+        self._speed[row] = position.speed
+        self._reported[row] = (
+            int(position.reported.timestamp()) if position.reported else 0
+        )
+
+    def update(self, positions: list[BusPosition]) -> int:
+        """
+        Record a new snapshot of the feed. Only vehicles that moved, changed route or
+        reported anew, and vehicles that left the feed, are appended.
+
+        :param positions: The position of every vehicle in the feed.
+        :type positions: list[BusPosition]
+        :return: The number of changes appended.
+        :rtype: int
+        """
+        latest = {position.vehicle: position for position in positions}
+        with self._lock:
+            start = self.sequence
+            for vehicle, position in latest.items():
+                if self._latest.get(vehicle) != position:
+                    self._append(vehicle, position)
+            for vehicle in self._latest.keys() - latest.keys():
+                self._append(vehicle, None)
+            self._latest = latest
+            self.updated = datetime.now()
+            return self.sequence - start
+
+    def poll(self) -> int:
+        """
+        Fetch the feed once and record it.
+
+        :return: The number of changes appended.
+        :rtype: int
+        """
+        return self.update(bt4u.get_current_bus_positions())
+
+    def start(self) -> None:
+        """
+        Poll the feed every interval seconds in a background thread. Polls are scheduled on
+        a fixed cadence, so slow responses do not make the schedule drift.
+
+        :return: None
+        """
+        if self._poll_thread is not None and self._poll_thread.is_alive():
+            return
+        self._stop_event.clear()
+
+        def run() -> None:
+            due = time.monotonic()
+            while not self._stop_event.is_set():
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"Bus position poll failed: {e}")
+                due += self.interval
+                # Skip polls that were missed entirely instead of bursting to catch up.
+                while due < time.monotonic():
+                    due += self.interval
+                self._stop_event.wait(due - time.monotonic())
+
+        self._poll_thread = threading.Thread(target=run, daemon=True)
+        self._poll_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background poller. It can be started again with start.
+
+        :return: None
+        """
+        self._stop_event.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join()
+            self._poll_thread = None
+
+    def latest(self) -> list[BusPosition]:
+        """
+        Get the latest snapshot of the feed.
+
+        :return: The position of every vehicle currently in the feed.
+        :rtype: list[BusPosition]
+        """
+        return list(self._latest.values())
+
+    def changes_since(self, cursor: int = 0) -> PositionDelta:
+        """
+        Get the latest state of every vehicle that changed after a given sequence number.
+
+        :param cursor: The cursor of the consumer's last read, or 0 on the first read.
+        :type cursor: int
+        :return: The changes and the cursor to pass next time. On the first read, once the
+            changes since cursor have left the ring buffer, or if cursor came from another
+            tracker (another process, or before a restart), the whole snapshot is returned
+            with reset set.
+        :rtype: PositionDelta
+        """
+        with self._lock:
+            sequence = self.sequence
+            seen = cursor - self._base
+            if seen <= 0 or seen > sequence or seen < sequence - self.capacity:
+                return PositionDelta(
+                    self._base + sequence, list(self._latest.values()), [], reset=True
+                )
+
+            rows = np.flatnonzero(self._seq > seen)
+            rows = rows[np.argsort(self._seq[rows])[::-1]]
+            _, first = np.unique(self._vehicle[rows], return_index=True)
+            rows = rows[first]
+            vehicle = self._vehicle[rows].tolist()
+            route = self._route[rows].tolist()
+            latitude = self._latitude[rows].tolist()
+            longitude = self._longitude[rows].tolist()
+            direction = self._direction[rows].tolist()
+            speed = self._speed[rows].tolist()
+            reported = self._reported[rows].tolist()
+
+        positions, removed = [], []
+        for i in range(len(rows)):
+            if np.isnan(latitude[i]):
+                removed.append(self.vehicles[vehicle[i]])
+                continue
+            positions.append(
+                BusPosition(
+                    self.vehicles[vehicle[i]],
+                    self.routes[route[i]],
+                    latitude[i],
+                    longitude[i],
+                    direction[i],
+                    speed[i],
+                    datetime.fromtimestamp(reported[i]) if reported[i] else None,
+                )
+            )
+        return PositionDelta(self._base + sequence, positions, removed)
@@ -1,22 +1,47 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from json import dumps
 from pathlib import Path
-from typing import Callable
+from typing import Any, Callable, ClassVar, Iterator
+
+from metrics import Metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows; only the in-process lock applies.
+    fcntl = None
 
 
 class CacheHandler:
     """
     A class to handle the caching of data.
 
+    Refreshes are single-flight: a lock per cache file stops threads of this process, and an
+    advisory lock file stops other processes, from refreshing the same cache at once. New data
+    is written to a temporary file and renamed over the cache, so readers never see a partial
+    or empty cache and a failed refresh leaves the old data in place.
+
     :author: Barrett Wise
     :date: 1/22/25
     """
 
+    _refresh_locks: ClassVar[dict[Path, threading.Lock]] = {}
+    _refresh_locks_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(
         self,
         cache_file: str = "",
         update_freq: int = 72,
         update_function: Callable = lambda: None,
+        depends_on: list[str] | None = None,
+        stale_while_revalidate: bool = False,
+        block_when_empty: bool = True,
     ) -> None:
         """
         :param cache_file: The file to cache the data to and from.
@@ -25,6 +50,15 @@ class CacheHandler:
         :type update_freq: int
         :param update_function: The function to call to update the cache.
         :type update_function: Callable
+        :param depends_on: Files the cached data is derived from. The cache is also updated
+            whenever one of them is newer than the cache file.
+        :type depends_on: list[str] | None
+        :param stale_while_revalidate: Whether to keep serving an outdated cache while it is
+            updated in a background thread instead of updating it inline.
+        :type stale_while_revalidate: bool
+        :param block_when_empty: Whether an empty cache is filled inline. When False it is
+            filled in a background thread too, and stays empty until that succeeds.
+        :type block_when_empty: bool
         """
         if not Path(cache_file).exists():
             print("Cache file does not exist. Creating cache file...")
@@ -32,27 +66,536 @@ class CacheHandler:
         self.cache_file = Path(cache_file)
         self.update_freq = update_freq
         self.update_function = update_function
+        self.depends_on = [Path(path) for path in depends_on or []]
+        self.stale_while_revalidate = stale_while_revalidate
+        self.block_when_empty = block_when_empty
+        self._refresh_thread: threading.Thread | None = None
         self.cache_update()
 
+    def is_stale(self) -> bool:
+        """
+        Checks whether the cache file is older than the update frequency, older than any file
+        it depends on, or empty.
+
+        :return: Whether the cache needs updating.
+        :rtype: bool
+        """
+        stat = self.cache_file.stat()
+        last_modified = datetime.fromtimestamp(stat.st_mtime)
+        time_since_mod = datetime.now() - last_modified
+        is_outdated = any(
+            dependency.exists() and dependency.stat().st_mtime > stat.st_mtime
+            for dependency in self.depends_on
+        )
+        return (
+            time_since_mod.total_seconds() / 3600 > self.update_freq
+            or stat.st_size == 0
+            or is_outdated
+        )
+
     def cache_update(self) -> None:
         """
         Checks the modification time of the cache file and updates the cache if it is older than
-        the update frequency or if the cache file is empty or does not exist.
+        the update frequency, older than any file it depends on, or if the cache file is empty
+        or does not exist.
 
         :return: None
         """
         self.cache_file = Path(self.cache_file)
-        last_modified = datetime.fromtimestamp(self.cache_file.stat().st_mtime)
-        time_since_mod = datetime.now() - last_modified
+        if not self.is_stale():
+            print("Cache is up to date.")
+            return
+
         is_empty = self.cache_file.stat().st_size == 0
-        if time_since_mod.total_seconds() / 3600 > self.update_freq or is_empty:
-            print("Updating cache...")
-            if not is_empty:
-                open(self.cache_file, "w").close()  # Clear the cache file
-                print("Cache cleared.")
-            new_data = self.update_function(update=True)
-            print("Data fetched.")
-            self.cache_file.write_text(dumps(new_data))
-            print("Cache updated.")
+        if (self.stale_while_revalidate and not is_empty) or (
+            is_empty and not self.block_when_empty
+        ):
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            print("Updating the cache in the background...")
+            self._refresh_thread = threading.Thread(
+                target=self._refresh, kwargs={"blocking": False}, daemon=True
+            )
+            self._refresh_thread.start()
         else:
-            print("Cache is up to date.")
+            self._refresh(blocking=True)
+
+    def wait(self, timeout: float | None = None) -> None:
+        """
+        Wait for a background update in progress to finish.
+
+        :param timeout: The longest to wait in seconds, or None to wait as long as it takes.
+        :type timeout: float | None
+        :return: None
+        """
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _refresh(self, blocking: bool) -> None:
+        """
+        Fetch new data and atomically replace the cache, unless another thread or process is
+        already doing so.
+
+        :param blocking: Whether to wait for a refresh in progress elsewhere and raise if the
+            update fails. When False the refresh is skipped if one is already running.
+        :type blocking: bool
+        :return: None
+        """
+        with CacheHandler._refresh_locks_lock:
+            lock = CacheHandler._refresh_locks.setdefault(
+                self.cache_file.resolve(), threading.Lock()
+            )
+        if not lock.acquire(blocking=blocking):
+            return
+        try:
+            with self._process_lock(blocking) as acquired:
+                # Another thread or process may have refreshed it while we waited.
+                if not acquired or not self.is_stale():
+                    return
+                print("Updating cache...")
+                try:
+                    with Metrics.shared().span("cache_refresh", file=self.cache_file.name):
+                        new_data = self.update_function(update=True)
+                except Exception as e:
+                    print(f"Cache update failed, keeping the existing cache: {e}")
+                    if blocking:
+                        raise
+                    return
+                print("Data fetched.")
+                self._write(json.dumps(new_data))
+                print("Cache updated.")
+        finally:
+            lock.release()
+
+    @contextmanager
+    def _process_lock(self, blocking: bool) -> Iterator[bool]:
+        """
+        Hold an advisory lock on a file next to the cache for the duration of the block.
+
+        :param blocking: Whether to wait for the lock.
+        :type blocking: bool
+        :return: Whether the lock was acquired.
+        :rtype: Iterator[bool]
+        """
+        if fcntl is None:
+            yield True
+            return
+        lock_file = self.cache_file.with_name(self.cache_file.name + ".lock")
+        with open(lock_file, "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, text: str) -> None:
+        """
+        Replace the cache file with the given text through a temporary file and a rename.
+
+        :param text: The new contents of the cache.
+        :type text: str
+        :return: None
+        """
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.cache_file.parent, prefix=self.cache_file.name, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.cache_file)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+
+class TieredCache:
+    """
+    A keyed cache with a size-bounded in-memory LRU tier over an SQLite disk tier. Entries live
+    in namespaces, each with its own time to live, and hits, misses, expirations and evictions
+    are counted per namespace. Values are stored as JSON, except bytes, which are stored as
+    they are.
+
+    A hit in either tier also marks the entry as used on disk, so the disk tier evicts what
+    is least recently used overall. Access times are collected in memory and written in one
+    batch every flush_interval seconds, and before the disk tier is evicted. Memory hits
+    never wait on the disk, which has a lock of its own. Pinned namespaces are kept out of
+    disk eviction.
+
+    :author: Barrett Wise
+    :date: 2/14/25
+    """
+
+    _shared: ClassVar["TieredCache | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        cache_file: str = "../data/cache.sqlite",
+        memory_size: int = 4096,
+        disk_size: int = 100_000,
+        flush_interval: float = 30.0,
+    ) -> None:
+        """
+        :param cache_file: The SQLite file backing the disk tier.
+        :type cache_file: str
+        :param memory_size: The maximum number of entries kept in memory.
+        :type memory_size: int
+        :param disk_size: The maximum number of entries of unpinned namespaces kept on disk.
+        :type disk_size: int
+        :param flush_interval: How often access times are written to disk in seconds.
+        :type flush_interval: float
+        """
+        self.cache_file = Path(cache_file)
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.flush_interval = flush_interval
+        self.counters: dict[tuple[str, str], int] = {}
+        self._memory: OrderedDict[tuple[str, str], tuple[float | None, Any]] = (
+            OrderedDict()
+        )
+        self._accessed: dict[tuple[str, str], float] = {}
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._db = sqlite3.connect(self.cache_file, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, "
+            "expires REAL, accessed REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS pinned (namespace TEXT PRIMARY KEY)")
+        self._db.commit()
+        self._pinned = {
+            namespace for (namespace,) in self._db.execute("SELECT namespace FROM pinned")
+        }
+        self._disk_count = self._count_unpinned()
+        Metrics.shared().track_cache(self.cache_file.name, self)
+
+    @classmethod
+    def shared(cls) -> "TieredCache":
+        """
+        Get the process-wide cache.
+
+        :return: The shared cache.
+        :rtype: TieredCache
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = TieredCache()
+            return cls._shared
+
+    def _count(self, namespace: str, event: str, amount: int = 1) -> None:
+        with self._counters_lock:
+            self.counters[(namespace, event)] = (
+                self.counters.get((namespace, event), 0) + amount
+            )
+
+    def _count_unpinned(self) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM entries "
+            "WHERE namespace NOT IN (SELECT namespace FROM pinned)"
+        ).fetchone()[0]
+
+    def pin(self, namespace: str) -> None:
+        """
+        Keep the entries of a namespace out of disk eviction, for data that is costly to get
+        again. They still expire, and still leave memory. Pins are stored in the cache file,
+        so they hold for every process sharing it.
+
+        :param namespace: The namespace to pin.
+        :type namespace: str
+        :return: None
+        """
+        with self._db_lock:
+            if namespace in self._pinned:
+                return
+            self._db.execute("INSERT OR IGNORE INTO pinned VALUES (?)", (namespace,))
+            self._db.commit()
+            self._pinned.add(namespace)
+            self._disk_count = self._count_unpinned()
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """
+        Get an entry, checking memory before disk. Entries found on disk are promoted to
+        memory.
+
+        :param namespace: The namespace of the entry.
+        :type namespace: str
+        :param key: The key of the entry.
+        :type key: str
+        :param default: The value to return if the entry is missing or expired.
+        :type default: Any
+        :return: The cached value, or default.
+        :rtype: Any
+        """
+        now = time.time()
+        entry_key = (namespace, key)
+        with self._lock:
+            entry = self._memory.get(entry_key)
+            fresh = entry is not None and (entry[0] is None or entry[0] > now)
+            if fresh:
+                self._memory.move_to_end(entry_key)
+                self._accessed[entry_key] = now
+            elif entry is not None:
+                # Both tiers share the expiry, so the disk copy is removed below as well.
+                del self._memory[entry_key]
+        if fresh:
+            self._count(namespace, "memory_hits")
+            self._flush_if_due()
+            return entry[1]
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                cursor = self._db.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                )
+                self._db.commit()
+                if namespace not in self._pinned:
+                    self._disk_count -= cursor.rowcount
+                self._count(namespace, "expirations")
+                row = None
+        if row is None:
+            self._count(namespace, "misses")
+            return default
+
+        value = self._decode(row[0])
+        with self._lock:
+            # Keep a value set while the disk was being read.
+            if entry_key not in self._memory:
+                self._remember(namespace, key, row[1], value)
+            self._accessed[entry_key] = now
+        self._count(namespace, "disk_hits")
+        self._flush_if_due()
+        return value
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        ttl: float | None = None,
+        persist: bool = True,
+    ) -> None:
+        """
+        Cache an entry in memory and, unless persist is False, on disk.
+
+        :param namespace: The namespace of the entry.
+        :type namespace: str
+        :param key: The key of the entry.
+        :type key: str
+        :param value: The value. It must be bytes or JSON serializable if persisted.
+        :type value: Any
+        :param ttl: The time to live in seconds, or None to keep it until evicted.
+        :type ttl: float | None
+        :param persist: Whether to also write the entry to the disk tier.
+        :type persist: bool
+        :return: None
+        """
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self._lock:
+            self._remember(namespace, key, expires, value)
+        if not persist:
+            return
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, self._encode(value), expires, now),
+            )
+            # Replacements are counted too, so this is an upper bound that eviction corrects.
+            if namespace not in self._pinned:
+                self._disk_count += cursor.rowcount
+            if self._disk_count > self.disk_size:
+                self._write_accessed(self._take_accessed())
+                self._evict_disk()
+            self._db.commit()
+
+    def import_entries(
+        self, namespace: str, entries: dict[str, Any], ttl: float | None = None
+    ) -> int:
+        """
+        Write entries straight to the disk tier, keeping any already cached.
+
+        :param namespace: The namespace of the entries.
+        :type namespace: str
+        :param entries: The values by key. They must be bytes or JSON serializable.
+        :type entries: dict[str, Any]
+        :param ttl: The time to live in seconds, or None to keep them until evicted.
+        :type ttl: float | None
+        :return: The number of entries written.
+        :rtype: int
+        """
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self._db_lock:
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [
+                    (namespace, key, self._encode(value), expires, now)
+                    for key, value in entries.items()
+                ],
+            )
+            if namespace not in self._pinned:
+                self._disk_count += cursor.rowcount
+            if self._disk_count > self.disk_size:
+                self._evict_disk()
+            self._db.commit()
+            return cursor.rowcount
+
+    def delete(self, namespace: str, key: str) -> None:
+        """
+        Remove an entry from both tiers.
+
+        :param namespace: The namespace of the entry.
+        :type namespace: str
+        :param key: The key of the entry.
+        :type key: str
+        :return: None
+        """
+        with self._lock:
+            self._memory.pop((namespace, key), None)
+            self._accessed.pop((namespace, key), None)
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+            if namespace not in self._pinned:
+                self._disk_count -= cursor.rowcount
+            self._db.commit()
+
+    def clear(self, namespace: str) -> None:
+        """
+        Remove every entry of a namespace from both tiers.
+
+        :param namespace: The namespace to clear.
+        :type namespace: str
+        :return: None
+        """
+        with self._lock:
+            for entry in [entry for entry in self._memory if entry[0] == namespace]:
+                del self._memory[entry]
+            for entry in [entry for entry in self._accessed if entry[0] == namespace]:
+                del self._accessed[entry]
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM entries WHERE namespace = ?", (namespace,)
+            )
+            if namespace not in self._pinned:
+                self._disk_count -= cursor.rowcount
+            self._db.commit()
+
+    def flush(self) -> None:
+        """
+        Write the access times collected since the last flush to disk.
+
+        :return: None
+        """
+        accessed = self._take_accessed()
+        if not accessed:
+            return
+        with self._db_lock:
+            self._write_accessed(accessed)
+            self._db.commit()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Get the hit, miss, expiration and eviction counters of every namespace.
+
+        :return: The counters keyed by namespace and then by event.
+        :rtype: dict[str, dict[str, int]]
+        """
+        stats: dict[str, dict[str, int]] = {}
+        with self._counters_lock:
+            counters = list(self.counters.items())
+        for (namespace, event), count in counters:
+            stats.setdefault(namespace, {})[event] = count
+        return stats
+
+    @staticmethod
+    def _encode(value: Any) -> str | bytes:
+        return value if isinstance(value, bytes) else json.dumps(value)
+
+    @staticmethod
+    def _decode(stored: str | bytes) -> Any:
+        return stored if isinstance(stored, bytes) else json.loads(stored)
+
+    def _remember(
+        self, namespace: str, key: str, expires: float | None, value: Any
+    ) -> None:
+        self._memory[(namespace, key)] = (expires, value)
+        self._memory.move_to_end((namespace, key))
+        while len(self._memory) > self.memory_size:
+            (evicted_namespace, _), _ = self._memory.popitem(last=False)
+            self._count(evicted_namespace, "memory_evictions")
+
+    def _flush_if_due(self) -> None:
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def _take_accessed(self) -> dict[tuple[str, str], float]:
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._flushed = time.monotonic()
+        return accessed
+
+    def _write_accessed(self, accessed: dict[tuple[str, str], float]) -> None:
+        """
+        Write access times to disk. The caller holds the database lock and commits.
+
+        :param accessed: The time each entry was last used, by namespace and key.
+        :type accessed: dict[tuple[str, str], float]
+        :return: None
+        """
+        self._db.executemany(
+            "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ? "
+            "AND accessed < ?",
+            [(when, namespace, key, when) for (namespace, key), when in accessed.items()],
+        )
+
+    def _evict_disk(self) -> None:
+        """
+        Remove expired entries from disk, then the least recently used ones of unpinned
+        namespaces until the disk tier is a tenth below its size limit. The caller holds the
+        database lock and commits.
+
+        :return: None
+        """
+        now = time.time()
+        for (namespace,) in self._db.execute(
+            "SELECT namespace FROM entries WHERE expires IS NOT NULL AND expires <= ?",
+            (now,),
+        ).fetchall():
+            self._count(namespace, "expirations")
+        self._db.execute(
+            "DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,)
+        )
+        excess = self._count_unpinned() - self.disk_size * 9 // 10
+        if excess > 0:
+            evicted = self._db.execute(
+                "SELECT rowid, namespace FROM entries "
+                "WHERE namespace NOT IN (SELECT namespace FROM pinned) "
+                "ORDER BY accessed LIMIT ?",
+                (excess,),
+            ).fetchall()
+            self._db.executemany(
+                "DELETE FROM entries WHERE rowid = ?", [(row[0],) for row in evicted]
+            )
+            for _, namespace in evicted:
+                self._count(namespace, "disk_evictions")
+        self._disk_count = self._count_unpinned()
@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, ClassVar
+
+from cache_handler import TieredCache
+
+
+class GeocodeCache:
+    """
+    A cache of geocoding results kept in a TieredCache. Forward lookups are keyed by the
+    normalized address string and kept in the "geocode" namespace, which is pinned so they
+    are never evicted from disk: Geocodio bills every lookup and the set of addresses is
+    small. Reverse lookups are keyed by the coordinates quantized to a grid. They come from
+    wherever users happen to be, so they go in the unpinned "geocode_reverse" namespace and
+    expire like any other entry.
+
+    :author: Barrett Wise
+    :date: 2/8/25
+    """
+
+    _NAMESPACE = "geocode"
+    _REVERSE_NAMESPACE = "geocode_reverse"
+    _shared: ClassVar["GeocodeCache | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        cache: TieredCache | None = None,
+        grid_size: float = 0.0001,
+        ttl: float | None = None,
+        reverse_ttl: float | None = 30 * 24 * 3600,
+    ) -> None:
+        """
+        :param cache: The cache to store results in. Defaults to the shared TieredCache.
+        :type cache: TieredCache | None
+        :param grid_size: The size in degrees of the grid reverse lookups are quantized to.
+        :type grid_size: float
+        :param ttl: How long forward results are kept in seconds, or None to keep them
+            forever.
+        :type ttl: float | None
+        :param reverse_ttl: How long reverse results are kept in seconds, or None to keep
+            them until evicted.
+        :type reverse_ttl: float | None
+        """
+        self.cache = cache or TieredCache.shared()
+        self.cache.pin(self._NAMESPACE)
+        self.grid_size = grid_size
+        self.ttl = ttl
+        self.reverse_ttl = reverse_ttl
+
+    @classmethod
+    def shared(cls) -> "GeocodeCache":
+        """
+        Get the process-wide geocode cache.
+
+        :return: The shared geocode cache.
+        :rtype: GeocodeCache
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = GeocodeCache()
+                cls._shared.migrate()
+            return cls._shared
+
+    def migrate(self, legacy_file: str = "../data/geocode_cache.sqlite") -> int:
+        """
+        Move the results from the SQLite file geocodes used to be kept in into this cache,
+        then rename the file with a .migrated suffix so it is only read once.
+
+        :param legacy_file: The old cache file.
+        :type legacy_file: str
+        :return: The number of results moved.
+        :rtype: int
+        """
+        path = Path(legacy_file)
+        if not path.exists():
+            return 0
+        db = sqlite3.connect(path)
+        try:
+            rows = db.execute("SELECT key, value FROM geocodes").fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Could not read {path}: {e}")
+            return 0
+        finally:
+            db.close()
+        forward, reverse = {}, {}
+        for key, value in rows:
+            (reverse if key.startswith("reverse:") else forward)[key] = json.loads(value)
+        moved = self.cache.import_entries(self._NAMESPACE, forward, ttl=self.ttl)
+        moved += self.cache.import_entries(
+            self._REVERSE_NAMESPACE, reverse, ttl=self.reverse_ttl
+        )
+        try:
+            os.replace(path, path.with_name(path.name + ".migrated"))
+        except FileNotFoundError:
+            pass  # Another process migrated it at the same time.
+        print(f"Migrated {moved} geocodes from {path}.")
+        return moved
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        """
+        Normalize an address string so trivially different spellings share a key.
+
+        :param address: The address.
+        :type address: str
+        :return: The normalized address.
+        :rtype: str
+        """
+        address = re.sub(r"[.,]", " ", address.lower())
+        return " ".join(address.split())
+
+    def forward_key(self, address: str) -> str:
+        return "forward:" + self.normalize(address)
+
+    def reverse_key(self, latitude: float, longitude: float) -> str:
+        return (
+            f"reverse:{round(latitude / self.grid_size)}"
+            f":{round(longitude / self.grid_size)}"
+        )
+
+    def _locate(self, key: str) -> tuple[str, str]:
+        if key.startswith("reverse:"):
+            return self._REVERSE_NAMESPACE, key
+        return self._NAMESPACE, key
+
+    def get(self, key: str) -> Any | None:
+        """
+        Get a cached result.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The cached result, or None if it is not cached.
+        :rtype: Any | None
+        """
+        return self.cache.get(*self._locate(key))
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache a result.
+
+        :param key: The cache key.
+        :type key: str
+        :param value: The result. It must be JSON serializable.
+        :type value: Any
+        :return: None
+        """
+        namespace, key = self._locate(key)
+        ttl = self.reverse_ttl if namespace == self._REVERSE_NAMESPACE else self.ttl
+        self.cache.set(namespace, key, value, ttl=ttl)
@@ -0,0 +1,249 @@
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import ClassVar
+
+import numpy as np
+
+from timetable import Timetable
+from walking import WalkingTable
+
+
+@dataclass(slots=True)
+class Leg:
+    """
+    One ride on a bus, or one walk between stops. Times are seconds since midnight of the
+    service date.
+    """
+
+    route_short_name: str
+    trip_id: str
+    from_stop: str
+    departure: int
+    to_stop: str
+    arrival: int
+    mode: str = "bus"
+
+
+@dataclass(slots=True)
+class Itinerary:
+    """
+    A sequence of bus rides and walks from an origin stop to a destination stop. It has no
+    legs when the origin is the destination; it then departs and arrives at start.
+    """
+
+    service_date: datetime
+    legs: list[Leg]
+    start: int = 0
+
+    @property
+    def departure(self) -> int:
+        return self.legs[0].departure if self.legs else self.start
+
+    @property
+    def arrival(self) -> int:
+        return self.legs[-1].arrival if self.legs else self.start
+
+    def to_dict(self) -> dict[str, object]:
+        """
+        :return: The itinerary with its times as datetimes.
+        :rtype: dict[str, object]
+        """
+        at = lambda seconds: self.service_date + timedelta(seconds=seconds)  # noqa: E731
+        return {
+            "departure": at(self.departure),
+            "arrival": at(self.arrival),
+            "legs": [
+                {
+                    "mode": leg.mode,
+                    "route": leg.route_short_name,
+                    "trip": leg.trip_id,
+                    "from_stop": leg.from_stop,
+                    "departure": at(leg.departure),
+                    "to_stop": leg.to_stop,
+                    "arrival": at(leg.arrival),
+                }
+                for leg in self.legs
+            ],
+        }
+
+
+class JourneyPlanner:
+    """
+    A journey planner over a Timetable using a reverse Connection Scan: connections are
+    scanned from the latest arrival backwards to find the latest departure from the origin
+    that still reaches the destination by a deadline. With a WalkingTable, transfers may
+    also walk between nearby stops.
+
+    :author: Barrett Wise
+    :date: 2/22/25
+    """
+
+    _current: ClassVar["JourneyPlanner | None"] = None
+    _current_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        timetable: Timetable,
+        min_transfer: int = 60,
+        max_window: int = 3 * 3600,
+        walking: WalkingTable | None = None,
+    ) -> None:
+        """
+        :param timetable: The timetable to plan over.
+        :type timetable: Timetable
+        :param min_transfer: The minimum time in seconds to change buses at a stop.
+        :type min_transfer: int
+        :param max_window: How far before the deadline in seconds to look for departures.
+        :type max_window: int
+        :param walking: The walking times between nearby stops, or None to only transfer at
+            the same stop.
+        :type walking: WalkingTable | None
+        """
+        self.timetable = timetable
+        self.min_transfer = min_transfer
+        self.max_window = max_window
+
+        # Consecutive stop times of a trip form one connection.
+        order = np.lexsort((timetable.departure, timetable.trip))
+        trip = timetable.trip[order]
+        same_trip = np.flatnonzero(trip[:-1] == trip[1:])
+        dep_index, arr_index = order[same_trip], order[same_trip + 1]
+        by_arrival = np.argsort(timetable.arrival[arr_index], kind="stable")
+        dep_index, arr_index = dep_index[by_arrival], arr_index[by_arrival]
+
+        # Plain lists are much faster than NumPy scalars in the scan loop.
+        self.dep_stop: list[int] = timetable.stop[dep_index].tolist()
+        self.arr_stop: list[int] = timetable.stop[arr_index].tolist()
+        self.dep_time: list[int] = timetable.departure[dep_index].tolist()
+        self.arr_time: list[int] = timetable.arrival[arr_index].tolist()
+        self.trip: list[int] = timetable.trip[dep_index].tolist()
+        self.route: list[int] = timetable.route[dep_index].tolist()
+
+        self.footpaths: dict[int, list[tuple[int, int]]] = {}
+        if walking is not None:
+            for code, stop in timetable.stop_index.items():
+                paths = [
+                    (timetable.stop_index[neighbor], seconds)
+                    for neighbor, seconds in walking.footpaths(code)
+                    if neighbor in timetable.stop_index
+                ]
+                if paths:
+                    self.footpaths[stop] = paths
+
+    @classmethod
+    def current(cls) -> "JourneyPlanner":
+        """
+        Get a planner over the timetable of the current service day, rebuilding it when the
+        timetable changes.
+
+        :return: The current planner.
+        :rtype: JourneyPlanner
+        """
+        timetable = Timetable.current()
+        with cls._current_lock:
+            if cls._current is None or cls._current.timetable is not timetable:
+                cls._current = JourneyPlanner(timetable, walking=WalkingTable.shared())
+            return cls._current
+
+    def latest_departure(
+        self,
+        origin: str,
+        destination: str,
+        arrive_by: datetime | time | int,
+    ) -> Itinerary | None:
+        """
+        Find the itinerary leaving the origin as late as possible while still reaching the
+        destination by the deadline.
+
+        :param origin: The code of the stop to leave from.
+        :type origin: str
+        :param destination: The code of the stop to arrive at.
+        :type destination: str
+        :param arrive_by: The latest acceptable arrival time.
+        :type arrive_by: datetime | time | int
+        :return: The itinerary, or None if there is none within max_window of the deadline.
+        :rtype: Itinerary | None
+        """
+        stop_index = self.timetable.stop_index
+        if origin not in stop_index or destination not in stop_index:
+            return None
+        origin_stop, destination_stop = stop_index[origin], stop_index[destination]
+        deadline = self.timetable.seconds(arrive_by)
+        if origin_stop == destination_stop:
+            return Itinerary(
+                datetime.combine(self.timetable.service_date, time()), [], deadline
+            )
+        earliest = deadline - self.max_window
+
+        # latest[s]: the latest time one can leave s, by bus or on foot, and still make the
+        # deadline.
+        latest = {destination_stop: deadline}
+        # alight_at[t]: the connection at which trip t is left to continue towards the target.
+        alight_at: dict[int, int] = {}
+        # via[s]: how latest[s] is achieved; (boarding connection, alighting connection, 0)
+        # for a bus, or (-1, stop walked to, walking seconds) for a walk.
+        via: dict[int, tuple[int, int, int]] = {}
+        dep_stop, arr_stop = self.dep_stop, self.arr_stop
+        dep_time, arr_time, trip = self.dep_time, self.arr_time, self.trip
+        min_transfer, footpaths = self.min_transfer, self.footpaths
+
+        def walk_to(stop: int) -> None:
+            for neighbor, seconds in footpaths.get(stop, ()):
+                leave = latest[stop] - seconds
+                if leave > latest.get(neighbor, -1) and neighbor != destination_stop:
+                    latest[neighbor] = leave
+                    via[neighbor] = (-1, stop, seconds)
+
+        walk_to(destination_stop)
+        for c in range(bisect_right(arr_time, deadline) - 1, -1, -1):
+            if arr_time[c] < earliest or arr_time[c] < latest.get(origin_stop, -1):
+                break
+            t = trip[c]
+            if t not in alight_at:
+                target = arr_stop[c]
+                buffer = 0 if target == destination_stop else min_transfer
+                if arr_time[c] + buffer > latest.get(target, -1):
+                    continue
+                alight_at[t] = c
+            stop = dep_stop[c]
+            if dep_time[c] > latest.get(stop, -1) and stop != destination_stop:
+                latest[stop] = dep_time[c]
+                via[stop] = (c, alight_at[t], 0)
+                walk_to(stop)
+
+        if origin_stop not in via:
+            return None
+        legs = []
+        stop = origin_stop
+        while stop != destination_stop:
+            board, alight, seconds = via[stop]
+            if board == -1:
+                legs.append(
+                    Leg(
+                        "",
+                        "",
+                        self.timetable.stops[stop],
+                        latest[alight] - seconds,
+                        self.timetable.stops[alight],
+                        latest[alight],
+                        mode="walk",
+                    )
+                )
+                stop = alight
+                continue
+            legs.append(
+                Leg(
+                    self.timetable.routes[self.route[board]],
+                    self.timetable.trips[self.trip[board]],
+                    self.timetable.stops[stop],
+                    self.dep_time[board],
+                    self.timetable.stops[self.arr_stop[alight]],
+                    self.arr_time[alight],
+                )
+            )
+            stop = self.arr_stop[alight]
+        return Itinerary(
+            datetime.combine(self.timetable.service_date, time()), legs
+        )
@@ -0,0 +1,277 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, ClassVar, Iterator
+
+# Upper bounds in seconds of the latency histogram buckets, as in the Prometheus defaults.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    A cumulative latency histogram with fixed buckets, a running sum and a count.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        :param q: The quantile, between 0 and 1.
+        :type q: float
+        :return: The estimated quantile in seconds, or infinity if it is past the last bucket.
+        :rtype: float
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters and latency histograms for the request pipeline. Stages are timed with span(),
+    BT4U requests are timed per endpoint, and the hit ratios of every TieredCache are read
+    from its counters when a snapshot is taken. prometheus() renders everything in the
+    Prometheus text exposition format.
+
+    :author: Barrett Wise
+    :date: 3/6/25
+    """
+
+    _shared: ClassVar["Metrics | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self) -> None:
+        self.counters: dict[tuple[str, _Labels], float] = {}
+        self.histograms: dict[tuple[str, _Labels], Histogram] = {}
+        self.caches: weakref.WeakValueDictionary[str, Any] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @classmethod
+    def shared(cls) -> "Metrics":
+        """
+        Get the process-wide metrics.
+
+        :return: The shared metrics.
+        :rtype: Metrics
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = Metrics()
+            return cls._shared
+
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        """
+        Add to a counter.
+
+        :param name: The name of the counter.
+        :type name: str
+        :param amount: The amount to add.
+        :type amount: float
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """
+        Record a latency in a histogram.
+
+        :param name: The name of the histogram.
+        :type name: str
+        :param seconds: The latency in seconds.
+        :type seconds: float
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str, **labels: str) -> Iterator[None]:
+        """
+        Time the enclosed block as a stage of the pipeline. Its latency is recorded in
+        hokiebus_stage_seconds, and failures are also counted in hokiebus_stage_errors_total.
+
+        :param stage: The name of the stage.
+        :type stage: str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment("hokiebus_stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe(
+                "hokiebus_stage_seconds", time.perf_counter() - start, stage=stage, **labels
+            )
+
+    def track_cache(self, name: str, cache: Any) -> None:
+        """
+        Report the counters of a cache in snapshots. Caches are held weakly.
+
+        :param name: The name to report the cache under.
+        :type name: str
+        :param cache: The cache. It must have a stats() method like TieredCache.
+        :type cache: Any
+        :return: None
+        """
+        self.caches[name] = cache
+
+    def cache_ratios(self) -> dict[tuple[str, str], float]:
+        """
+        Get the hit ratio of every namespace of every tracked cache.
+
+        :return: The fraction of lookups served from either tier, keyed by cache and
+            namespace.
+        :rtype: dict[tuple[str, str], float]
+        """
+        ratios = {}
+        for name, cache in list(self.caches.items()):
+            for namespace, events in cache.stats().items():
+                hits = events.get("memory_hits", 0) + events.get("disk_hits", 0)
+                lookups = hits + events.get("misses", 0)
+                if lookups:
+                    ratios[(name, namespace)] = hits / lookups
+        return ratios
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Get a copy of every metric.
+
+        :return: The counters, the count, sum and estimated p50/p95/p99 of each histogram,
+            and the cache hit ratios, each keyed by name and labels.
+        :rtype: dict[str, Any]
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {
+                key: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for key, histogram in self.histograms.items()
+            }
+        return {
+            "counters": counters,
+            "histograms": histograms,
+            "cache_hit_ratios": self.cache_ratios(),
+        }
+
+    @staticmethod
+    def _format_labels(labels: _Labels) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in labels
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        :return: The metrics.
+        :rtype: str
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self.histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+
+        for (name, labels), counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip((*LATENCY_BUCKETS, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = self._format_labels((*labels, ("le", le)))
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        lines.append("# TYPE hokiebus_cache_events_total counter")
+        for name, cache in sorted(self.caches.items()):
+            for namespace, events in sorted(cache.stats().items()):
+                for event, count in sorted(events.items()):
+                    labels = (("cache", name), ("event", event), ("namespace", namespace))
+                    lines.append(
+                        f"hokiebus_cache_events_total{self._format_labels(labels)} {count}"
+                    )
+        lines.append("# TYPE hokiebus_cache_hit_ratio gauge")
+        for (name, namespace), ratio in sorted(self.cache_ratios().items()):
+            labels = (("cache", name), ("namespace", namespace))
+            lines.append(f"hokiebus_cache_hit_ratio{self._format_labels(labels)} {ratio:.4f}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> None:
+        """
+        Serve prometheus() over HTTP from a background thread, for a scraper to poll.
+
+        :param port: The port to listen on.
+        :type port: int
+        :param host: The address to listen on.
+        :type host: str
+        :return: None
+        """
+        if self._server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
@@ -0,0 +1,108 @@
+import hashlib
+import threading
+from typing import Any, ClassVar
+
+from building_registry import BuildingRegistry
+from cache_handler import TieredCache
+from stop_index import StopIndex
+
+
+class RouteCache:
+    """
+    A cache of call_me responses keyed by the SHA-256 of the calendar and the start location
+    rounded to a number of decimal places, so repeat uploads from about the same spot skip
+    geocoding, parsing and stop lookups. Keys also carry the version of the building and stop
+    data, so entries made before that data refreshes are never served.
+
+    :author: Barrett Wise
+    :date: 3/4/25
+    """
+
+    _NAMESPACE = "routes"
+    _DATA_FILES = ("../data/addresses.json", "../data/building_stops.json")
+    _shared: ClassVar["RouteCache | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        cache: TieredCache | None = None,
+        precision: int = 4,
+        ttl: float | None = 3600,
+        max_entries: int = 1024,
+    ) -> None:
+        """
+        :param cache: The cache to store responses in. Defaults to one of its own in
+            data/routes.sqlite holding at most max_entries responses in each tier.
+        :type cache: TieredCache | None
+        :param precision: The number of decimal places locations are rounded to. 4 places is
+            about 10 meters.
+        :type precision: int
+        :param ttl: How long responses are kept in seconds, or None to keep them until evicted.
+        :type ttl: float | None
+        :param max_entries: The maximum number of responses kept when no cache is given.
+        :type max_entries: int
+        """
+        self.cache = cache or TieredCache(
+            "../data/routes.sqlite", memory_size=max_entries, disk_size=max_entries
+        )
+        self.precision = precision
+        self.ttl = ttl
+
+    @classmethod
+    def shared(cls) -> "RouteCache":
+        """
+        Get the process-wide route cache.
+
+        :return: The shared route cache.
+        :rtype: RouteCache
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = RouteCache()
+            return cls._shared
+
+    @classmethod
+    def data_version(cls) -> str:
+        """
+        Get the version of the data responses are derived from: the versions of the building
+        tables loaded in memory and the last rebuild of the shared stop index, if any. Once
+        the tables are loaded this never touches the disk.
+
+        :return: The data version.
+        :rtype: str
+        """
+        versions = [str(BuildingRegistry.version_of(path)) for path in cls._DATA_FILES]
+        index_version = StopIndex.version()
+        if index_version is not None:
+            versions.append(str(index_version))
+        return ".".join(versions)
+
+    def key(self, latitude: float, longitude: float, calendar: bytes) -> str:
+        return (
+            f"{hashlib.sha256(calendar).hexdigest()}"
+            f":{latitude:.{self.precision}f}:{longitude:.{self.precision}f}"
+            f":{self.data_version()}"
+        )
+
+    def get(self, key: str) -> Any | None:
+        """
+        Get a cached response.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The cached response, or None if it is not cached.
+        :rtype: Any | None
+        """
+        return self.cache.get(self._NAMESPACE, key)
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache a response.
+
+        :param key: The cache key.
+        :type key: str
+        :param value: The response. It must be JSON serializable.
+        :type value: Any
+        :return: None
+        """
+        self.cache.set(self._NAMESPACE, key, value, ttl=self.ttl)
@@ -1,11 +1,19 @@
+import asyncio
 import json
+from datetime import date, datetime, time, timedelta
+from typing import Any
 
-import requests
-from lxml import html
+from bt4u_async import AsyncBT4U_Interface
+from building_registry import BuildingRegistry
+from building_scraper import BuildingScraper
+from journey_planner import Itinerary, JourneyPlanner
+from metrics import Metrics
+from schedule import Meeting, Schedule
+from stop_index import StopIndex, nearest_stop_table
+from timetable import Timetable, service_date_for
+from walking import WalkingTable
 
-from bt4u_interface import BT4U_Interface as bt4u
-from cache_handler import CacheHandler
-from schedule import Address, Schedule
+_SERVICE_TYPES = ["weekday"] * 5 + ["saturday", "sunday"]
 
 
 class RouteFinder:
@@ -16,17 +24,53 @@ class RouteFinder:
     :date: 1/22/25
     """
 
-    def __init__(self, schedule: Schedule) -> None:
+    def __init__(
+        self,
+        schedule: Schedule,
+        stop_index: StopIndex | None = None,
+        precomputed: bool = True,
+    ) -> None:
         """
         :param schedule: The schedule to find the best route for.
         :type schedule: Schedule
+        :param stop_index: A local stop index to answer nearest stop lookups from instead of
+            calling GetNearestStops.
+        :type stop_index: StopIndex | None
+        :param precomputed: Whether to answer buildings from the precomputed building stop
+            table. When False every building is looked up like the start location.
+        :type precomputed: bool
         """
         self.schedule = schedule
-        address_cache = CacheHandler(
-            cache_file="../data/addresses.json",
+        self.stop_index = stop_index
+        self.buildings, self.building_stops = RouteFinder.load_tables()
+        if not precomputed:
+            self.building_stops = {}
+
+    @staticmethod
+    def load_tables(wait: bool = False) -> tuple[dict[str, Any], dict[str, Any]]:
+        """
+        Load the building address and building stop tables. The stop table needs the stops
+        from BT4U, so when it is missing it is built in the background, and until it is ready
+        find_route looks the stops up remotely instead.
+
+        :param wait: Whether to wait for a building stop table being built.
+        :type wait: bool
+        :return: The building address table and the building stop table.
+        :rtype: tuple[dict[str, Any], dict[str, Any]]
+        """
+        buildings = BuildingRegistry.shared(
+            "../data/addresses.json",
             update_function=RouteFinder.get_campus_addresses,
         )
-        self.buildings = json.loads(address_cache.cache_file.read_text())
+        building_stops = BuildingRegistry.shared(
+            "../data/building_stops.json",
+            update_function=RouteFinder.get_building_stops,
+            depends_on=["../data/addresses.json"],
+            block_when_empty=False,
+        )
+        if wait:
+            building_stops.wait()
+        return buildings.table, building_stops.table
 
     def find_route(self) -> dict[str, str]:
         """
@@ -35,62 +79,356 @@ class RouteFinder:
         :return: A dictionary containing the building and the bus stop to go to.
         :rtype: dict[str, str]
         """
-        bus_stop = bt4u.get_nearest_stops(
-            self.schedule.init_location.latitude
-            if self.schedule.init_location.latitude is not None
-            else 0.0,
-            self.schedule.init_location.longitude
-            if self.schedule.init_location.longitude is not None
-            else 0.0,
-            1,
-        )["DocumentElement"]["StopDistances"]
-        results = {self.schedule.init_location.street: bus_stop}
+        with Metrics.shared().span("find_route"):
+            return asyncio.run(self.find_route_async())
+
+    async def find_route_async(self, max_concurrency: int | None = None) -> dict[str, str]:
+        """
+        Finds the best route to take to get to a building on the Virginia Tech campus. The
+        nearest stop lookups for the start location and every building are sent concurrently.
+
+        :param max_concurrency: The maximum number of lookups in flight at once.
+        :type max_concurrency: int | None
+        :return: A dictionary containing the building and the bus stop to go to.
+        :rtype: dict[str, str]
+        """
+        client = AsyncBT4U_Interface(max_concurrency)
+        locations = {
+            self.schedule.init_location.street: (
+                self.schedule.init_location.latitude
+                if self.schedule.init_location.latitude is not None
+                else 0.0,
+                self.schedule.init_location.longitude
+                if self.schedule.init_location.longitude is not None
+                else 0.0,
+            )
+        }
+        precomputed = {}
         for course in self.schedule.courses:
-            building = course["building"]
+            building = course.building
             if building not in self.buildings.keys():
                 print(f"Building {building} not found in the address cache.")
                 continue
+            if self.building_stops.get(building):
+                precomputed[building] = self.building_stops[building][0]
+                continue
             building_address = self.buildings[building]
-            bus_stop = bt4u.get_nearest_stops(
-                building_address.get("latitude"), building_address.get("longitude"), 1
-            )["DocumentElement"]["StopDistances"]
-            results[building] = bus_stop
+            locations[building] = (
+                building_address.get("latitude"),
+                building_address.get("longitude"),
+            )
+
+        if self.stop_index is not None:
+            results = {
+                location: self.stop_index.nearest(latitude, longitude, 1)[0]
+                for location, (latitude, longitude) in locations.items()
+            }
+        else:
+            responses = await client.gather(
+                *(
+                    client.get_nearest_stops(latitude, longitude, 1)
+                    for latitude, longitude in locations.values()
+                )
+            )
+            results = {
+                location: response["DocumentElement"]["StopDistances"]
+                for location, response in zip(locations.keys(), responses)
+            }
+        results.update(precomputed)
         return results
 
+    def plan_trips(
+        self, arrive_early: int = 300, planner: JourneyPlanner | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Finds the bus to catch from the stop nearest the start location to reach the next
+        meeting of each course on time, leaving as late as possible. Every candidate stop near
+        the building is tried, allowing for the walk from the stop to the building.
+
+        :param arrive_early: How many seconds before the course starts to arrive.
+        :type arrive_early: int
+        :param planner: The journey planner to use for every meeting. Defaults to one over
+            the service running on the date of each meeting.
+        :type planner: JourneyPlanner | None
+        :return: The course, building, date, itinerary and final walk for each course. The
+            itinerary is None if no bus gets there in time.
+        :rtype: list[dict[str, Any]]
+        """
+        walking = WalkingTable.shared()
+        stops = self.find_route()
+        origin = stops[self.schedule.init_location.street]["StopCode"]
+        today = service_date_for(datetime.now())
+        planners: dict[object, JourneyPlanner] = {}
+        trips = []
+        for course in self.schedule.courses:
+            building = course.building
+            if building not in stops:
+                continue
+            day = self._next_meeting(course, today)
+            meeting_planner = planner or self._planner_for(day, planners, walking)
+            itinerary, walk = None, 0
+            if meeting_planner is not None:
+                itinerary, walk = self._best_itinerary(
+                    meeting_planner,
+                    walking,
+                    origin,
+                    building,
+                    stops[building]["StopCode"],
+                    self._deadline(meeting_planner, course.start.time(), arrive_early),
+                )
+            trips.append(
+                {
+                    "crn": course.crn,
+                    "building": building,
+                    "weekday": course.weekday,
+                    "date": day,
+                    "start": course.start.strftime("%H:%M"),
+                    "itinerary": Itinerary(
+                        datetime.combine(day, time()), itinerary.legs, itinerary.start
+                    ).to_dict()
+                    if itinerary
+                    else None,
+                    "walk_seconds": walk,
+                }
+            )
+        return trips
+
+    def plan_semester(
+        self,
+        arrive_early: int = 300,
+        window: int = 300,
+        service_exceptions: dict[date, Timetable | None] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Plans the bus to catch for every occurrence of every course in the schedule. Meetings
+        are grouped by destination, arrival-time window and service type (weekday, Saturday or
+        Sunday), and each group is planned once over a representative timetable, so a whole
+        semester costs about as much as a single week.
+
+        :param arrive_early: How many seconds before the course starts to arrive.
+        :type arrive_early: int
+        :param window: The width in seconds of the arrival-time windows meetings are grouped
+            by. Each group plans for the start of its window, so no one arrives late.
+        :type window: int
+        :param service_exceptions: Dates that do not run the regular service, mapped to the
+            timetable of that date, or to None if there is no service at all.
+        :type service_exceptions: dict[date, Timetable | None] | None
+        :return: The course, building, date, itinerary and final walk for each occurrence,
+            in date order. The itinerary is None if no bus gets there in time.
+        :rtype: list[dict[str, Any]]
+        """
+        walking = WalkingTable.shared()
+        stops = self.find_route()
+        origin = stops[self.schedule.init_location.street]["StopCode"]
+        planners: dict[object, JourneyPlanner] = {}
+        plans: dict[tuple, tuple[Itinerary | None, int]] = {}
+        trips = []
+        for course in self.schedule.courses:
+            building = course.building
+            if building not in stops:
+                continue
+            start = course.start.time()
+            for occurrence in course.occurrences():
+                day = occurrence.date()
+                planner = self._planner_for(day, planners, walking, service_exceptions)
+                itinerary, walk = None, 0
+                if planner is not None:
+                    deadline = self._deadline(planner, start, arrive_early, window)
+                    key = (id(planner), building, deadline)
+                    if key not in plans:
+                        plans[key] = self._best_itinerary(
+                            planner,
+                            walking,
+                            origin,
+                            building,
+                            stops[building]["StopCode"],
+                            deadline,
+                        )
+                    itinerary, walk = plans[key]
+                trips.append(
+                    {
+                        "crn": course.crn,
+                        "building": building,
+                        "date": day,
+                        "start": start.strftime("%H:%M"),
+                        "itinerary": Itinerary(
+                            datetime.combine(day, time()), itinerary.legs, itinerary.start
+                        ).to_dict()
+                        if itinerary
+                        else None,
+                        "walk_seconds": walk,
+                    }
+                )
+        trips.sort(key=lambda trip: (trip["date"], trip["start"]))
+        return trips
+
+    @staticmethod
+    def _next_meeting(course: Meeting, today: date) -> date:
+        """
+        Get the date of the next meeting of a course, or if the course has no meetings left,
+        the next date on its weekday.
+
+        :param course: The course.
+        :type course: Meeting
+        :param today: The date to look from.
+        :type today: date
+        :return: The date.
+        :rtype: date
+        """
+        for occurrence in course.occurrences():
+            if occurrence.date() >= today:
+                return occurrence.date()
+        return today + timedelta(days=(course.weekday - today.weekday()) % 7)
+
+    @staticmethod
+    def _deadline(
+        planner: JourneyPlanner, start: time, arrive_early: int, window: int = 1
+    ) -> int:
+        """
+        Get when to be at a building for a course, in seconds since midnight of the service
+        date of the planner.
+
+        :param planner: The journey planner the deadline is for.
+        :type planner: JourneyPlanner
+        :param start: The start time of the course.
+        :type start: time
+        :param arrive_early: How many seconds before the course starts to arrive.
+        :type arrive_early: int
+        :param window: The width in seconds of the windows deadlines are rounded down to.
+        :type window: int
+        :return: The deadline.
+        :rtype: int
+        """
+        deadline = planner.timetable.seconds(start) - arrive_early
+        return deadline - deadline % window
+
+    def _planner_for(
+        self,
+        day: date,
+        planners: dict[object, JourneyPlanner],
+        walking: WalkingTable,
+        service_exceptions: dict[date, Timetable | None] | None = None,
+    ) -> JourneyPlanner | None:
+        """
+        Get a journey planner over the service running on a date. Planners are shared by
+        every date of the same service type (weekday, Saturday or Sunday) through planners.
+
+        :param day: The date.
+        :type day: date
+        :param planners: The planners made so far, reused and added to.
+        :type planners: dict[object, JourneyPlanner]
+        :param walking: The walking times between nearby stops.
+        :type walking: WalkingTable
+        :param service_exceptions: Dates that do not run the regular service, mapped to the
+            timetable of that date, or to None if there is no service at all.
+        :type service_exceptions: dict[date, Timetable | None] | None
+        :return: The planner, or None if there is no service on the date.
+        :rtype: JourneyPlanner | None
+        """
+        service_exceptions = service_exceptions or {}
+        if day in service_exceptions:
+            timetable = service_exceptions[day]
+            if timetable is None:
+                return None
+            key: object = id(timetable)
+        else:
+            timetable, key = None, _SERVICE_TYPES[day.weekday()]
+        if key not in planners:
+            planners[key] = JourneyPlanner(
+                timetable or self._representative_timetable(day), walking=walking
+            )
+        return planners[key]
+
+    @staticmethod
+    def _representative_timetable(day: date) -> Timetable:
+        """
+        Get a timetable running the same type of service as a given date: today's if it
+        matches, otherwise that of the next date of the same type.
+
+        :param day: The date.
+        :type day: date
+        :return: The timetable.
+        :rtype: Timetable
+        """
+        current = Timetable.current()
+        service_type = _SERVICE_TYPES[day.weekday()]
+        if _SERVICE_TYPES[current.service_date.weekday()] == service_type:
+            return current
+        candidate = current.service_date + timedelta(days=1)
+        while _SERVICE_TYPES[candidate.weekday()] != service_type:
+            candidate += timedelta(days=1)
+        return Timetable.ingest(candidate)
+
     @staticmethod
-    def get_campus_addresses(update: bool = False) -> dict[str, Address] | str:
+    def _best_itinerary(
+        planner: JourneyPlanner,
+        walking: WalkingTable,
+        origin: str,
+        building: str,
+        fallback_stop: str,
+        deadline: int,
+    ) -> tuple[Itinerary | None, int]:
+        """
+        Find the latest-departing itinerary to any candidate stop of a building, allowing for
+        the walk from the stop to the building.
+
+        :param planner: The journey planner to use.
+        :type planner: JourneyPlanner
+        :param walking: The walking times from buildings to stops.
+        :type walking: WalkingTable
+        :param origin: The code of the stop to leave from.
+        :type origin: str
+        :param building: The name of the building to reach.
+        :type building: str
+        :param fallback_stop: The stop to use if the building has no candidate stops.
+        :type fallback_stop: str
+        :param deadline: When to be at the building, in seconds since midnight.
+        :type deadline: int
+        :return: The itinerary, or None if no bus gets there in time, and the walking time in
+            seconds from its last stop to the building.
+        :rtype: tuple[Itinerary | None, int]
+        """
+        candidates = walking.stops_near_building(building) or [(fallback_stop, 0)]
+        itinerary, walk = None, 0
+        for stop_code, seconds in candidates:
+            option = planner.latest_departure(origin, stop_code, deadline - seconds)
+            if option and (itinerary is None or option.departure > itinerary.departure):
+                itinerary, walk = option, seconds
+        return itinerary, walk
+
+    @staticmethod
+    def get_building_stops(
+        update: bool = False, k: int = 3
+    ) -> dict[str, list[dict[str, Any]]]:
+        """
+        Gets the k nearest bus stops to every building in the address cache. The table is
+        rebuilt from the stops in service today, refreshing the shared stop index if needed.
+
+        :param update: Whether to recompute the table instead of reading the cached copy.
+        :type update: bool
+        :param k: The number of stops to keep per building.
+        :type k: int
+        :return: A dictionary mapping each building to its nearest stops, closest first.
+        :rtype: dict[str, list[dict[str, Any]]]
+        """
+
+        if not update:
+            return json.loads(open("../data/building_stops.json").read())
+
+        buildings = json.loads(open("../data/addresses.json").read())
+        return nearest_stop_table(buildings, StopIndex.shared().current_stops(), k)
+
+    @staticmethod
+    def get_campus_addresses(update: bool = False) -> dict[str, dict[str, Any]]:
         """
         Fetches the addresses of all the buildings on the Virginia Tech campus from the VT website.
+        Updates are resumable; see BuildingScraper.
 
         :return: A dictionary containing the addresses of all the buildings on the Virginia Tech campus.
-        :rtype: dict[str, Address]
+        :rtype: dict[str, dict[str, Any]]
         """
 
         if not update:
             return json.loads(open("../data/addresses.json").read())
 
-        page = requests.get("https://www.vt.edu/about/locations/buildings.html")
-        tree = html.fromstring(page.content)
-
-        building_links = {
-            building.text.strip(): building.attrib["href"]
-            for building in tree.xpath('//li [@class="vt-subnav-droplist-item "]/a')
-        }
-
-        building_address_table = {}
-        for building in building_links.keys():
-            building_link = building_links[building]
-            building_page = requests.get(building_link)
-            building_tree = html.fromstring(building_page.content)
-            address = building_tree.xpath(
-                '//address [@class="vt-building-address"]/text()'
-            )
-            if address:
-                building_address_table[building] = Address(
-                    address[0],
-                    "Blacksburg",
-                    "Virginia",
-                    "24061",
-                    "United States",
-                ).to_dict()
-        return building_address_table
+        return BuildingScraper().scrape()
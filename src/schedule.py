@@ -1,14 +1,36 @@
+import heapq
 import os
 import re
-from io import BytesIO, TextIOWrapper
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from io import BytesIO
 from pathlib import Path
+from typing import Any, ClassVar, Iterator
 
 import anvil._serialise
 import anvil.media
 import anvil.server
 import icalendar as ical
+from dateutil import rrule
 from geocodio import GeocodioClient
 
+from geocode_cache import GeocodeCache
+from metrics import Metrics
+from transport import Transport
+
+_LOCATION_PATTERN = re.compile(
+    r"Campus:\s*(.*?)\s*Building:\s*(.*?)\s*Room:\s*([0-9]*)"
+)
+_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+
+class GeocodeUnavailableError(ValueError):
+    """
+    An address that was not geocoded because the geocoding request itself failed. Unlike a
+    plain ValueError, which means the address could not be resolved, it is worth retrying.
+    """
+
 
 class Address:
     """
@@ -18,6 +40,18 @@ class Address:
     :date: 1/19/25
     """
 
+    __slots__ = (
+        "street",
+        "city",
+        "state",
+        "zip_code",
+        "country",
+        "_latitude",
+        "_longitude",
+    )
+    _client: ClassVar[GeocodioClient | None] = None
+    _client_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(
         self,
         address: str = "",
@@ -25,8 +59,13 @@ class Address:
         state: str = "",
         zip_code: str = "",
         country: str = "",
+        latitude: float | None = None,
+        longitude: float | None = None,
     ) -> None:
         """
+        The coordinates are geocoded lazily on first access unless they are given here, so
+        constructing an address never touches the network.
+
         :param street: The street address.
         :type street: str
         :param city: The city.
@@ -37,37 +76,196 @@ class Address:
         :type zip_code: str
         :param country: The country.
         :type country: str
+        :param latitude: The latitude, if already known.
+        :type latitude: float | None
+        :param longitude: The longitude, if already known.
+        :type longitude: float | None
         """
-        self.client = GeocodioClient(os.getenv("GEOCODE_KEY"))
         self.street = address
         self.city = city
         self.state = state
         self.zip_code = zip_code
         self.country = country
-        self.latitude = self.__convert_address_to_gps()[0] if address != "" else None
-        self.longitude = self.__convert_address_to_gps()[1] if address != "" else None
+        self._latitude = latitude
+        self._longitude = longitude
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Address":
+        """
+        Create an address from a dictionary in the format of to_dict without geocoding.
+
+        :param data: The address dictionary.
+        :type data: dict[str, Any]
+        :return: The address.
+        :rtype: Address
+        """
+        return cls(
+            data.get("street", ""),
+            data.get("city", ""),
+            data.get("state", ""),
+            data.get("zip_code", ""),
+            data.get("country", ""),
+            data.get("latitude"),
+            data.get("longitude"),
+        )
+
+    @classmethod
+    def from_table(cls, table: dict[str, dict[str, Any]]) -> dict[str, "Address"]:
+        """
+        Create addresses for every entry of an address table, such as addresses.json,
+        without geocoding.
+
+        :param table: The address dictionaries keyed by name.
+        :type table: dict[str, dict[str, Any]]
+        :return: The addresses keyed by name.
+        :rtype: dict[str, Address]
+        """
+        return {name: cls.from_dict(data) for name, data in table.items()}
+
+    @classmethod
+    def configure_client(cls, client: GeocodioClient | None = None) -> None:
+        """
+        Set the geocoding client shared by every address, such as a stand-in for testing.
+
+        :param client: The client, or None to create the default one on next use.
+        :type client: GeocodioClient | None
+        :return: None
+        """
+        with cls._client_lock:
+            cls._client = client
+
+    @property
+    def client(self) -> GeocodioClient:
+        """
+        The geocoding client, shared by every address.
+        """
+        with Address._client_lock:
+            if Address._client is None:
+                Address._client = Transport.client(
+                    lambda: GeocodioClient(os.getenv("GEOCODE_KEY")), "geocodio"
+                )
+            return Address._client
+
+    @property
+    def latitude(self) -> float | None:
+        if self._latitude is None:
+            self.__resolve()
+        return self._latitude
+
+    @latitude.setter
+    def latitude(self, value: float | None) -> None:
+        self._latitude = value
+
+    @property
+    def longitude(self) -> float | None:
+        if self._longitude is None:
+            self.__resolve()
+        return self._longitude
+
+    @longitude.setter
+    def longitude(self, value: float | None) -> None:
+        self._longitude = value
+
+    def __resolve(self) -> None:
+        if self.street != "":
+            self._latitude, self._longitude = self.__convert_address_to_gps()
 
     def __convert_address_to_gps(self) -> tuple[float, float]:
         """
-        Convert the address to GPS coordinates.
+        Convert the address to GPS coordinates, using the geocode cache when possible.
 
         :return: The latitude and longitude of the address.
         :rtype: tuple[float, float]
         """
-        location = self.client.geocode(
-            f"{self.street}, {self.city}, {self.state} {self.zip_code}",
-            country=self.country,
-            limit=3,
-        )
+        query = self.geocode_query()
+        cache = GeocodeCache.shared()
+        key = cache.forward_key(f"{query}, {self.country}")
+        cached = cache.get(key)
+        if cached is not None:
+            return (cached[0], cached[1])
+
+        with Metrics.shared().span("forward_geocode"):
+            location = self.client.geocode(query, country=self.country, limit=3)
         if location is None:
             raise ValueError("Invalid address.")
 
         coords = location["results"][0]["location"]
+        cache.put(key, [coords["lat"], coords["lng"]])
         return (coords["lat"], coords["lng"])
 
+    def geocode_query(self) -> str:
+        """
+        Get the string the address is geocoded by.
+
+        :return: The geocoding query.
+        :rtype: str
+        """
+        return f"{self.street}, {self.city}, {self.state} {self.zip_code}"
+
+    @staticmethod
+    def batch_convert_addresses_to_gps(
+        addresses: list["Address"], batch_size: int = 1000, client: Any = None
+    ) -> list[tuple[float, float] | ValueError]:
+        """
+        Convert many addresses to GPS coordinates with Geocodio's batch endpoint. Cached
+        addresses are answered from the geocode cache and the rest are sent in batches of
+        batch_size. The coordinates are also stored on each address.
+
+        :param addresses: The addresses to convert.
+        :type addresses: list[Address]
+        :param batch_size: The maximum number of addresses sent per request.
+        :type batch_size: int
+        :param client: The geocoding client. Anything with a Geocodio-style batch_geocode
+            method works, which lets tests use a local stand-in.
+        :type client: Any
+        :return: The latitude and longitude of each address in input order, or a ValueError
+            for each address that could not be geocoded. It is a GeocodeUnavailableError when
+            the request failed rather than the address.
+        :rtype: list[tuple[float, float] | ValueError]
+        """
+        cache = GeocodeCache.shared()
+        results: list[tuple[float, float] | ValueError] = [
+            ValueError("Invalid address.") for _ in addresses
+        ]
+        misses = []
+        for i, address in enumerate(addresses):
+            key = cache.forward_key(f"{address.geocode_query()}, {address.country}")
+            cached = cache.get(key)
+            if cached is not None:
+                results[i] = (cached[0], cached[1])
+            else:
+                misses.append((i, key))
+
+        if misses:
+            client = client or Address().client
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start : start + batch_size]
+            queries = [
+                f"{addresses[i].geocode_query()}, {addresses[i].country}"
+                for i, _ in batch
+            ]
+            try:
+                with Metrics.shared().span("batch_geocode"):
+                    locations = client.batch_geocode(queries)
+            except Exception as e:
+                for i, _ in batch:
+                    results[i] = GeocodeUnavailableError(f"Batch geocode failed: {e}")
+                continue
+            for (i, key), location in zip(batch, locations):
+                if not location or not location.get("results"):
+                    continue
+                coords = location["results"][0]["location"]
+                cache.put(key, [coords["lat"], coords["lng"]])
+                results[i] = (coords["lat"], coords["lng"])
+
+        for address, result in zip(addresses, results):
+            if not isinstance(result, ValueError):
+                address._latitude, address._longitude = result
+        return results
+
     def convert_gps_to_address(self, latitude: float, longitude: float) -> str:
         """
-        Convert GPS coordinates to an address.
+        Convert GPS coordinates to an address, using the geocode cache when possible.
 
         :param latitude: The latitude.
         :type latitude: float
@@ -76,12 +274,19 @@ class Address:
         :return: The address corresponding to the GPS coordinates.
         :rtype: Address
         """
-        location = self.client.reverse((latitude, longitude))
+        cache = GeocodeCache.shared()
+        key = cache.reverse_key(latitude, longitude)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        with Metrics.shared().span("reverse_geocode"):
+            location = self.client.reverse((latitude, longitude))
         if location is None:
             raise ValueError("Invalid GPS coordinates.")
 
         address = location["results"][0]["address_components"]
-        return (
+        result = (
             address["number"]
             + ","
             + address["formatted_street"]
@@ -92,6 +297,8 @@ class Address:
             + ","
             + address["zip"]
         )
+        cache.put(key, result)
+        return result
 
     def __str__(self) -> str:
         return (
@@ -101,18 +308,65 @@ class Address:
     def __repr__(self) -> str:
         return f"Address({self.street}, {self.city}, {self.state}, {self.zip_code}, {self.country})"
 
-    def to_dict(self) -> dict[str, str | float | None]:
+    def to_dict(self, resolve: bool = True) -> dict[str, str | float | None]:
+        """
+        :param resolve: Whether to geocode the coordinates if they are not known yet.
+        :type resolve: bool
+        """
         return {
             "street": self.street,
             "city": self.city,
             "state": self.state,
             "zip_code": self.zip_code,
             "country": self.country,
-            "latitude": self.latitude,
-            "longitude": self.longitude,
+            "latitude": self.latitude if resolve else self._latitude,
+            "longitude": self.longitude if resolve else self._longitude,
         }
 
 
+@dataclass(slots=True)
+class Meeting:
+    """
+    A unique weekly meeting slot of a course: one building, weekday and start time. Calendar
+    entries sharing a slot are collapsed into one meeting, and its dates are only expanded
+    from the recurrence rules on demand.
+    """
+
+    crn: str
+    campus: str
+    building: str
+    room: str
+    weekday: int
+    start: datetime
+    end: datetime
+    rules: list[tuple[str, datetime, tuple[datetime, ...]]] = field(
+        default_factory=list, repr=False
+    )
+
+    def occurrences(self) -> Iterator[datetime]:
+        """
+        Lazily expand the start of every occurrence of the meeting, in order.
+
+        :return: The occurrence start times.
+        :rtype: Iterator[datetime]
+        """
+        streams = []
+        for rule, dtstart, exdates in self.rules:
+            if rule:
+                dates = rrule.rrulestr(rule, dtstart=dtstart)
+            else:
+                dates = iter([dtstart])
+            excluded = set(exdates)
+            streams.append(
+                d for d in dates if d.weekday() == self.weekday and d not in excluded
+            )
+        previous = None
+        for occurrence in heapq.merge(*streams):
+            if occurrence != previous:
+                yield occurrence
+            previous = occurrence
+
+
 class Schedule:
     """
     A class to represent a schedule of courses.
@@ -122,69 +376,110 @@ class Schedule:
     """
 
     def __init__(
-        self, init_location: Address, source_file: str | anvil._serialise.StreamingMedia
+        self,
+        init_location: Address,
+        source_file: str | bytes | anvil._serialise.StreamingMedia,
     ) -> None:
         """
-        :param source_file: The path to the .ics file containing the user's schedule.
-        :type source_file: str | anvil._serialise.StreamingMedia
+        :param source_file: The path to the .ics file containing the user's schedule, or its
+            contents.
+        :type source_file: str | bytes | anvil._serialise.StreamingMedia
         :param init_location: The address of where the user is located, used to determine the closest bus stop.
         :type init_location: Address
         """
         if isinstance(source_file, anvil._serialise.StreamingMedia):
             self.__source = BytesIO(source_file.get_bytes())
+        elif isinstance(source_file, bytes):
+            self.__source = BytesIO(source_file)
         else:
             self.__source = Path(source_file)
         self.init_location = init_location
-        self.courses = self.__read_schedule()
+        with Metrics.shared().span("parse_schedule"):
+            self.courses = self.__read_schedule()
 
-    def __read_schedule(self) -> list[dict[str, str]]:
+    def __read_schedule(self) -> list[Meeting]:
         """
-        Read the .ics file and extract the course information.
+        Read the .ics file and collapse its events into unique meeting slots.
 
-        :return: A list of dictionaries containing the course information.
-        :rtype: list[dict[str, str]]
+        :return: The meetings, ordered by weekday and start time.
+        :rtype: list[Meeting]
         """
-        loc_pattern = r"Campus:\s*(.*?)\s*Building:\s*(.*?)\s*Room:\s*([0-9]*)"
-        courses = []
-
         if isinstance(self.__source, BytesIO):
-            f = TextIOWrapper(self.__source)
+            data = self.__source.getvalue()
         else:
-            f = self.__source.open()
+            data = self.__source.read_bytes()
 
-        cal = ical.Calendar.from_ical(f.read())
+        meetings: dict[tuple[str, int, time], Meeting] = {}
+        cal = ical.Calendar.from_ical(data)
         for event in cal.walk("VEVENT"):
             location = str(event.get("location")).strip()
-            match = re.search(loc_pattern, location)
-            campus = ""
-            building = ""
-            room = ""
-            if match:
-                campus = match.group(1)
-                building = match.group(2)
-                room = match.group(3)
-
-                summary = str(event.get("summary")).strip().split()
-                course_code = summary[-3] + " " + summary[-2]
-
-                start = str(
-                    ical.vDatetime.from_ical(
-                        event.get("dtstart").to_ical().decode("utf-8")
-                    ).strftime("%m/%d/%Y, %H:%M:%S %p")
-                )
-                end = str(
-                    ical.vDatetime.from_ical(
-                        event.get("dtend").to_ical().decode("utf-8")
-                    ).strftime("%m/%d/%Y, %H:%M:%S %p")
-                )
+            match = _LOCATION_PATTERN.search(location)
+            if not match:
+                continue
+            campus, building, room = match.groups()
+
+            summary = str(event.get("summary")).strip().split()
+            course_code = summary[-3] + " " + summary[-2]
+
+            # Times are kept as naive local wall-clock times in the zone of DTSTART, and
+            # UNTIL and EXDATE are converted to match, whether they are floating, as
+            # Ellucian exports them, or in UTC, as RFC 5545 requires with a TZID.
+            zone = event.decoded("dtstart").tzinfo
+            start = _wall_clock(event.decoded("dtstart"), zone)
+            end = _wall_clock(event.decoded("dtend"), zone)
+            recurrence = event.get("rrule")
+            rule = ""
+            if recurrence:
+                recurrence = recurrence.copy()
+                if "UNTIL" in recurrence:
+                    recurrence["UNTIL"] = [
+                        _wall_clock(until, zone) for until in recurrence["UNTIL"]
+                    ]
+                rule = recurrence.to_ical().decode("utf-8")
+            exdates = tuple(
+                _wall_clock(exdate.dt, zone)
+                for exdates in _as_list(event.get("exdate"))
+                for exdate in exdates.dts
+            )
+            weekdays = (
+                [_WEEKDAYS[day[-2:]] for day in recurrence.get("BYDAY", [])]
+                if recurrence
+                else []
+            ) or [start.weekday()]
+
+            for weekday in weekdays:
+                offset = timedelta(days=(weekday - start.weekday()) % 7)
+                key = (building, weekday, start.time())
+                if key not in meetings:
+                    meetings[key] = Meeting(
+                        course_code,
+                        campus,
+                        building,
+                        room,
+                        weekday,
+                        start + offset,
+                        end + offset,
+                    )
+                meeting = meetings[key]
+                meeting.rules.append((rule, start, exdates))
+                if start + offset < meeting.start:
+                    meeting.start, meeting.end = start + offset, end + offset
+        return sorted(meetings.values(), key=lambda m: (m.weekday, m.start.time()))
+
+
+def _wall_clock(value: Any, zone: Any) -> Any:
+    """
+    Convert a calendar time to a naive wall-clock time in the given zone. Floating times and
+    dates are returned as they are.
+    """
+    if not isinstance(value, datetime) or value.tzinfo is None:
+        return value
+    if zone is not None:
+        value = value.astimezone(zone)
+    return value.replace(tzinfo=None)
+
 
-                info = {
-                    "crn": course_code,
-                    "campus": campus,
-                    "building": building,
-                    "room": room,
-                    "start": start,
-                    "end": end,
-                }
-                courses.append(info)
-        return courses
\ No newline at end of file
+def _as_list(value: Any) -> list[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
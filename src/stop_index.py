@@ -0,0 +1,350 @@
+import math
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, ClassVar
+
+import numpy as np
+from bt4u_interface import BT4U_Interface as bt4u
+from bt4u_interface import as_list
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_MILES / 360
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Get the great-circle distance between two GPS coordinates.
+
+    :return: The distance in miles.
+    :rtype: float
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def haversine_matrix(
+    lats1: np.ndarray, lons1: np.ndarray, lats2: np.ndarray, lons2: np.ndarray
+) -> np.ndarray:
+    """
+    Get the great-circle distance between every pair of points from two sets of GPS coordinates.
+
+    :return: An array of shape (len(lats1), len(lats2)) with the distances in miles.
+    :rtype: np.ndarray
+    """
+    phi1 = np.radians(lats1)[:, None]
+    phi2 = np.radians(lats2)[None, :]
+    d_lambda = np.radians(lons2)[None, :] - np.radians(lons1)[:, None]
+    a = (
+        np.sin((phi2 - phi1) / 2) ** 2
+        + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def nearest_stop_table(
+    buildings: dict[str, dict[str, Any]], stops: list[dict[str, Any]], k: int = 3
+) -> dict[str, list[dict[str, Any]]]:
+    """
+    Compute the k nearest stops to every building in one vectorized pass.
+
+    :param buildings: The building address table, as stored in addresses.json.
+    :type buildings: dict[str, dict[str, Any]]
+    :param stops: The stops to choose from. Each needs StopCode, StopName, Latitude and Longitude.
+    :type stops: list[dict[str, Any]]
+    :param k: The number of stops to keep per building.
+    :type k: int
+    :return: The nearest stops to each building, closest first, each with its Distance in miles.
+    :rtype: dict[str, list[dict[str, Any]]]
+    """
+    names = [
+        name
+        for name, address in buildings.items()
+        if address.get("latitude") is not None and address.get("longitude") is not None
+    ]
+    if not names or not stops:
+        return {}
+    k = min(k, len(stops))
+    distances = haversine_matrix(
+        np.array([buildings[name]["latitude"] for name in names], dtype=float),
+        np.array([buildings[name]["longitude"] for name in names], dtype=float),
+        np.array([stop["Latitude"] for stop in stops], dtype=float),
+        np.array([stop["Longitude"] for stop in stops], dtype=float),
+    )
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    order = np.argsort(nearest_distances, axis=1)
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    return {
+        name: [
+            {**stops[j], "Distance": float(distances[i, j])} for j in nearest[i]
+        ]
+        for i, name in enumerate(names)
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class _StopGrid:
+    """
+    One immutable build of a StopIndex. A rebuild makes a new one and swaps it in whole.
+    """
+
+    stops: list[dict[str, Any]] = field(default_factory=list)
+    cells: dict[tuple[int, int], list[dict[str, Any]]] = field(default_factory=dict)
+    bounds: tuple[int, int, int, int] = (0, 0, 0, 0)
+    updated: datetime | None = None
+
+
+class StopIndex:
+    """
+    An in-process registry of bus stops held in a uniform lat/lon grid, answering k-nearest-stop
+    queries without a call to GetNearestStops. Each rebuild is swapped in as one snapshot, so a
+    query never mixes the grid of one build with the stops of another.
+
+    :author: Barrett Wise
+    :date: 2/4/25
+    """
+
+    _shared: ClassVar["StopIndex | None"] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, cell_size: float = 0.005) -> None:
+        """
+        :param cell_size: The side length of a grid cell in degrees.
+        :type cell_size: float
+        """
+        self.cell_size = cell_size
+        self._snapshot = _StopGrid()
+        self._refresh_thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def shared(cls, build: bool = True) -> "StopIndex":
+        """
+        Get the process-wide stop index.
+
+        :param build: Whether to build the index now if it has not been built yet. When False
+            it may be returned empty, for start to build in the background.
+        :type build: bool
+        :return: The shared stop index.
+        :rtype: StopIndex
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = StopIndex()
+            if build and cls._shared.updated is None:
+                cls._shared.refresh()
+            return cls._shared
+
+    @classmethod
+    def version(cls) -> float | None:
+        """
+        Get when the shared stop index was last rebuilt, without building it.
+
+        :return: The time of the last rebuild as a timestamp, or None if it was never built.
+        :rtype: float | None
+        """
+        index = cls._shared
+        if index is None or index.updated is None:
+            return None
+        return index.updated.timestamp()
+
+    @property
+    def stops(self) -> list[dict[str, Any]]:
+        return self._snapshot.stops
+
+    @property
+    def updated(self) -> datetime | None:
+        return self._snapshot.updated
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    @staticmethod
+    def _ring_cells(row: int, col: int, ring: int) -> list[tuple[int, int]]:
+        """
+        Get the cells on the perimeter of the square ring cells away from (row, col).
+        """
+        if ring == 0:
+            return [(row, col)]
+        cells = []
+        for c in range(col - ring, col + ring + 1):
+            cells.append((row - ring, c))
+            cells.append((row + ring, c))
+        for r in range(row - ring + 1, row + ring):
+            cells.append((r, col - ring))
+            cells.append((r, col + ring))
+        return cells
+
+    def build(self, stops: list[dict[str, Any]]) -> None:
+        """
+        Replace the indexed stops. The new grid is built aside and swapped in as one
+        snapshot, so concurrent queries see either the old or the new set of stops.
+
+        :param stops: The stops to index. Each needs StopCode, StopName, Latitude and Longitude.
+        :type stops: list[dict[str, Any]]
+        :return: None
+        """
+        cells: dict[tuple[int, int], list[dict[str, Any]]] = {}
+        for stop in stops:
+            cells.setdefault(self._cell(stop["Latitude"], stop["Longitude"]), []).append(
+                stop
+            )
+        if cells:
+            rows = [cell[0] for cell in cells]
+            cols = [cell[1] for cell in cells]
+            bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            bounds = (0, 0, 0, 0)
+        self._snapshot = _StopGrid(list(stops), cells, bounds, datetime.now())
+
+    def refresh(self, service_date: str = "") -> None:
+        """
+        Rebuild the index from the scheduled stops of every current route.
+
+        :param service_date: The date of the service. Defaults to today.
+        :type service_date: str
+        :return: None
+        """
+        service_date = service_date or datetime.now().strftime("%m/%d/%y")
+        routes = as_list(
+            bt4u.get_current_routes()["DocumentElement"].get("CurrentRoutes")
+        )
+        stops: dict[str, dict[str, Any]] = {}
+        for route in routes:
+            route_stops = as_list(
+                bt4u.get_scheduled_stop_info(route["RouteShortName"], service_date)[
+                    "DocumentElement"
+                ].get("ScheduledStops")
+            )
+            for stop in route_stops:
+                if stop["StopCode"] in stops:
+                    continue
+                stops[stop["StopCode"]] = {
+                    "StopCode": stop["StopCode"],
+                    "StopName": stop.get("StopName", ""),
+                    "Latitude": float(stop["Latitude"]),
+                    "Longitude": float(stop["Longitude"]),
+                }
+        print(f"Indexed {len(stops)} stops across {len(routes)} routes.")
+        self.build(list(stops.values()))
+
+    def current_stops(self, max_age: float = 24 * 3600) -> list[dict[str, Any]]:
+        """
+        Get the indexed stops, refreshing the index first if it is older than max_age.
+
+        :param max_age: The oldest the index may be in seconds.
+        :type max_age: float
+        :return: The stops.
+        :rtype: list[dict[str, Any]]
+        """
+        if self.updated is None or (datetime.now() - self.updated).total_seconds() > max_age:
+            self.refresh()
+        return self.stops
+
+    def start(
+        self, refresh_interval: float = 24 * 3600, retry_interval: float = 600.0
+    ) -> None:
+        """
+        Refresh the index in a background thread every refresh_interval seconds, building it
+        first if it has not been built yet. A failed refresh is retried after retry_interval.
+
+        :param refresh_interval: The time between refreshes in seconds.
+        :type refresh_interval: float
+        :param retry_interval: The time before retrying a failed refresh in seconds.
+        :type retry_interval: float
+        :return: None
+        """
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._stop_event.clear()
+
+        def run() -> None:
+            wait = 0.0 if self.updated is None else refresh_interval
+            while not self._stop_event.wait(wait):
+                try:
+                    self.refresh()
+                    wait = refresh_interval
+                except Exception as e:
+                    print(f"Stop index refresh failed: {e}")
+                    wait = min(retry_interval, refresh_interval)
+
+        self._refresh_thread = threading.Thread(target=run, daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background refresh thread. It can be started again with start.
+
+        :return: None
+        """
+        self._stop_event.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def nearest(
+        self, latitude: float, longitude: float, k: int = 1
+    ) -> list[dict[str, Any]]:
+        """
+        Get the k stops nearest to a given set of GPS coordinates.
+
+        :param latitude: The latitude of the GPS coordinates.
+        :type latitude: float
+        :param longitude: The longitude of the GPS coordinates.
+        :type longitude: float
+        :param k: The number of stops to return.
+        :type k: int
+        :return: The nearest stops, closest first, each with its Distance in miles.
+        :rtype: list[dict[str, Any]]
+        """
+        snapshot = self._snapshot
+        grid, (min_row, max_row, min_col, max_col) = snapshot.cells, snapshot.bounds
+        if not grid or k <= 0:
+            return []
+        row, col = self._cell(latitude, longitude)
+        # Anything outside ring r is at least r cells away along the shorter (longitude) axis.
+        ring_miles = (
+            self.cell_size * MILES_PER_DEGREE * math.cos(math.radians(latitude))
+        )
+        max_ring = max(
+            abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col)
+        )
+        if not (min_row <= row <= max_row and min_col <= col <= max_col):
+            # Far outside the service area the rings are mostly empty; a scan is cheaper.
+            found = [
+                (haversine(latitude, longitude, s["Latitude"], s["Longitude"]), s)
+                for s in snapshot.stops
+            ]
+        else:
+            found = []
+            for ring in range(max_ring + 1):
+                for cell in self._ring_cells(row, col, ring):
+                    for stop in grid.get(cell, ()):
+                        found.append(
+                            (
+                                haversine(
+                                    latitude,
+                                    longitude,
+                                    stop["Latitude"],
+                                    stop["Longitude"],
+                                ),
+                                stop,
+                            )
+                        )
+                if len(found) >= k:
+                    found.sort(key=lambda item: item[0])
+                    if found[k - 1][0] <= ring * ring_miles:
+                        break
+        found.sort(key=lambda item: item[0])
+        return [{**stop, "Distance": distance} for distance, stop in found[:k]]
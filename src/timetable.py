@@ -0,0 +1,271 @@
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import ClassVar
+
+import numpy as np
+
+from bt4u_interface import BT4U_Interface as bt4u
+from bt4u_records import Departure
+
+
+def service_date_for(moment: datetime) -> date:
+    """
+    Get the service day a moment belongs to. Service days roll over at
+    BT4U_Interface._SERVICE_DAY_START_HOUR rather than midnight.
+
+    :param moment: The moment.
+    :type moment: datetime
+    :return: The service date.
+    :rtype: date
+    """
+    return (moment - timedelta(hours=bt4u._SERVICE_DAY_START_HOUR)).date()
+
+
+class Timetable:
+    """
+    The scheduled stop times of every route for one service day, held in columnar arrays
+    sorted by route, stop and departure time so next-departure queries are a binary search.
+    Times are seconds since midnight of the service date and may exceed a day for trips
+    running past midnight.
+
+    :author: Barrett Wise
+    :date: 2/20/25
+    """
+
+    _current: ClassVar["Timetable | None"] = None
+    _upcoming: ClassVar["Timetable | None"] = None
+    _current_lock: ClassVar[threading.Lock] = threading.Lock()
+    _ingest_thread: ClassVar[threading.Thread | None] = None
+    _ingest_lock: ClassVar[threading.Lock] = threading.Lock()
+    _ingest_stop: ClassVar[threading.Event] = threading.Event()
+
+    def __init__(self, service_date: date, departures: list[Departure]) -> None:
+        """
+        :param service_date: The service date the stop times belong to.
+        :type service_date: date
+        :param departures: The stop times.
+        :type departures: list[Departure]
+        """
+        self.service_date = service_date
+        midnight = datetime.combine(service_date, time())
+        departures = [d for d in departures if d.departure is not None]
+
+        self.routes: list[str] = sorted({d.route_short_name for d in departures})
+        self.stops: list[str] = sorted({d.stop_code for d in departures})
+        self.trips: list[str] = sorted({d.trip_id for d in departures})
+        self.route_index = {name: i for i, name in enumerate(self.routes)}
+        self.stop_index = {code: i for i, code in enumerate(self.stops)}
+        self.trip_index = {trip: i for i, trip in enumerate(self.trips)}
+
+        route = np.array(
+            [self.route_index[d.route_short_name] for d in departures], dtype=np.int32
+        )
+        stop = np.array([self.stop_index[d.stop_code] for d in departures], dtype=np.int32)
+        trip = np.array([self.trip_index[d.trip_id] for d in departures], dtype=np.int32)
+        arrival = np.array(
+            [(d.arrival - midnight).total_seconds() for d in departures], dtype=np.int32
+        )
+        departure = np.array(
+            [(d.departure - midnight).total_seconds() for d in departures],
+            dtype=np.int32,
+        )
+
+        order = np.lexsort((departure, stop, route))
+        self.route = route[order]
+        self.stop = stop[order]
+        self.trip = trip[order]
+        self.arrival = arrival[order]
+        self.departure = departure[order]
+
+        # Each (route, stop) pair owns one contiguous, time-sorted slice of the arrays.
+        self._slices: dict[tuple[int, int], tuple[int, int]] = {}
+        self._stop_slices: dict[int, list[tuple[int, int]]] = {}
+        if len(order):
+            boundaries = np.flatnonzero(
+                (np.diff(self.route) != 0) | (np.diff(self.stop) != 0)
+            )
+            starts = np.concatenate(([0], boundaries + 1))
+            ends = np.concatenate((boundaries + 1, [len(order)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                key = (int(self.route[start]), int(self.stop[start]))
+                self._slices[key] = (start, end)
+                self._stop_slices.setdefault(key[1], []).append((start, end))
+
+    def __len__(self) -> int:
+        return len(self.departure)
+
+    @classmethod
+    def ingest(cls, service_date: date, num_of_trips: int = 1000) -> "Timetable":
+        """
+        Pull the full timetable of every current route for a service date from BT4U.
+
+        :param service_date: The service date.
+        :type service_date: date
+        :param num_of_trips: The number of trips to request per route.
+        :type num_of_trips: int
+        :return: The timetable.
+        :rtype: Timetable
+        """
+        departures: list[Departure] = []
+        service_date_text = service_date.strftime("%m/%d/%y")
+        routes = bt4u.get_current_route_records()
+        for route in routes:
+            for record in bt4u.get_departure_records(
+                route.short_name, num_of_trips, service_date_text
+            ):
+                record.route_short_name = record.route_short_name or route.short_name
+                departures.append(record)
+        timetable = Timetable(service_date, departures)
+        print(
+            f"Ingested {len(timetable)} stop times across {len(routes)} routes "
+            f"for {service_date}."
+        )
+        return timetable
+
+    @classmethod
+    def current(cls) -> "Timetable":
+        """
+        Get the timetable of the current service day. If the daily ingest has not already
+        loaded it, it is ingested inline. The first call starts the daily ingest, so the
+        timetable is only kept loaded in processes that use it.
+
+        :return: The current timetable.
+        :rtype: Timetable
+        """
+        current = cls._load_current()
+        cls.start_daily_ingest()
+        return current
+
+    @classmethod
+    def _load_current(cls) -> "Timetable":
+        today = service_date_for(datetime.now())
+        with cls._current_lock:
+            if cls._current is None or cls._current.service_date != today:
+                upcoming = cls._upcoming
+                if upcoming is not None and upcoming.service_date == today:
+                    cls._current = upcoming
+                else:
+                    cls._current = Timetable.ingest(today)
+            return cls._current
+
+    @classmethod
+    def start_daily_ingest(cls, lead: float = 3600.0, retry_interval: float = 600.0) -> None:
+        """
+        Keep the timetables loaded in a background thread: the current service day's right
+        away, and each next day's lead seconds before the day rolls over, so no caller has
+        to wait for an ingest. current starts it on first use. It runs until
+        stop_daily_ingest is called.
+
+        :param lead: How long before the rollover to ingest the next day in seconds.
+        :type lead: float
+        :param retry_interval: The time before retrying a failed ingest in seconds.
+        :type retry_interval: float
+        :return: None
+        """
+        with cls._ingest_lock:
+            if cls._ingest_thread is not None and cls._ingest_thread.is_alive():
+                return
+            cls._ingest_stop.clear()
+            stop = cls._ingest_stop
+
+            def run() -> None:
+                while not stop.is_set():
+                    try:
+                        service_date = cls._load_current().service_date + timedelta(days=1)
+                        rollover = datetime.combine(
+                            service_date, time(hour=bt4u._SERVICE_DAY_START_HOUR)
+                        )
+                        due = rollover - timedelta(seconds=lead)
+                        if stop.wait(max((due - datetime.now()).total_seconds(), 0)):
+                            return
+                        upcoming = Timetable.ingest(service_date)
+                        with cls._current_lock:
+                            cls._upcoming = upcoming
+                        stop.wait(max((rollover - datetime.now()).total_seconds(), 1))
+                    except Exception as e:
+                        print(f"Timetable ingest failed: {e}")
+                        stop.wait(retry_interval)
+
+            cls._ingest_thread = threading.Thread(target=run, daemon=True)
+            cls._ingest_thread.start()
+
+    @classmethod
+    def stop_daily_ingest(cls) -> None:
+        """
+        Stop the background ingest. It starts again on the next call to current or
+        start_daily_ingest.
+
+        :return: None
+        """
+        with cls._ingest_lock:
+            thread, cls._ingest_thread = cls._ingest_thread, None
+            cls._ingest_stop.set()
+        if thread is not None:
+            thread.join()
+
+    def seconds(self, moment: datetime | time | int) -> int:
+        """
+        Convert a moment to seconds since midnight of the service date.
+
+        :param moment: A datetime, a time of day on the service date, or seconds.
+        :type moment: datetime | time | int
+        :return: The seconds since midnight of the service date.
+        :rtype: int
+        """
+        if isinstance(moment, datetime):
+            return int(
+                (moment - datetime.combine(self.service_date, time())).total_seconds()
+            )
+        if isinstance(moment, time):
+            return moment.hour * 3600 + moment.minute * 60 + moment.second
+        return int(moment)
+
+    def next_departures(
+        self,
+        stop_code: str,
+        after: datetime | time | int,
+        route_short_name: str | None = None,
+        count: int = 1,
+    ) -> list[tuple[str, str, int]]:
+        """
+        Get the next departures from a stop at or after a given time.
+
+        :param stop_code: The code of the stop.
+        :type stop_code: str
+        :param after: The earliest departure time.
+        :type after: datetime | time | int
+        :param route_short_name: The route to limit the departures to, or None for every
+            route serving the stop.
+        :type route_short_name: str | None
+        :param count: The number of departures to return.
+        :type count: int
+        :return: The route, trip ID and departure time in seconds since midnight of each
+            departure, earliest first.
+        :rtype: list[tuple[str, str, int]]
+        """
+        stop = self.stop_index.get(stop_code)
+        if stop is None:
+            return []
+        if route_short_name is None:
+            slices = self._stop_slices.get(stop, [])
+        else:
+            route = self.route_index.get(route_short_name)
+            key = (route, stop)
+            slices = [self._slices[key]] if key in self._slices else []
+
+        after_seconds = self.seconds(after)
+        candidates = []
+        for start, end in slices:
+            first = start + int(
+                np.searchsorted(self.departure[start:end], after_seconds, side="left")
+            )
+            candidates.extend(range(first, min(first + count, end)))
+        candidates.sort(key=lambda i: self.departure[i])
+        return [
+            (
+                self.routes[self.route[i]],
+                self.trips[self.trip[i]],
+                int(self.departure[i]),
+            )
+            for i in candidates[:count]
+        ]
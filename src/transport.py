@@ -0,0 +1,364 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, ClassVar
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from metrics import Metrics
+
+PASSTHROUGH = "passthrough"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class SnapshotStore:
+    """
+    Recorded upstream responses, one JSON file per distinct request under a directory. Every
+    snapshot is loaded into memory on first use so replay never touches the disk.
+
+    Requests must match a recording exactly unless the store is lenient. A lenient store
+    answers a request with no exact match with a recorded response to the same endpoint,
+    chosen from a hash of the request so the same request always gets the same response.
+    Substitutions are counted in hokiebus_replay_fallbacks_total and logged once per endpoint.
+    That lets traffic with ever-changing parameters, like random coordinates, be replayed
+    from a small recording.
+
+    :author: Barrett Wise
+    :date: 3/10/25
+    """
+
+    def __init__(self, directory: str, strict: bool = True) -> None:
+        """
+        :param directory: The directory holding the snapshots.
+        :type directory: str
+        :param strict: Whether a request with no exact match fails instead of falling back to
+            another response from the same endpoint.
+        :type strict: bool
+        """
+        self.directory = Path(directory)
+        self.strict = strict
+        self._snapshots: dict[str, dict[str, Any]] | None = None
+        self._by_endpoint: dict[str, list[str]] = {}
+        self._fallback_logged: set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint: str, request: Any) -> str:
+        text = json.dumps([endpoint, request], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            if self._snapshots is None:
+                snapshots = {}
+                for path in sorted(self.directory.glob("*/*.json")):
+                    snapshot = json.loads(path.read_text())
+                    snapshots[path.stem] = snapshot
+                    self._by_endpoint.setdefault(snapshot["endpoint"], []).append(path.stem)
+                self._snapshots = snapshots
+                print(f"Loaded {len(snapshots)} snapshots from {self.directory}.")
+            return self._snapshots
+
+    def get(self, endpoint: str, request: Any) -> dict[str, Any] | None:
+        """
+        Find the recorded response to a request.
+
+        :param endpoint: The endpoint the request was made to.
+        :type endpoint: str
+        :param request: The parameters of the request. Anything JSON serializable.
+        :type request: Any
+        :return: The snapshot, or None if there is no match.
+        :rtype: dict[str, Any] | None
+        """
+        snapshots = self._load()
+        key = self.key(endpoint, request)
+        snapshot = snapshots.get(key)
+        if snapshot is None and not self.strict and self._by_endpoint.get(endpoint):
+            # Spread the fallbacks over every recording of the endpoint, deterministically.
+            keys = sorted(self._by_endpoint[endpoint])
+            snapshot = snapshots[keys[int(key, 16) % len(keys)]]
+            Metrics.shared().increment("hokiebus_replay_fallbacks_total", endpoint=endpoint)
+            if endpoint not in self._fallback_logged:
+                self._fallback_logged.add(endpoint)
+                print(f"Replaying other recordings of {endpoint} for unmatched requests.")
+        return snapshot
+
+    def put(self, endpoint: str, request: Any, response: dict[str, Any]) -> None:
+        """
+        Record the response to a request.
+
+        :param endpoint: The endpoint the request was made to.
+        :type endpoint: str
+        :param request: The parameters of the request. Anything JSON serializable.
+        :type request: Any
+        :param response: The response. Anything JSON serializable.
+        :type response: dict[str, Any]
+        :return: None
+        """
+        snapshots = self._load()
+        key = self.key(endpoint, request)
+        snapshot = {"endpoint": endpoint, "request": request, **response}
+        folder = self.directory / hashlib.sha256(endpoint.encode("utf-8")).hexdigest()[:8]
+        folder.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, indent=1, default=str)
+        os.replace(temp_path, folder / f"{key}.json")
+        with self._lock:
+            if key not in snapshots:
+                self._by_endpoint.setdefault(endpoint, []).append(key)
+            snapshots[key] = snapshot
+
+
+class SnapshotAdapter(HTTPAdapter):
+    """
+    A requests transport adapter that records responses to a SnapshotStore or replays them
+    from it, with an injected latency standing in for the network.
+    """
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        mode: str,
+        latency: float = 0.0,
+        ignore_fields: tuple[str, ...] = (),
+        **kwargs,
+    ) -> None:
+        """
+        :param store: The snapshots to record to or replay from.
+        :type store: SnapshotStore
+        :param mode: RECORD or REPLAY.
+        :type mode: str
+        :param latency: The delay added to each replayed response in seconds.
+        :type latency: float
+        :param ignore_fields: Query and form fields left out when matching requests, such as
+            the service date.
+        :type ignore_fields: tuple[str, ...]
+        """
+        super().__init__(**kwargs)
+        self.store = store
+        self.mode = mode
+        self.latency = latency
+        self.ignore_fields = ignore_fields
+
+    def _describe(self, request: requests.PreparedRequest) -> tuple[str, dict[str, Any]]:
+        url = urlsplit(request.url)
+        body = request.body or ""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", "replace")
+        fields = [
+            (name, value)
+            for name, value in parse_qsl(url.query) + parse_qsl(body)
+            if name not in self.ignore_fields
+        ]
+        endpoint = f"{request.method} {url.scheme}://{url.netloc}{url.path}"
+        return endpoint, {"fields": urlencode(sorted(fields))}
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        endpoint, described = self._describe(request)
+        if self.mode == RECORD:
+            response = super().send(request, **kwargs)
+            content = response.content
+            try:
+                body = {"body": content.decode("utf-8")}
+            except UnicodeDecodeError:
+                body = {"body_base64": base64.b64encode(content).decode("ascii")}
+            self.store.put(
+                endpoint,
+                described,
+                {
+                    "status": response.status_code,
+                    "headers": dict(response.headers),
+                    **body,
+                },
+            )
+            return response
+
+        snapshot = self.store.get(endpoint, described)
+        if snapshot is None:
+            raise requests.ConnectionError(
+                f"No snapshot for {endpoint} in {self.store.directory}.", request=request
+            )
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = snapshot["status"]
+        response.headers = CaseInsensitiveDict(snapshot["headers"])
+        response.headers.pop("Content-Encoding", None)
+        if "body_base64" in snapshot:
+            response._content = base64.b64decode(snapshot["body_base64"])
+        else:
+            response._content = snapshot["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.reason = "Replayed"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class SnapshotClient:
+    """
+    A stand-in for an API client object, such as GeocodioClient, that records the results of
+    its method calls to a SnapshotStore or replays them from it. In replay mode the real
+    client is never created.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        store: SnapshotStore,
+        mode: str,
+        latency: float = 0.0,
+        name: str = "client",
+    ) -> None:
+        """
+        :param factory: Creates the real client.
+        :type factory: Callable[[], Any]
+        :param store: The snapshots to record to or replay from.
+        :type store: SnapshotStore
+        :param mode: RECORD or REPLAY.
+        :type mode: str
+        :param latency: The delay added to each replayed call in seconds.
+        :type latency: float
+        :param name: The name the calls are recorded under.
+        :type name: str
+        """
+        self._factory = factory
+        self._client: Any = None
+        self._store = store
+        self._mode = mode
+        self._latency = latency
+        self._name = name
+
+    def __getattr__(self, method: str) -> Callable[..., Any]:
+        endpoint = f"{self._name}.{method}"
+
+        def call(*args, **kwargs) -> Any:
+            request = {"args": args, "kwargs": kwargs}
+            if self._mode == RECORD:
+                if self._client is None:
+                    self._client = self._factory()
+                result = getattr(self._client, method)(*args, **kwargs)
+                # Round-trip through JSON so recording and replay return the same types.
+                result = json.loads(json.dumps(result, default=str))
+                self._store.put(endpoint, request, {"result": result})
+                return result
+
+            snapshot = self._store.get(endpoint, request)
+            if snapshot is None:
+                raise ConnectionError(f"No snapshot for {endpoint} in {self._store.directory}.")
+            if self._latency:
+                time.sleep(self._latency)
+            return snapshot["result"]
+
+        return call
+
+
+class Transport:
+    """
+    Chooses how upstream services are reached: directly (passthrough), directly while saving
+    every response to disk (record), or from those saved responses without any network
+    access (replay). It is configured from the environment the first time it is used:
+
+    - HOKIEBUS_TRANSPORT: "passthrough" (default), "record" or "replay".
+    - HOKIEBUS_SNAPSHOT_DIR: where snapshots are kept. Defaults to ../data/snapshots.
+    - HOKIEBUS_REPLAY_LATENCY_MS: the delay added to each replayed response. Defaults to 0.
+    - HOKIEBUS_REPLAY_STRICT: set to 0 to answer requests with no exact recorded match from
+      another recording of the same endpoint. Defaults to 1, failing them.
+
+    :author: Barrett Wise
+    :date: 3/10/25
+    """
+
+    _IGNORED_FIELDS = ("serviceDate",)
+    _mode: ClassVar[str | None] = None
+    _store: ClassVar[SnapshotStore | None] = None
+    _latency: ClassVar[float] = 0.0
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _mode_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def configure(
+        cls,
+        mode: str | None = None,
+        snapshot_dir: str | None = None,
+        latency_ms: float | None = None,
+        strict: bool | None = None,
+    ) -> None:
+        """
+        Set the transport, falling back to the environment for anything not given. Sessions
+        and clients created earlier keep the transport they were created with.
+
+        :param mode: "passthrough", "record" or "replay".
+        :type mode: str | None
+        :param snapshot_dir: Where snapshots are kept.
+        :type snapshot_dir: str | None
+        :param latency_ms: The delay added to each replayed response in milliseconds.
+        :type latency_ms: float | None
+        :param strict: Whether replayed requests need an exact recorded match.
+        :type strict: bool | None
+        :return: None
+        """
+        mode = mode or os.getenv("HOKIEBUS_TRANSPORT", PASSTHROUGH)
+        if mode not in (PASSTHROUGH, RECORD, REPLAY):
+            raise ValueError(f"Unknown transport: {mode}")
+        if latency_ms is None:
+            latency_ms = float(os.getenv("HOKIEBUS_REPLAY_LATENCY_MS", "0"))
+        if strict is None:
+            strict = os.getenv("HOKIEBUS_REPLAY_STRICT", "1") != "0"
+        with cls._lock:
+            cls._mode = mode
+            cls._latency = latency_ms / 1000
+            cls._store = SnapshotStore(
+                snapshot_dir or os.getenv("HOKIEBUS_SNAPSHOT_DIR", "../data/snapshots"),
+                strict=strict,
+            )
+        if mode != PASSTHROUGH:
+            print(f"Upstream transport: {mode} ({cls._store.directory}).")
+
+    @classmethod
+    def mode(cls) -> str:
+        with cls._mode_lock:
+            if cls._mode is None:
+                cls.configure()
+            return cls._mode
+
+    @classmethod
+    def adapter(cls, **kwargs) -> HTTPAdapter:
+        """
+        Get a transport adapter for a requests session.
+
+        :return: A plain HTTPAdapter when passing through, otherwise a SnapshotAdapter. Both
+            take the HTTPAdapter arguments.
+        :rtype: HTTPAdapter
+        """
+        mode = cls.mode()
+        if mode == PASSTHROUGH:
+            return HTTPAdapter(**kwargs)
+        return SnapshotAdapter(cls._store, mode, cls._latency, cls._IGNORED_FIELDS, **kwargs)
+
+    @classmethod
+    def client(cls, factory: Callable[[], Any], name: str) -> Any:
+        """
+        Get an API client object that follows the transport.
+
+        :param factory: Creates the real client.
+        :type factory: Callable[[], Any]
+        :param name: The name its calls are recorded under.
+        :type name: str
+        :return: The real client when passing through, otherwise a SnapshotClient.
+        :rtype: Any
+        """
+        mode = cls.mode()
+        if mode == PASSTHROUGH:
+            return factory()
+        return SnapshotClient(factory, cls._store, mode, cls._latency, name)
@@ -0,0 +1,260 @@
+import json
+import threading
+from typing import Any, ClassVar
+
+import numpy as np
+
+from building_registry import BuildingRegistry
+from stop_index import StopIndex, haversine_matrix
+
+METERS_PER_MILE = 1609.344
+WALKING_SPEED = 1.34  # meters per second
+DETOUR_FACTOR = 1.3  # campus paths are longer than the straight line
+MAX_WALK_SECONDS = int(np.iinfo(np.uint16).max)  # walking times are stored as uint16
+
+
+def walking_seconds(miles: float | np.ndarray) -> float | np.ndarray:
+    """
+    Estimate how long it takes to walk a straight-line distance.
+
+    :param miles: The straight-line distance in miles.
+    :type miles: float | np.ndarray
+    :return: The walking time in seconds.
+    :rtype: float | np.ndarray
+    """
+    return miles * METERS_PER_MILE * DETOUR_FACTOR / WALKING_SPEED
+
+
+def _as_seconds(seconds: np.ndarray | list) -> np.ndarray:
+    """
+    Round walking times to whole seconds for storage, capping them at MAX_WALK_SECONDS
+    (about 18 hours) rather than letting them wrap around.
+    """
+    return np.minimum(np.round(np.asarray(seconds, dtype=float)), MAX_WALK_SECONDS).astype(
+        np.uint16
+    )
+
+
+class WalkingTable:
+    """
+    Precomputed walking times from every building to its candidate stops and between stops
+    close enough to transfer on foot. Times are estimated from the straight-line distance
+    with a detour factor, and both tables are stored in compressed sparse row form: the
+    neighbours of row i are entries offsets[i] to offsets[i + 1].
+
+    :author: Barrett Wise
+    :date: 2/25/25
+    """
+
+    _shared: ClassVar["WalkingTable | None"] = None
+    _shared_version: ClassVar[int] = 0
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        stops: list[str],
+        buildings: list[str],
+        building_offsets: np.ndarray,
+        building_stops: np.ndarray,
+        building_seconds: np.ndarray,
+        stop_offsets: np.ndarray,
+        stop_neighbors: np.ndarray,
+        stop_seconds: np.ndarray,
+    ) -> None:
+        """
+        :param stops: The stop codes, indexed by the stop arrays.
+        :type stops: list[str]
+        :param buildings: The building names, one per building row.
+        :type buildings: list[str]
+        :param building_offsets: The row offsets of the building table.
+        :type building_offsets: np.ndarray
+        :param building_stops: The stop index of each building table entry.
+        :type building_stops: np.ndarray
+        :param building_seconds: The walking time of each building table entry.
+        :type building_seconds: np.ndarray
+        :param stop_offsets: The row offsets of the stop table, one row per stop.
+        :type stop_offsets: np.ndarray
+        :param stop_neighbors: The stop index of each stop table entry.
+        :type stop_neighbors: np.ndarray
+        :param stop_seconds: The walking time of each stop table entry.
+        :type stop_seconds: np.ndarray
+        """
+        self.stops = stops
+        self.buildings = buildings
+        self.building_offsets = building_offsets
+        self.building_stops = building_stops
+        self.building_seconds = building_seconds
+        self.stop_offsets = stop_offsets
+        self.stop_neighbors = stop_neighbors
+        self.stop_seconds = stop_seconds
+        self.building_index = {name: i for i, name in enumerate(buildings)}
+        self.stop_index = {code: i for i, code in enumerate(stops)}
+
+    @classmethod
+    def build(
+        cls,
+        buildings: dict[str, dict[str, Any]],
+        stops: list[dict[str, Any]],
+        max_stops: int = 5,
+        building_radius: float = 0.5,
+        transfer_radius: float = 0.2,
+    ) -> "WalkingTable":
+        """
+        Compute the walking tables in one vectorized pass.
+
+        :param buildings: The building address table, as stored in addresses.json.
+        :type buildings: dict[str, dict[str, Any]]
+        :param stops: The stops. Each needs StopCode, Latitude and Longitude.
+        :type stops: list[dict[str, Any]]
+        :param max_stops: The maximum number of candidate stops kept per building.
+        :type max_stops: int
+        :param building_radius: The farthest a candidate stop may be from a building in miles.
+            The nearest stop is always kept.
+        :type building_radius: float
+        :param transfer_radius: The farthest apart two stops may be to transfer on foot in
+            miles.
+        :type transfer_radius: float
+        :return: The walking table.
+        :rtype: WalkingTable
+        """
+        names = [
+            name
+            for name, address in buildings.items()
+            if address.get("latitude") is not None and address.get("longitude") is not None
+        ]
+        stop_lats = np.array([stop["Latitude"] for stop in stops], dtype=float)
+        stop_lons = np.array([stop["Longitude"] for stop in stops], dtype=float)
+
+        def to_csr(
+            distances: np.ndarray, radius: float, limit: int, keep_nearest: bool
+        ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+            offsets, columns, seconds = [0], [], []
+            for row in distances:
+                order = np.argsort(row)
+                within = order[row[order] <= radius][:limit]
+                if keep_nearest and not len(within) and len(order):
+                    within = order[:1]
+                columns.append(within)
+                seconds.append(walking_seconds(row[within]))
+                offsets.append(offsets[-1] + len(within))
+            return (
+                np.array(offsets, dtype=np.int32),
+                np.concatenate(columns).astype(np.int32) if columns else np.zeros(0, np.int32),
+                _as_seconds(np.concatenate(seconds)) if seconds else np.zeros(0, np.uint16),
+            )
+
+        building_distances = haversine_matrix(
+            np.array([buildings[name]["latitude"] for name in names], dtype=float),
+            np.array([buildings[name]["longitude"] for name in names], dtype=float),
+            stop_lats,
+            stop_lons,
+        )
+        stop_distances = haversine_matrix(stop_lats, stop_lons, stop_lats, stop_lons)
+        np.fill_diagonal(stop_distances, np.inf)
+        return cls(
+            [str(stop["StopCode"]) for stop in stops],
+            names,
+            *to_csr(building_distances, building_radius, max_stops, True),
+            *to_csr(stop_distances, transfer_radius, len(stops), False),
+        )
+
+    def to_dict(self) -> dict[str, list]:
+        return {
+            "stops": self.stops,
+            "buildings": self.buildings,
+            "building_offsets": self.building_offsets.tolist(),
+            "building_stops": self.building_stops.tolist(),
+            "building_seconds": self.building_seconds.tolist(),
+            "stop_offsets": self.stop_offsets.tolist(),
+            "stop_neighbors": self.stop_neighbors.tolist(),
+            "stop_seconds": self.stop_seconds.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, list]) -> "WalkingTable":
+        return cls(
+            data["stops"],
+            data["buildings"],
+            np.array(data["building_offsets"], dtype=np.int32),
+            np.array(data["building_stops"], dtype=np.int32),
+            _as_seconds(data["building_seconds"]),
+            np.array(data["stop_offsets"], dtype=np.int32),
+            np.array(data["stop_neighbors"], dtype=np.int32),
+            _as_seconds(data["stop_seconds"]),
+        )
+
+    @staticmethod
+    def get_walking_table(update: bool = False) -> dict[str, list]:
+        """
+        Gets the walking table of the campus buildings and the current stops.
+
+        :param update: Whether to recompute the table instead of reading the cached copy.
+        :type update: bool
+        :return: The walking table in the format of to_dict.
+        :rtype: dict[str, list]
+        """
+
+        if not update:
+            return json.loads(open("../data/walking.json").read())
+
+        buildings = json.loads(open("../data/addresses.json").read())
+        return WalkingTable.build(buildings, StopIndex.shared().current_stops()).to_dict()
+
+    @classmethod
+    def shared(cls) -> "WalkingTable":
+        """
+        Get the walking table cached in data/walking.json, reloading it when the file changes.
+
+        :return: The shared walking table.
+        :rtype: WalkingTable
+        """
+        registry = BuildingRegistry.shared(
+            "../data/walking.json",
+            update_function=WalkingTable.get_walking_table,
+            depends_on=["../data/addresses.json"],
+        )
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared_version != registry.version:
+                cls._shared = WalkingTable.from_dict(registry.table)
+                cls._shared_version = registry.version
+            return cls._shared
+
+    def stops_near_building(self, building: str) -> list[tuple[str, int]]:
+        """
+        Get the candidate stops of a building.
+
+        :param building: The name of the building.
+        :type building: str
+        :return: The code of and walking time in seconds to each candidate stop, nearest first.
+        :rtype: list[tuple[str, int]]
+        """
+        i = self.building_index.get(building)
+        if i is None:
+            return []
+        start, end = self.building_offsets[i], self.building_offsets[i + 1]
+        return [
+            (self.stops[stop], int(seconds))
+            for stop, seconds in zip(
+                self.building_stops[start:end], self.building_seconds[start:end]
+            )
+        ]
+
+    def footpaths(self, stop_code: str) -> list[tuple[str, int]]:
+        """
+        Get the stops within walking distance of a stop.
+
+        :param stop_code: The code of the stop.
+        :type stop_code: str
+        :return: The code of and walking time in seconds to each nearby stop, nearest first.
+        :rtype: list[tuple[str, int]]
+        """
+        i = self.stop_index.get(stop_code)
+        if i is None:
+            return []
+        start, end = self.stop_offsets[i], self.stop_offsets[i + 1]
+        return [
+            (self.stops[stop], int(seconds))
+            for stop, seconds in zip(
+                self.stop_neighbors[start:end], self.stop_seconds[start:end]
+            )
+        ]
@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+
+from bt4u_interface import BT4U_Interface as bt4u
+from bt4u_records import BusPosition
+from bus_tracker import BusTracker
+from cache_handler import TieredCache
+
+BUS_INFO = b"""<DocumentElement><LatestInfoTable><AgencyVehicleName>101</AgencyVehicleName>
+<RouteShortName>HWD</RouteShortName><Latitude>37.2</Latitude><Longitude>-80.42</Longitude>
+</LatestInfoTable></DocumentElement>"""
+
+
+class CountingSession:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def post(self, url: str, data=None, timeout=None) -> "CountingSession":
+        self.calls += 1
+        return self
+
+    def raise_for_status(self) -> None:
+        pass
+
+    @property
+    def content(self) -> bytes:
+        return BUS_INFO
+
+
+def bus(vehicle: str, latitude: float, route: str = "HWD") -> BusPosition:
+    return BusPosition(vehicle, route, latitude, -80.42, 90.0, 12.5, datetime(2025, 3, 14, 9))
+
+
+def test_first_read_is_a_reset_snapshot():
+    tracker = BusTracker(capacity=16)
+    tracker.update([bus("101", 37.2), bus("102", 37.21)])
+    delta = tracker.changes_since(0)
+    assert delta.reset
+    assert sorted(p.vehicle for p in delta.positions) == ["101", "102"]
+    assert delta.removed == []
+
+
+def test_delta_holds_only_the_latest_state_of_changed_vehicles():
+    tracker = BusTracker(capacity=16)
+    tracker.update([bus("101", 37.2), bus("102", 37.21)])
+    cursor = tracker.changes_since(0).cursor
+
+    tracker.update([bus("101", 37.201), bus("102", 37.21)])
+    tracker.update([bus("101", 37.202), bus("102", 37.21)])
+    delta = tracker.changes_since(cursor)
+    assert not delta.reset
+    assert delta.positions == [bus("101", 37.202)]
+    assert delta.removed == []
+
+    assert tracker.changes_since(delta.cursor).positions == []
+
+
+def test_vehicles_leaving_the_feed_are_removed():
+    tracker = BusTracker(capacity=16)
+    tracker.update([bus("101", 37.2), bus("102", 37.21)])
+    cursor = tracker.changes_since(0).cursor
+    tracker.update([bus("102", 37.21)])
+    delta = tracker.changes_since(cursor)
+    assert delta.positions == []
+    assert delta.removed == ["101"]
+
+
+def test_cursor_older_than_the_ring_gets_a_reset():
+    tracker = BusTracker(capacity=4)
+    tracker.update([bus("101", 37.2)])
+    cursor = tracker.changes_since(0).cursor
+    for latitude in (37.201, 37.202, 37.203, 37.204, 37.205):
+        tracker.update([bus("101", latitude)])
+    delta = tracker.changes_since(cursor)
+    assert delta.reset
+    assert delta.positions == [bus("101", 37.205)]
+
+
+def test_cursor_from_another_tracker_gets_a_reset():
+    other = BusTracker(capacity=16)
+    for i in range(10):
+        other.update([bus("101", 37.2 + i / 1000)])
+    tracker = BusTracker(capacity=16)
+    tracker.update([bus("201", 37.22)])
+    tracker.update([bus("201", 37.23)])
+
+    for cursor in (other.changes_since(0).cursor, tracker.changes_since(0).cursor + 100):
+        delta = tracker.changes_since(cursor)
+        assert delta.reset
+        assert delta.positions == [bus("201", 37.23)]
+
+
+def test_positions_come_back_exactly():
+    tracker = BusTracker(capacity=16)
+    tracker.update([bus("101", 37.2)])
+    cursor = tracker.changes_since(0).cursor
+    tracker.update([bus("101", 37.2, route="TOM")])
+    (position,) = tracker.changes_since(cursor).positions
+    assert position == bus("101", 37.2, route="TOM")
+    assert position.latitude == 37.2
+    assert position.longitude == -80.42
+
+
+def test_every_poll_reaches_upstream(tmp_path):
+    session = CountingSession()
+    cache = TieredCache(str(tmp_path / "cache.sqlite"))
+    bt4u.configure_cache(enabled=True, cache=cache)
+    bt4u.configure_transport(session=session)
+    try:
+        tracker = BusTracker(interval=0.05, capacity=16)
+        tracker.poll()
+        time.sleep(tracker.interval)
+        tracker.poll()
+        assert session.calls == 2
+        assert [p.vehicle for p in tracker.latest()] == ["101"]
+    finally:
+        bt4u.configure_transport(session=None)
+        bt4u.configure_cache()
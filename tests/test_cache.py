@@ -0,0 +1,145 @@
+import json
+import sqlite3
+
+import pytest
+
+import cache_handler
+from cache_handler import TieredCache
+from geocode_cache import GeocodeCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_handler.time, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs) -> TieredCache:
+    return TieredCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    make_cache(tmp_path).set("ns", "a", {"x": 1})
+    cache = make_cache(tmp_path)
+    assert cache.get("ns", "a") == {"x": 1}
+    assert cache.get("ns", "a") == {"x": 1}
+    assert cache.stats()["ns"] == {"disk_hits": 1, "memory_hits": 1}
+    assert cache.get("ns", "b", "missing") == "missing"
+    assert cache.stats()["ns"]["misses"] == 1
+
+
+def test_entries_expire_from_both_tiers(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.set("ns", "a", 1, ttl=60)
+    clock.now += 59
+    assert cache.get("ns", "a") == 1
+    clock.now += 2
+    assert cache.get("ns", "a") is None
+    assert cache.stats()["ns"]["expirations"] == 1
+    # The disk copy went with it.
+    assert make_cache(tmp_path).get("ns", "a") is None
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, memory_size=2)
+    cache.set("ns", "a", 1, persist=False)
+    cache.set("ns", "b", 2, persist=False)
+    cache.get("ns", "a")
+    cache.set("ns", "c", 3, persist=False)
+    assert cache.get("ns", "b") is None
+    assert cache.get("ns", "a") == 1
+    assert cache.stats()["ns"]["memory_evictions"] == 1
+
+
+def test_memory_hits_keep_entries_on_disk(tmp_path, clock):
+    cache = make_cache(tmp_path, disk_size=10)
+    for i in range(10):
+        clock.now += 1
+        cache.set("ns", str(i), i)
+    # Key 0 is the oldest write but is read from memory just before the disk fills up.
+    clock.now += 1
+    assert cache.get("ns", "0") == 0
+    clock.now += 1
+    cache.set("ns", "10", 10)
+
+    disk = make_cache(tmp_path, memory_size=0)
+    assert disk.get("ns", "0") == 0
+    assert disk.get("ns", "1") is None
+    assert cache.stats()["ns"]["disk_evictions"] == 2
+
+
+def test_access_times_are_written_in_batches(tmp_path, clock):
+    cache = make_cache(tmp_path, flush_interval=3600)
+    cache.set("ns", "a", 1)
+    clock.now += 5
+    cache.get("ns", "a")
+    db = sqlite3.connect(tmp_path / "cache.sqlite")
+    query = "SELECT accessed FROM entries WHERE key = 'a'"
+    assert db.execute(query).fetchone()[0] == clock.now - 5
+    cache.flush()
+    assert db.execute(query).fetchone()[0] == clock.now
+
+
+def test_pinned_namespaces_are_not_evicted(tmp_path, clock):
+    cache = make_cache(tmp_path, disk_size=5)
+    cache.pin("keep")
+    for i in range(20):
+        clock.now += 1
+        cache.set("keep", str(i), i)
+    for i in range(6):
+        clock.now += 1
+        cache.set("other", str(i), i)
+
+    disk = make_cache(tmp_path, memory_size=0)
+    assert all(disk.get("keep", str(i)) == i for i in range(20))
+    assert disk.get("other", "0") is None
+    assert disk.get("other", "5") == 5
+
+
+def test_geocodes_migrate_from_the_old_store(tmp_path):
+    legacy = tmp_path / "geocode_cache.sqlite"
+    db = sqlite3.connect(legacy)
+    db.execute("CREATE TABLE geocodes (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute(
+        "INSERT INTO geocodes VALUES (?, ?)",
+        ("forward:1 main st", json.dumps({"lat": 37.2, "lng": -80.4})),
+    )
+    db.commit()
+    db.close()
+
+    geocodes = GeocodeCache(make_cache(tmp_path, disk_size=1))
+    assert geocodes.migrate(str(legacy)) == 1
+    assert not legacy.exists()
+    assert geocodes.migrate(str(legacy)) == 0
+    assert geocodes.get("forward:1 main st") == {"lat": 37.2, "lng": -80.4}
+
+
+def test_reverse_geocodes_are_not_pinned(tmp_path, clock):
+    geocodes = GeocodeCache(make_cache(tmp_path, disk_size=3))
+    geocodes.put(geocodes.forward_key("1 Main St"), [37.2, -80.4])
+    for i in range(5):
+        clock.now += 1
+        geocodes.put(geocodes.reverse_key(37.2 + i / 1000, -80.4), f"{i} Main St")
+
+    disk = GeocodeCache(make_cache(tmp_path, memory_size=0))
+    assert disk.get(disk.forward_key("1 main st")) == [37.2, -80.4]
+    assert disk.get(disk.reverse_key(37.2, -80.4)) is None
+    assert disk.get(disk.reverse_key(37.204, -80.4)) == "4 Main St"
+
+    clock.now += geocodes.reverse_ttl
+    assert disk.get(disk.reverse_key(37.204, -80.4)) is None
+    assert disk.get(disk.forward_key("1 main st")) == [37.2, -80.4]
+
+
+def test_bytes_are_stored_as_they_are(tmp_path):
+    make_cache(tmp_path).set("ns", "xml", b"<DocumentElement/>")
+    assert make_cache(tmp_path).get("ns", "xml") == b"<DocumentElement/>"
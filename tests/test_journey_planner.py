@@ -0,0 +1,136 @@
+from datetime import date, datetime, time, timedelta
+
+from bt4u_records import Departure
+from journey_planner import JourneyPlanner
+from timetable import Timetable, service_date_for
+
+SERVICE_DATE = date(2025, 3, 14)
+
+
+def trip(route: str, trip_id: str, *stops: tuple[str, str]) -> list[Departure]:
+    """
+    Make the stop times of a trip from (stop code, "HH:MM") pairs. Hours past 23 run into
+    the next day.
+    """
+    departures = []
+    for code, clock in stops:
+        hours, minutes = map(int, clock.split(":"))
+        moment = datetime.combine(SERVICE_DATE, time()) + timedelta(
+            hours=hours, minutes=minutes
+        )
+        departures.append(Departure(route, trip_id, code, moment, moment))
+    return departures
+
+
+class Footpaths:
+    def __init__(self, paths: dict[str, list[tuple[str, int]]]) -> None:
+        self.paths = paths
+
+    def footpaths(self, stop_code: str) -> list[tuple[str, int]]:
+        return self.paths.get(stop_code, [])
+
+
+def at(clock: str) -> int:
+    hours, minutes = map(int, clock.split(":"))
+    return hours * 3600 + minutes * 60
+
+
+def test_direct_trip_leaves_as_late_as_possible():
+    timetable = Timetable(
+        SERVICE_DATE,
+        trip("HWD", "1", ("A", "08:00"), ("B", "08:10"))
+        + trip("HWD", "2", ("A", "08:30"), ("B", "08:40"))
+        + trip("HWD", "3", ("A", "09:00"), ("B", "09:10")),
+    )
+    itinerary = JourneyPlanner(timetable).latest_departure("A", "B", at("08:45"))
+    assert [(leg.trip_id, leg.departure, leg.arrival) for leg in itinerary.legs] == [
+        ("2", at("08:30"), at("08:40"))
+    ]
+    assert itinerary.to_dict()["departure"] == datetime(2025, 3, 14, 8, 30)
+
+
+def test_transfers_allow_the_minimum_transfer_time():
+    timetable = Timetable(
+        SERVICE_DATE,
+        trip("HWD", "h1", ("A", "08:00"), ("B", "08:10"))
+        + trip("HWD", "h2", ("A", "08:15"), ("B", "08:25"))
+        + trip("TOM", "t1", ("B", "08:26"), ("C", "08:40"))
+        + trip("TOM", "t2", ("B", "08:20"), ("C", "08:35")),
+    )
+    itinerary = JourneyPlanner(timetable, min_transfer=60).latest_departure(
+        "A", "C", at("08:45")
+    )
+    # Arriving at B at 8:25 leaves one minute to spare before t1 at 8:26...
+    assert [leg.trip_id for leg in itinerary.legs] == ["h2", "t1"]
+    assert itinerary.departure == at("08:15")
+    assert itinerary.arrival == at("08:40")
+
+    # ...which is not enough with a two minute transfer, so h2 no longer makes it.
+    itinerary = JourneyPlanner(timetable, min_transfer=120).latest_departure(
+        "A", "C", at("08:45")
+    )
+    assert [leg.trip_id for leg in itinerary.legs] == ["h1", "t1"]
+    assert itinerary.departure == at("08:00")
+
+
+def test_transfers_can_walk_between_stops():
+    timetable = Timetable(
+        SERVICE_DATE,
+        trip("HWD", "h1", ("A", "08:00"), ("B", "08:10"))
+        + trip("TOM", "t1", ("D", "08:15"), ("C", "08:30")),
+    )
+    planner = JourneyPlanner(timetable, walking=Footpaths({"D": [("B", 180)]}))
+    itinerary = planner.latest_departure("A", "C", at("08:45"))
+    assert [(leg.mode, leg.from_stop, leg.to_stop) for leg in itinerary.legs] == [
+        ("bus", "A", "B"),
+        ("walk", "B", "D"),
+        ("bus", "D", "C"),
+    ]
+    assert JourneyPlanner(timetable).latest_departure("A", "C", at("08:45")) is None
+
+
+def test_no_path():
+    timetable = Timetable(
+        SERVICE_DATE,
+        trip("HWD", "1", ("A", "08:00"), ("B", "08:10"))
+        + trip("TOM", "2", ("C", "08:00"), ("D", "08:10")),
+    )
+    planner = JourneyPlanner(timetable)
+    assert planner.latest_departure("A", "D", at("09:00")) is None
+    # Buses only run one way.
+    assert planner.latest_departure("B", "A", at("09:00")) is None
+    # Too early for any bus.
+    assert planner.latest_departure("A", "B", at("08:05")) is None
+    # Further back than max_window.
+    assert JourneyPlanner(timetable, max_window=1800).latest_departure(
+        "A", "B", at("09:00")
+    ) is None
+    assert planner.latest_departure("A", "unknown", at("09:00")) is None
+
+
+def test_already_at_the_destination():
+    timetable = Timetable(SERVICE_DATE, trip("HWD", "1", ("A", "08:00"), ("B", "08:10")))
+    itinerary = JourneyPlanner(timetable).latest_departure("B", "B", at("09:00"))
+    assert itinerary.legs == []
+    assert itinerary.departure == itinerary.arrival == at("09:00")
+    assert itinerary.to_dict() == {
+        "departure": datetime(2025, 3, 14, 9, 0),
+        "arrival": datetime(2025, 3, 14, 9, 0),
+        "legs": [],
+    }
+
+
+def test_trips_past_midnight_belong_to_their_service_date():
+    timetable = Timetable(
+        SERVICE_DATE, trip("HWD", "late", ("A", "23:50"), ("B", "24:20"))
+    )
+    deadline = datetime(2025, 3, 15, 0, 30)
+    assert timetable.seconds(deadline) == at("24:30")
+    itinerary = JourneyPlanner(timetable).latest_departure("A", "B", deadline)
+    assert itinerary.arrival == at("24:20")
+    assert itinerary.to_dict()["arrival"] == datetime(2025, 3, 15, 0, 20)
+
+
+def test_service_days_roll_over_after_midnight():
+    assert service_date_for(datetime(2025, 3, 15, 2, 59)) == date(2025, 3, 14)
+    assert service_date_for(datetime(2025, 3, 15, 3, 0)) == date(2025, 3, 15)
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from schedule import Address, Schedule
+
+TZID_CALENDAR = b"""BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//test//EN
+BEGIN:VEVENT
+UID:tzid-utc-until
+DTSTAMP:20240801T000000Z
+DTSTART;TZID=America/New_York:20240827T140000
+DTEND;TZID=America/New_York:20240827T151500
+RRULE:FREQ=WEEKLY;UNTIL=20241206T190000Z;BYDAY=TU,TH
+EXDATE:20241126T190000Z
+SUMMARY:Data Structures and Algorithms CS 3114 0
+LOCATION:Campus: Blacksburg Building: Torgersen Hall Room: 1060
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def make_schedule(calendar: bytes) -> Schedule:
+    start = Address("1 Main St", "Blacksburg", "VA", "24060", "US", 37.2, -80.4)
+    return Schedule(start, calendar)
+
+
+def test_tzid_calendar_with_utc_until_expands():
+    schedule = make_schedule(TZID_CALENDAR)
+    tuesday, thursday = schedule.courses
+    assert (tuesday.weekday, thursday.weekday) == (1, 3)
+    assert tuesday.start == datetime(2024, 8, 27, 14, 0)
+    assert thursday.start == datetime(2024, 8, 29, 14, 0)
+
+    tuesdays = list(tuesday.occurrences())
+    thursdays = list(thursday.occurrences())
+    assert all(d.tzinfo is None and d.hour == 14 for d in tuesdays + thursdays)
+    # The UTC UNTIL is 2 PM Eastern on Friday 12/6, so Thursday 12/5 is the last meeting.
+    assert thursdays[-1] == datetime(2024, 12, 5, 14, 0)
+    assert tuesdays[-1] == datetime(2024, 12, 3, 14, 0)
+    # The UTC EXDATE is 2 PM Eastern on Tuesday 11/26.
+    assert datetime(2024, 11, 26, 14, 0) not in tuesdays
+    assert datetime(2024, 11, 19, 14, 0) in tuesdays
+
+
+def test_floating_until_still_expands():
+    calendar = TZID_CALENDAR.replace(b"UNTIL=20241206T190000Z", b"UNTIL=20241206T235900")
+    thursday = make_schedule(calendar).courses[1]
+    assert list(thursday.occurrences())[-1] == datetime(2024, 12, 5, 14, 0)
@@ -0,0 +1,17 @@
+from walking import MAX_WALK_SECONDS, WalkingTable
+
+
+def test_walks_too_long_for_uint16_are_capped():
+    buildings = {
+        "Near": {"latitude": 37.2290, "longitude": -80.4230},
+        # Far enough from every stop that the walk is over 65535 seconds.
+        "Far": {"latitude": 38.5, "longitude": -80.4230},
+    }
+    stops = [{"StopCode": "1101", "Latitude": 37.2295, "Longitude": -80.4230}]
+    table = WalkingTable.build(buildings, stops)
+    assert table.stops_near_building("Far") == [("1101", MAX_WALK_SECONDS)]
+    assert 0 < table.stops_near_building("Near")[0][1] < 100
+
+    data = table.to_dict()
+    data["building_seconds"] = [30, 70_000]
+    assert WalkingTable.from_dict(data).stops_near_building("Far")[0][1] == MAX_WALK_SECONDS